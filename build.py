@@ -1,6 +1,9 @@
 
-from pybuilder.core import use_plugin, init, Author
+from pybuilder.core import use_plugin, init, task, depends, Author
+from pybuilder.errors import BuildFailedException
 
+import os
+import subprocess
 import sys
 print sys.path
 
@@ -34,6 +37,7 @@ def set_properties(project):
     project.depends_on('mock')
     project.depends_on('requests')
     project.build_depends_on('unittest2')
+    project.build_depends_on('hypothesis')
     project.set_property('install_dependencies_upgrade', True)
     project.set_property('distutils_classifiers', [
         "Development Status :: 4 - Beta",
@@ -43,10 +47,23 @@ def set_properties(project):
     project.set_property('copy_resources_target', '$dir_dist')
     project.get_property('copy_resources_glob').extend(
             ['setup.cfg', 'LICENSE.TXT', 'README.md', 'MANIFEST.in'])
+    # generous, a cold import takes about 20 ms, but build agents are busy
+    project.set_property('startup_budget_ms', 300)
 
 
 @init(environments='teamcity')
 def set_properties_for_teamcity_builds(project):
     import os
     project.version = '%s-%s' % (project.version, os.environ.get('BUILD_NUMBER', 0))
-    project.default_task = ['install_dependencies', 'publish']
+    project.default_task = ['install_dependencies', 'publish', 'startup_benchmark']
+
+
+@task(description="Fails if a cold import of monitoring-config-generator takes longer than startup_budget_ms")
+@depends('prepare')
+def startup_benchmark(project, logger):
+    benchmark = project.expand_path('src/benchmark/python/startup_benchmark.py')
+    environment = dict(os.environ, PYTHONPATH=project.expand_path('$dir_source_main_python'))
+    budget = str(project.get_property('startup_budget_ms'))
+    logger.info("Running %s with a budget of %s ms" % (benchmark, budget))
+    if subprocess.call([sys.executable, benchmark, '--budget=%s' % budget], env=environment):
+        raise BuildFailedException("Startup takes longer than %s ms" % budget)
@@ -0,0 +1,213 @@
+"""Time every stage of the generator on a synthetic fleet and store the results as JSON.
+
+Every host is a directory of yaml fragments like yaml-server would merge them. The stages are
+timed one after the other for every host and summed up per round:
+
+  read_config              read_config of the host directory, includes merging the fragments
+  merge_yaml_files         merging the fragments alone
+  yaml_config              YamlConfig: defaults, variables and all checks
+  yaml_config_skip_checks  YamlConfig without the checks, the difference is the cost of the checks
+  render                   YamlToIcinga, all sections rendered
+  write                    OutputWriter.write_config into a temporary directory
+
+The fragment cache is cleared before parsing, so every round parses all files. With --compare
+the change of every stage against an earlier result file is printed.
+
+Usage:
+  pipeline_benchmark.py [--hosts=<count>] [--services=<count>] [--variable-depth=<depth>]
+                        [--defaults=<count>] [--fragments=<count>] [--rounds=<count>]
+                        [--output=<file>] [--compare=<file>]
+
+Options:
+  --hosts=<count>           Number of synthetic hosts [default: 20]
+  --services=<count>        Services per host [default: 200]
+  --variable-depth=<depth>  Length of the chain of variables referring to each other [default: 5]
+  --defaults=<count>        Number of additional keys in the defaults section [default: 10]
+  --fragments=<count>       Number of yaml files each host is split into [default: 4]
+  --rounds=<count>          Number of times all hosts are run through the stages [default: 5]
+  --output=<file>           Write the results to file instead of stdout
+  --compare=<file>          Print the change against the results in file
+"""
+from datetime import datetime
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import yaml
+from docopt import docopt
+
+os.environ.setdefault('MONITORING_CONFIG_GENERATOR_CONFIG', 'testdata/testconfig.yaml')
+from monitoring_config_generator.MonitoringConfigGenerator import YamlToIcinga, OutputWriter
+from monitoring_config_generator.yaml_tools.config import YamlConfig
+from monitoring_config_generator.yaml_tools.merger import merge_yaml_files, FRAGMENT_CACHE
+from monitoring_config_generator.yaml_tools.readers import read_config
+
+
+STAGES = ['read_config', 'merge_yaml_files', 'yaml_config', 'yaml_config_skip_checks', 'render', 'write']
+
+
+def synthetic_host(number, services, variable_depth, defaults):
+    """The monitoring yaml of a host as dict. Every service refers to the start of the variable chain"""
+    variables = {'HOST_NAME': 'host%04d.some.domain' % number, 'CHECK_INTERVAL': 5}
+    for depth in range(variable_depth - 1):
+        variables['LEVEL_%d' % depth] = '${LEVEL_%d}.l%d' % (depth + 1, depth)
+    if variable_depth:
+        variables['LEVEL_%d' % (variable_depth - 1)] = 'leaf'
+    chain = '${LEVEL_0}' if variable_depth else 'no-variables'
+
+    default_section = {'host_name': '${HOST_NAME}',
+                       'check_period': '24x7',
+                       'max_check_attempts': 3,
+                       'notification_interval': 120,
+                       'notification_period': '24x7',
+                       'contact_groups': ['admins', 'ops'],
+                       'check_interval': '${CHECK_INTERVAL}'}
+    for key in range(defaults):
+        default_section['_custom_%d' % key] = 'value %d of ${HOST_NAME}' % key
+
+    service_section = {}
+    for service in range(services):
+        service_section['service_%d' % service] = {
+            'service_description': 'service %d' % service,
+            'check_command': 'check_http!/status/%d!8080!%s' % (service, chain),
+            'servicegroups': ['web', 'group_%d' % (service % 10)],
+            'notes': 'service %d of ${HOST_NAME} in %s' % (service, chain)}
+    return {'defaults': default_section,
+            'variables': variables,
+            'host': {'address': '10.0.%d.%d' % (number / 256, number % 256), 'alias': 'host%04d' % number},
+            'services': service_section}
+
+
+def write_fragments(directory, host, fragments):
+    """Split host into fragments files: the first has everything but the services, all share the services"""
+    os.mkdir(directory)
+    service_ids = sorted(host['services'])
+    fragments = max(fragments, 1)
+    for fragment in range(fragments):
+        if fragment == 0:
+            content = dict((key, value) for key, value in host.iteritems() if key != 'services')
+        else:
+            content = {}
+        ids = service_ids[fragment::fragments]
+        if ids:
+            content['services'] = dict((service_id, host['services'][service_id]) for service_id in ids)
+        with open(os.path.join(directory, '%02d.yaml' % fragment), 'w') as fragment_file:
+            yaml.safe_dump(content, fragment_file, default_flow_style=False)
+
+
+def create_fleet(directory, arguments):
+    os.mkdir(directory)
+    hosts = []
+    for number in range(int(arguments['--hosts'])):
+        host = synthetic_host(number, int(arguments['--services']), int(arguments['--variable-depth']),
+                              int(arguments['--defaults']))
+        host_directory = os.path.join(directory, 'host%04d' % number)
+        write_fragments(host_directory, host, int(arguments['--fragments']))
+        hosts.append(host_directory)
+    return hosts
+
+
+class RenderedConfig(object):
+    """Sections rendered before, so writing them can be timed without rendering"""
+
+    def __init__(self, sections, header):
+        self.rendered = sections
+        self.header = header
+
+    def sections(self):
+        return iter(self.rendered)
+
+
+def timed(timings, stage, function, *args, **kwargs):
+    start = time.time()
+    result = function(*args, **kwargs)
+    timings[stage] += time.time() - start
+    return result
+
+
+def run_round(hosts, output_directory):
+    """seconds per stage for all hosts"""
+    timings = dict((stage, 0.0) for stage in STAGES)
+    for host_directory in hosts:
+        FRAGMENT_CACHE.clear()
+        raw_config, header = timed(timings, 'read_config', read_config, host_directory)
+        FRAGMENT_CACHE.clear()
+        timed(timings, 'merge_yaml_files', merge_yaml_files, host_directory)
+        timed(timings, 'yaml_config_skip_checks', YamlConfig, raw_config, skip_checks=True)
+        yaml_config = timed(timings, 'yaml_config', YamlConfig, raw_config)
+        yaml_icinga = YamlToIcinga(yaml_config, header)
+        sections = timed(timings, 'render', list, yaml_icinga.sections())
+        output_writer = OutputWriter(os.path.join(output_directory, os.path.basename(host_directory) + '.cfg'))
+        timed(timings, 'write', output_writer.write_config, RenderedConfig(sections, header))
+    return timings
+
+
+def summarize(runs):
+    ordered = sorted(runs)
+    return {'min_ms': ordered[0] * 1000,
+            'median_ms': ordered[len(ordered) / 2] * 1000,
+            'mean_ms': sum(ordered) / len(ordered) * 1000,
+            'runs_ms': [run * 1000 for run in runs]}
+
+
+def git_commit():
+    try:
+        with open(os.devnull, 'w') as devnull:
+            return subprocess.check_output(['git', 'rev-parse', 'HEAD'], stderr=devnull).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def benchmark(arguments):
+    directory = tempfile.mkdtemp(prefix='monconfgenerator-benchmark-')
+    try:
+        output_directory = os.path.join(directory, 'out')
+        os.mkdir(output_directory)
+        hosts = create_fleet(os.path.join(directory, 'hosts'), arguments)
+        rounds = [run_round(hosts, output_directory) for _ in range(int(arguments['--rounds']))]
+    finally:
+        shutil.rmtree(directory)
+    stages = dict((stage, summarize([timings[stage] for timings in rounds])) for stage in STAGES)
+    return {'parameters': dict((name.lstrip('-').replace('-', '_'), int(arguments[name]))
+                               for name in ['--hosts', '--services', '--variable-depth', '--defaults',
+                                            '--fragments', '--rounds']),
+            'environment': {'python': platform.python_version(),
+                            'libyaml': bool(getattr(yaml, '__with_libyaml__', False)),
+                            'commit': git_commit(),
+                            'time': datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%SZ')},
+            'stages': stages}
+
+
+def comparison(results, earlier):
+    lines = ['%-24s %10s %10s %8s' % ('stage', 'before ms', 'now ms', 'change')]
+    for stage in STAGES:
+        if stage not in earlier['stages']:
+            continue
+        before = earlier['stages'][stage]['median_ms']
+        now = results['stages'][stage]['median_ms']
+        change = (now - before) / before * 100 if before else 0.0
+        lines.append('%-24s %10.1f %10.1f %+7.1f%%' % (stage, before, now, change))
+    return '\n'.join(lines)
+
+
+def main():
+    arguments = docopt(__doc__)
+    results = benchmark(arguments)
+    output = json.dumps(results, indent=2, separators=(',', ': '), sort_keys=True)
+    if arguments['--output']:
+        with open(arguments['--output'], 'w') as output_file:
+            output_file.write(output + '\n')
+    else:
+        print output
+    if arguments['--compare']:
+        with open(arguments['--compare']) as earlier_file:
+            print >> sys.stderr, comparison(results, json.load(earlier_file))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+"""Throughput of YamlToIcinga compared to rendering line by line as it was done before.
+
+Usage:
+  render_benchmark.py [--services=<count>] [--rounds=<count>]
+
+Options:
+  --services=<count>  Number of services of the synthetic host [default: 5000]
+  --rounds=<count>    Number of times the host is rendered [default: 5]
+"""
+import os
+import time
+
+from docopt import docopt
+
+os.environ.setdefault('MONITORING_CONFIG_GENERATOR_CONFIG', 'testdata/testconfig.yaml')
+from monitoring_config_generator.MonitoringConfigGenerator import YamlToIcinga
+from monitoring_config_generator.settings import CONFIG
+from monitoring_config_generator.yaml_tools.readers import Header
+
+
+class SyntheticHost(object):
+    def __init__(self, services):
+        self.host = {'host_name': 'host01.some.domain', 'alias': 'host01', 'address': '10.0.0.1',
+                     'max_check_attempts': 3, 'check_period': '24x7', 'contacts': ['admins', 'ops'],
+                     'notification_interval': 120, 'notification_period': '24x7'}
+        self.services = []
+        for number in range(services):
+            service = dict(self.host)
+            del service['alias'], service['address']
+            service.update({'service_description': 'service %d' % number,
+                            'check_command': 'check_http!/status/%d!8080' % number,
+                            'check_interval': 5,
+                            'servicegroups': ['web', 'group_%d' % (number % 10)],
+                            'event_handler_enabled': None,
+                            '_service_id': 'service_%d' % number})
+            self.services.append(service)
+
+
+def render_line_by_line(yaml_config, header):
+    """the renderer before it was optimized"""
+    lines = list(header.serialize())
+    for section_name, sections in ('host', [yaml_config.host]), ('service', yaml_config.services):
+        for section_data in sections:
+            lines.append("")
+            lines.append("define %s {" % section_name)
+            sorted_keys = section_data.keys()
+            sorted_keys.sort()
+            for key in sorted_keys:
+                value = section_data[key]
+                if isinstance(value, list):
+                    value = ",".join([str(x) if (x is not None) else "" for x in value])
+                else:
+                    value = str(value)
+                icinga_line = "%s%-45s%s" % (CONFIG['INDENT'], key, value)
+                if "\n" in icinga_line or "}" in icinga_line:
+                    raise Exception("Found forbidden newline or '}' character in section %r." % section_name)
+                lines.append(icinga_line)
+            lines.append("}")
+    return "".join([line + "\n" for line in lines])
+
+
+def render(yaml_config, header):
+    return "".join(YamlToIcinga(yaml_config, header).sections())
+
+
+def seconds_per_round(function, yaml_config, header, rounds):
+    start = time.time()
+    for _ in range(rounds):
+        function(yaml_config, header)
+    return (time.time() - start) / rounds
+
+
+def main():
+    arguments = docopt(__doc__)
+    host, header = SyntheticHost(int(arguments['--services'])), Header(etag='abc', mtime=1234)
+    rounds = int(arguments['--rounds'])
+    output = render(host, header)
+    assert output == render_line_by_line(host, header)
+    print 'host with %d services, %d bytes of config' % (len(host.services), len(output))
+
+    before = seconds_per_round(render_line_by_line, host, header, rounds)
+    after = seconds_per_round(render, host, header, rounds)
+    for name, seconds in ('line by line', before), ('YamlToIcinga', after):
+        print '%-14s %8.2f ms per host, %8.0f services per second' % (name, seconds * 1000,
+                                                                      len(host.services) / seconds)
+    print '%.1f times faster' % (before / after)
+
+
+if __name__ == '__main__':
+    main()
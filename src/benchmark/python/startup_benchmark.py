@@ -0,0 +1,63 @@
+"""Measure the cold start of monconfgenerator: importing it in a fresh interpreter and running -h.
+
+Exits with 1 if the median import time is above the budget, so CI can fail on regressions.
+
+Usage:
+  startup_benchmark.py [--runs=<count>] [--budget=<ms>]
+
+Options:
+  --runs=<count>  Number of fresh interpreters started per measurement [default: 10]
+  --budget=<ms>   Maximal median import time in milliseconds [default: 100]
+"""
+import os
+import subprocess
+import sys
+import time
+
+from docopt import docopt
+
+
+IMPORT = ('import time; start = time.time(); '
+          'import monitoring_config_generator.MonitoringConfigGenerator; '
+          'print time.time() - start')
+HELP = ('import sys; sys.argv = ["monconfgenerator", "-h"]; '
+        'from monitoring_config_generator import MonitoringConfigGenerator; '
+        'MonitoringConfigGenerator.generate_config()')
+
+
+def environment():
+    return dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path))
+
+
+def import_seconds():
+    return float(subprocess.check_output([sys.executable, '-c', IMPORT], env=environment()))
+
+
+def help_seconds():
+    start = time.time()
+    with open(os.devnull, 'w') as devnull:
+        subprocess.call([sys.executable, '-c', HELP], env=environment(), stdout=devnull)
+    return time.time() - start
+
+
+def median(values):
+    return sorted(values)[len(values) / 2]
+
+
+def main():
+    arguments = docopt(__doc__)
+    runs = int(arguments['--runs'])
+    budget = float(arguments['--budget']) / 1000
+
+    imports = [import_seconds() for _ in range(runs)]
+    helps = [help_seconds() for _ in range(runs)]
+    print '%-28s %8.1f ms median, %8.1f ms min' % ('import', median(imports) * 1000, min(imports) * 1000)
+    print '%-28s %8.1f ms median, %8.1f ms min' % ('monconfgenerator -h (total)', median(helps) * 1000,
+                                                    min(helps) * 1000)
+    if median(imports) > budget:
+        print 'import takes longer than the budget of %.1f ms' % (budget * 1000)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+"""Compare the parse time per host of the pure Python and the libyaml loader.
+
+Usage:
+  yaml_loader_benchmark.py [--services=<count>] [--hosts=<count>]
+
+Options:
+  --services=<count>  Number of services in the synthetic host document [default: 500]
+  --hosts=<count>     Number of times the document is parsed per loader [default: 20]
+"""
+import time
+
+import yaml
+from docopt import docopt
+
+from monitoring_config_generator.yaml_tools.loader import safe_load
+
+
+def host_document(services):
+    lines = ['defaults:',
+             '  check_period: 24x7',
+             '  max_check_attempts: 3',
+             '  notification_interval: 120',
+             '  notification_period: 24x7',
+             '  contacts: [admins, ops]',
+             'variables:',
+             '  HOST_NAME: host01.some.domain',
+             'host:',
+             '  host_name: ${HOST_NAME}',
+             '  alias: host01',
+             '  address: 10.0.0.1',
+             'services:']
+    for number in range(services):
+        lines.extend(['  service_%d:' % number,
+                      '    service_description: service %d on ${HOST_NAME}' % number,
+                      '    check_command: check_http!/status/%d!8080' % number,
+                      '    host_name: ${HOST_NAME}',
+                      '    check_interval: 5',
+                      '    servicegroups: [web, group_%d]' % (number % 10)])
+    return '\n'.join(lines) + '\n'
+
+
+def seconds_per_host(document, hosts, loader):
+    start = time.time()
+    for _ in range(hosts):
+        yaml.load(document, Loader=loader)
+    return (time.time() - start) / hosts
+
+
+def main():
+    arguments = docopt(__doc__)
+    document = host_document(int(arguments['--services']))
+    hosts = int(arguments['--hosts'])
+    print 'document with %s services, %d bytes' % (arguments['--services'], len(document))
+    assert safe_load(document) == yaml.load(document, Loader=yaml.SafeLoader)
+
+    pure = seconds_per_host(document, hosts, yaml.SafeLoader)
+    print '%-12s %8.2f ms per host' % ('SafeLoader', pure * 1000)
+    if getattr(yaml, '__with_libyaml__', False):
+        c = seconds_per_host(document, hosts, yaml.CSafeLoader)
+        print '%-12s %8.2f ms per host, %.1f times faster' % ('CSafeLoader', c * 1000, pure / c)
+    else:
+        print 'CSafeLoader  not available, PyYAML was built without libyaml'
+
+
+if __name__ == '__main__':
+    main()
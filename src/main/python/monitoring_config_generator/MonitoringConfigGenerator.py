@@ -5,9 +5,20 @@ which it receives a specially formatted yaml file. This file is transformed into
 a valid Icinga configuration file.
 If no URL is given it reads it's default configuration from file system. The
 configuration file is: /etc/monitoring_config_generator/config.yaml'
+If OUTPUT_SHARDS is set, the configuration of a host is written into one of
+OUTPUT_SHARDS shared files instead of a file of its own.
+
+With --profile the run is profiled. The pstats are written to the given path,
+the stacks collapsed for flamegraph.pl to the same path with .collapsed added.
+
+With --check-only the yaml files or directories given as PATH are only checked,
+in parallel, and a report of all problems found is printed. Nothing is written
+to the target directory.
 
 Usage:
-  monconfgenerator [--debug] [--targetdir=<directory>] [--skip-checks] [URL]
+  monconfgenerator [--debug] [--targetdir=<directory>] [--skip-checks] [--fsync] [--profile=<path>] [URL]
+  monconfgenerator --check-only [--debug] [--skip-checks] [--workers=<n>] [--format=<format>]
+                   [--output=<file>] [--path-file=<file>] [PATH...]
   monconfgenerator -h
 
 Options:
@@ -17,20 +28,33 @@ Options:
                     into this directory. If no target directory is given its
                     value is read from /etc/monitoring_config_generator/config.yaml
   --skip-checks     Do not run checks on the yaml file received from the URL.
+  --fsync           Flush the written file to disk before it replaces the old one.
+                    Also enabled by FSYNC in /etc/monitoring_config_generator/config.yaml
+  --profile=PATH    Profile the run and write the pstats to PATH, the collapsed
+                    stacks to PATH.collapsed.
+  --check-only      Check the yaml files or directories, write no configuration.
+  --workers=N       Number of processes checking in parallel, the number of CPUs if not given.
+  --format=FORMAT   Format of the check report, json or junit [default: json].
+  --output=FILE     Write the check report to FILE instead of stdout.
+  --path-file=FILE  Read additional paths to check from FILE, one per line.
 
 """
 from datetime import datetime
+import hashlib
 import logging
 import os
 import sys
-
-from docopt import docopt
+import urlparse
 
 from monitoring_config_generator.exceptions import MonitoringConfigGeneratorException, \
-    ConfigurationContainsUndefinedVariables, NoSuchHostname, HostUnreachableException
-from monitoring_config_generator import set_log_level_to_debug
-from monitoring_config_generator.yaml_tools.readers import Header, read_config
+    ConfigurationContainsUndefinedVariables, NoSuchHostname, HostUnreachableException, NotModifiedException
+from monitoring_config_generator import init_logging, set_log_level_to_debug, metrics
+from monitoring_config_generator.atomic_file import AtomicFile, write_atomically, fsync_directory
+from monitoring_config_generator.header_index import HeaderIndex
+from monitoring_config_generator.shards import ShardedOutput, remove_from_shard
+from monitoring_config_generator.yaml_tools.readers import read_config, is_host
 from monitoring_config_generator.yaml_tools.config import YamlConfig
+from monitoring_config_generator.yaml_tools.service_cache import SERVICE_CACHES
 from monitoring_config_generator.settings import CONFIG
 
 
@@ -38,14 +62,31 @@ EXIT_CODE_CONFIG_WRITTEN = 0
 EXIT_CODE_ERROR = 1
 EXIT_CODE_NOT_WRITTEN = 2
 
+STATUS_WRITTEN = 'written'
+STATUS_UNCHANGED = 'unchanged'
+STATUS_UP_TO_DATE = 'up-to-date'
+STATUS_NOT_MODIFIED = 'not-modified'
+
 LOG = logging.getLogger("monconfgenerator")
 
 
 class MonitoringConfigGenerator(object):
-    def __init__(self, url, debug_enabled=False, target_dir=None, skip_checks=False):
+    def __init__(self, url, debug_enabled=False, target_dir=None, skip_checks=False, fetcher=None,
+                 header_index=None, fsync=None, sync_directory=True, sharded_output=None):
         self.skip_checks = skip_checks
         self.target_dir = target_dir if target_dir else CONFIG['TARGET_DIR']
         self.source = url
+        self.fetcher = fetcher
+        self.fsync = CONFIG['FSYNC'] if fsync is None else fsync
+        # fleet runs sync the target directory once for all hosts instead of after every file
+        self.sync_directory = sync_directory
+        self.status = None
+        # a header index handed in is shared with other generators and saved by its owner
+        self._header_index = header_index
+        self._owns_header_index = header_index is None
+        # a sharded output handed in is shared with other generators and flushed by its owner
+        self._sharded_output = sharded_output
+        self._owns_sharded_output = sharded_output is None
 
         if debug_enabled:
             set_log_level_to_debug()
@@ -61,17 +102,87 @@ class MonitoringConfigGenerator(object):
     def _is_newer(self, header_source, hostname):
         if not hostname:
             raise NoSuchHostname('hostname not found')
-        output_path = self.output_path(self.create_filename(hostname))
-        old_header = Header.parse(output_path)
+        old_header = self.header_index.get(self.create_filename(hostname))
         return header_source.is_newer_than(old_header)
 
+    @property
+    def header_index(self):
+        if self._header_index is None:
+            # only the entries of this host are checked, the fleet and the daemon check all of them
+            self._header_index = HeaderIndex.load(self.target_dir, sync_all=False)
+        return self._header_index
+
+    @property
+    def sharded_output(self):
+        """None unless OUTPUT_SHARDS is set"""
+        if self._sharded_output is None and self._owns_sharded_output and int(CONFIG['OUTPUT_SHARDS'] or 0) > 0:
+            self._sharded_output = ShardedOutput(self.target_dir, CONFIG['OUTPUT_SHARDS'], self.header_index,
+                                                 self.fsync)
+        return self._sharded_output
+
+    def _header_of_previous_run(self):
+        """Header of the config generated from this URL before, used to make the download conditional.
+
+        If the URL has not been seen before, the host name of the URL is the best guess for the generated
+        file. If the guess is wrong the config is simply downloaded completely."""
+        source_parsed = urlparse.urlparse(self.source)
+        if not is_host(source_parsed):
+            return None
+        file_name = self.header_index.file_name_for_source(self.source)
+        if file_name is None:
+            if not source_parsed.hostname:
+                return None
+            file_name = self.create_filename(source_parsed.hostname)
+        return self.header_index.get(file_name)
+
     def output_path(self, file_name):
         return os.path.join(self.target_dir, file_name)
 
+    def _is_unchanged(self, file_name, config_hash):
+        """True if the existing file only differs in its header. The size guards against files edited by hand"""
+        entry = self.header_index.entry(file_name)
+        if entry is None or entry['hash'] != config_hash:
+            return False
+        if self.sharded_output is not None:
+            shard = self.sharded_output.shard_file_name(file_name)
+            return entry.get('shard') == shard and os.path.exists(self.output_path(shard))
+        if entry.get('shard'):
+            return False
+        try:
+            return os.path.getsize(self.output_path(file_name)) == entry['size']
+        except OSError:
+            return False
+
     def write_output(self, file_name, yaml_icinga):
-        lines = yaml_icinga.icinga_lines
-        output_writer = OutputWriter(self.output_path(file_name))
-        output_writer.write_lines(lines)
+        """Write the config unless only its header changed, returns True if the file was written"""
+        metrics.increment('services_rendered', len(yaml_icinga.yaml_config.services))
+        if self.sharded_output is not None:
+            return self.write_to_shard(file_name, yaml_icinga)
+        output_writer = OutputWriter(self.output_path(file_name), self.fsync, self.fsync and self.sync_directory)
+        written, config_hash, size = output_writer.write_config(
+            yaml_icinga, is_unchanged=lambda config_hash: self._is_unchanged(file_name, config_hash))
+        if written:
+            old_shard = (self.header_index.entry(file_name) or {}).get('shard')
+            self.header_index.update(file_name, yaml_icinga.header, config_hash, size)
+            if old_shard and remove_from_shard(self.target_dir, old_shard, file_name, self.fsync):
+                # OUTPUT_SHARDS was turned off, the host must not be defined twice
+                self.header_index.record_file(old_shard)
+        else:
+            # the file is untouched, but remember the new header so the next run sees it as up to date
+            self.header_index.update_header(file_name, yaml_icinga.header)
+        return written
+
+    def write_to_shard(self, file_name, yaml_icinga):
+        """Queue the config for its shard unless only its header changed. The shard is written on flush"""
+        sections = yaml_icinga.sections()
+        header = next(sections)
+        body = "".join(sections)
+        config_hash = hashlib.sha1(body).hexdigest()
+        if self._is_unchanged(file_name, config_hash):
+            self.header_index.update_header(file_name, yaml_icinga.header)
+            return False
+        self.sharded_output.put(file_name, header + body, yaml_icinga.header, config_hash)
+        return True
 
     @staticmethod
     def create_filename(hostname):
@@ -82,19 +193,55 @@ class MonitoringConfigGenerator(object):
         return name
 
     def generate(self):
+        try:
+            with metrics.timer('host_seconds'):
+                return self._generate()
+        finally:
+            if self._owns_sharded_output and self._sharded_output is not None:
+                if self._sharded_output.flush() and self.fsync and self.sync_directory:
+                    fsync_directory(self.target_dir)
+            if self._owns_header_index and self._header_index is not None:
+                self._header_index.save()
+
+    def _generate(self):
         file_name = None
-        raw_yaml_config, header_source = read_config(self.source)
+        try:
+            raw_yaml_config, header_source = read_config(self.source,
+                                                         fetcher=self.fetcher,
+                                                         header=self._header_of_previous_run())
+        except NotModifiedException:
+            LOG.debug("%s has not been modified since the last run" % self.source)
+            self.status = STATUS_NOT_MODIFIED
+            return None
 
         if raw_yaml_config is None:
             raise SystemExit("Raw yaml config from source '%s' is 'None'." % self.source)
 
-        yaml_config = YamlConfig(raw_yaml_config,
-                                 skip_checks=self.skip_checks)
-
-        if yaml_config.host and self._is_newer(header_source, yaml_config.host_name):
-            file_name = self.create_filename(yaml_config.host_name)
-            yaml_icinga = YamlToIcinga(yaml_config, header_source)
-            self.write_output(file_name, yaml_icinga)
+        with SERVICE_CACHES.cache_for(self.source) as service_cache:
+            yaml_config = YamlConfig(raw_yaml_config,
+                                     skip_checks=self.skip_checks,
+                                     service_cache=service_cache)
+
+            if yaml_config.host and is_host(urlparse.urlparse(self.source)):
+                self.header_index.remember_source(self.source, self.create_filename(yaml_config.host_name))
+
+            if yaml_config.host and self._is_newer(header_source, yaml_config.host_name):
+                file_name = self.create_filename(yaml_config.host_name)
+                yaml_icinga = YamlToIcinga(yaml_config, header_source, service_cache)
+                # rendering is streamed into the file, so both are timed together
+                with metrics.timer('write_seconds'):
+                    written = self.write_output(file_name, yaml_icinga)
+                if written:
+                    metrics.increment('files_written')
+                    self.status = STATUS_WRITTEN
+                else:
+                    LOG.debug("Icinga config file '%s' is unchanged." % file_name)
+                    metrics.increment('files_unchanged')
+                    self.status = STATUS_UNCHANGED
+                    file_name = None
+            elif yaml_config.host:
+                metrics.increment('files_up_to_date')
+                self.status = STATUS_UP_TO_DATE
 
         if file_name:
             LOG.info("Icinga config file '%s' created." % file_name)
@@ -102,38 +249,77 @@ class MonitoringConfigGenerator(object):
         return file_name
 
 class YamlToIcinga(object):
-    def __init__(self, yaml_config, header):
-        self.icinga_lines = []
+    """Renders a YamlConfig as Icinga config. Nothing is rendered up front, sections() yields the
+    config one section at a time, so only one section is held in memory while it is written"""
+
+    FORBIDDEN_CHARACTER_MESSAGE = "Found forbidden newline or '}' character in section %r."
+
+    def __init__(self, yaml_config, header, service_cache=None):
+        self.yaml_config = yaml_config
+        self.header = header
+        # a ServiceCache keeps the rendering of services that did not change since the last run
+        self.service_cache = service_cache
         self.indent = CONFIG['INDENT']
-        self.icinga_lines.extend(header.serialize())
-        self.write_section('host', yaml_config.host)
-        for service in yaml_config.services:
-            self.write_section('service', service)
-
-    def write_line(self, line):
-        self.icinga_lines.append(line)
-
-    def write_section(self, section_name, section_data):
-        self.write_line("")
-        self.write_line("define %s {" % section_name)
-        sorted_keys = section_data.keys()
-        sorted_keys.sort()
-        for key in sorted_keys:
-            value = self.value_to_icinga(section_data[key])
-            icinga_line = "%s%-45s%s" % (self.indent, key, value)
-
-            if "\n" in icinga_line or "}" in icinga_line:
-                msg = "Found forbidden newline or '}' character in section %r."
-                raise Exception(msg % section_name)
-
-            self.icinga_lines.append(icinga_line)
-        self.write_line("}")
+        # keys repeat in every service, so each is padded and checked only once
+        self.key_prefixes = {}
+
+    @property
+    def icinga_lines(self):
+        """all lines of the config at once, without line endings"""
+        return "".join(self.sections()).split("\n")[:-1]
+
+    def sections(self):
+        """The config as text: first a chunk with the header comment, then one chunk for each section.
+        Every chunk ends with a newline"""
+        yield "".join([line + "\n" for line in self.header.serialize()])
+        yield self.render_section('host', self.yaml_config.host)
+        for service in self.yaml_config.services:
+            if self.service_cache is None:
+                yield self.render_section('service', service)
+            else:
+                yield self.service_cache.rendered(service, self.indent, self.render_service)
+
+    def render_service(self, service):
+        return self.render_section('service', service)
+
+    def render_section(self, section_name, section_data):
+        keys = sorted(section_data)
+        values = [self.value_to_icinga(section_data[key]) for key in keys]
+        # the values are checked all at once, the keys once when their padded prefix is cached
+        all_values = "".join(values)
+        if "\n" in all_values or "}" in all_values:
+            raise Exception(self.FORBIDDEN_CHARACTER_MESSAGE % section_name)
+
+        key_prefixes = self.key_prefixes
+        for key in keys:
+            if key not in key_prefixes:
+                key_prefixes[key] = self._key_prefix(section_name, key)
+        parts = [None] * (2 * len(keys))
+        parts[::2] = [key_prefixes[key] for key in keys]
+        parts[1::2] = values
+        return "\ndefine %s {%s\n}\n" % (section_name, "".join(parts))
+
+    def _key_prefix(self, section_name, key):
+        """the start of the line of key, up to its value"""
+        prefix = "\n%s%-45s" % (self.indent, key)
+        if "\n" in prefix[1:] or "}" in prefix:
+            raise Exception(self.FORBIDDEN_CHARACTER_MESSAGE % section_name)
+        return prefix
 
     @staticmethod
     def value_to_icinga(value):
         """Convert a scalar or list to Icinga value format. Lists are concatenated by ,
         and empty (None) values produce an empty string"""
+        if type(value) is str:
+            return value
         if isinstance(value, list):
+            try:
+                joined = ",".join(value)
+                # only lists of plain strings take the short cut, str() would fail for non-ascii unicode
+                if type(joined) is str:
+                    return joined
+            except TypeError:
+                pass
             # explicitly set None values to empty string
             return ",".join([str(x) if (x is not None) else "" for x in value])
         else:
@@ -141,39 +327,125 @@ class YamlToIcinga(object):
 
 
 class OutputWriter(object):
-    def __init__(self, output_file):
+    def __init__(self, output_file, fsync=False, sync_directory=False):
         self.output_file = output_file
+        self.fsync = fsync
+        self.sync_directory = sync_directory
 
     def write_lines(self, lines):
-        with open(self.output_file, 'w') as f:
-            for line in lines:
-                f.write(line + "\n")
+        content = "".join([line + "\n" for line in lines])
+        write_atomically(self.output_file, content, fsync=self.fsync)
+        self._written()
+
+    def write_config(self, yaml_icinga, is_unchanged=None):
+        """Stream the sections of yaml_icinga into the output file, hashing everything below the header.
+
+        The hash equals content_hash of the rendered lines. If is_unchanged is given, the sections are
+        hashed first without touching the disk, and only rendered again into the file if
+        is_unchanged(hash) is false. Returns written, hash and size"""
+        if is_unchanged is not None:
+            config_hash, size = self._stream(yaml_icinga.sections())
+            if is_unchanged(config_hash):
+                return False, config_hash, size
+        output = AtomicFile(self.output_file)
+        try:
+            config_hash, size = self._stream(yaml_icinga.sections(), output)
+        except BaseException:
+            output.discard()
+            raise
+        output.commit(self.fsync)
+        self._written()
+        return True, config_hash, size
+
+    @staticmethod
+    def _stream(sections, output=None):
+        """hash and size of the sections, written to output if given. Only one section is held in memory"""
+        header = next(sections)
+        if output is not None:
+            output.write(header)
+        size = len(header)
+        sha = hashlib.sha1()
+        for section in sections:
+            if output is not None:
+                output.write(section)
+            sha.update(section)
+            size += len(section)
+        return sha.hexdigest(), size
+
+    def _written(self):
+        if self.sync_directory:
+            fsync_directory(os.path.dirname(self.output_file))
         LOG.debug("Created %s" % self.output_file)
 
 
-def generate_config():
-    arg = docopt(__doc__, version='0.1.0')
-    start_time = datetime.now()
+class GenerationResult(object):
+    """Outcome of a single generator run, mapped onto the exit codes of monconfgenerator"""
+
+    def __init__(self, source, exit_code, file_name=None, error=None, status=None):
+        self.source = source
+        self.exit_code = exit_code
+        self.file_name = file_name
+        self.error = error
+        self.status = status
+
+    def __repr__(self):
+        return "GenerationResult(%s, %s, %s)" % (self.source, self.exit_code, self.file_name)
+
+
+def run_generator(url, debug_enabled=False, target_dir=None, skip_checks=False, profiler=None, **generator_options):
+    """Run the generator for url. A profiler from the profiling module, if given, profiles generate()"""
+    file_name, error, generator = None, None, None
     try:
-        file_name = MonitoringConfigGenerator(arg['URL'],
-                                              arg['--debug'],
-                                              arg['--targetdir'],
-                                              arg['--skip-checks']).generate()
+        generator = MonitoringConfigGenerator(url,
+                                              debug_enabled,
+                                              target_dir,
+                                              skip_checks,
+                                              **generator_options)
+        if profiler is None:
+            file_name = generator.generate()
+        else:
+            file_name = profiler.run(url, generator.generate)
         exit_code = EXIT_CODE_CONFIG_WRITTEN if file_name else EXIT_CODE_NOT_WRITTEN
-    except HostUnreachableException:
-        LOG.warn("Target url {0} unreachable. Could not get yaml config!".format(arg['URL']))
-        exit_code = EXIT_CODE_NOT_WRITTEN
-    except ConfigurationContainsUndefinedVariables:
+    except HostUnreachableException as e:
+        LOG.warn("Target url {0} unreachable. Could not get yaml config!".format(url))
+        exit_code, error = EXIT_CODE_NOT_WRITTEN, e
+    except ConfigurationContainsUndefinedVariables as e:
         LOG.error("Configuration contained undefined variables!")
-        exit_code = EXIT_CODE_ERROR
+        exit_code, error = EXIT_CODE_ERROR, e
     except SystemExit as e:
-        exit_code = e.code
+        exit_code, error = e.code, e
     except BaseException as e:
         LOG.error(e)
-        exit_code = EXIT_CODE_ERROR
+        exit_code, error = EXIT_CODE_ERROR, e
+    if exit_code == EXIT_CODE_ERROR:
+        metrics.increment('errors')
+    return GenerationResult(url, exit_code, file_name, error, generator.status if generator else None)
+
+
+def generate_config():
+    from docopt import docopt
+    init_logging()
+    arg = docopt(__doc__, version='0.1.0')
+    if arg['--check-only']:
+        # imported here, check imports this module
+        from monitoring_config_generator.check import run_check_only
+        sys.exit(run_check_only(arg))
+    profiler = None
+    if arg['--profile']:
+        from monitoring_config_generator.profiling import Profiler
+        profiler = Profiler(arg['--profile'])
+    start_time = datetime.now()
+    try:
+        exit_code = run_generator(arg['URL'],
+                                  arg['--debug'],
+                                  arg['--targetdir'],
+                                  arg['--skip-checks'],
+                                  profiler,
+                                  fsync=arg['--fsync'] or None).exit_code
     finally:
         stop_time = datetime.now()
         LOG.info("finished in %s" % (stop_time - start_time))
+        metrics.export()
     sys.exit(exit_code)
 
 
@@ -2,12 +2,15 @@ import logging
 
 
 def init_logging():
+    """log INFO to the console, called by the command line entry points and not on import"""
+    monconfgenerator_logger = logging.getLogger('monconfgenerator')
+    if any(isinstance(handler, logging.StreamHandler) for handler in monconfgenerator_logger.handlers):
+        return
     formatter = logging.Formatter("%(asctime)s [%(name)s] %(levelname)s: %(message)s")
 
     console_handler = logging.StreamHandler()
     console_handler.setFormatter(formatter)
 
-    monconfgenerator_logger = logging.getLogger('monconfgenerator')
     monconfgenerator_logger.setLevel(logging.INFO)
     monconfgenerator_logger.addHandler(console_handler)
 
@@ -16,4 +19,5 @@ def set_log_level_to_debug():
     monconfgenerator_logger = logging.getLogger('monconfgenerator')
     monconfgenerator_logger.setLevel(logging.DEBUG)
 
-init_logging()
+# libraries leave configuring the output to the application, this only avoids "No handlers could be found"
+logging.getLogger('monconfgenerator').addHandler(logging.NullHandler())
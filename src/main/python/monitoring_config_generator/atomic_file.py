@@ -0,0 +1,65 @@
+import os
+import tempfile
+
+
+def _umask():
+    umask = os.umask(0)
+    os.umask(umask)
+    return umask
+
+# the mode open(path, 'w') would create files with, determined once since os.umask is process wide
+FILE_MODE = 0666 & ~_umask()
+
+
+class AtomicFile(object):
+    """A file that replaces path once it is committed, so readers see either the old or the new file.
+
+    The content is written to a temporary file in the same directory which is renamed onto path.
+    With fsync the data is on disk before the rename, the rename itself is made durable by
+    fsync_directory, which can be called once for many files."""
+
+    def __init__(self, path):
+        self.path = path
+        directory = os.path.dirname(path) or '.'
+        fd, self.temp_path = tempfile.mkstemp(dir=directory, prefix='.%s.' % os.path.basename(path), suffix='.tmp')
+        self.file = os.fdopen(fd, 'w')
+
+    def write(self, data):
+        self.file.write(data)
+
+    def commit(self, fsync=False):
+        try:
+            if fsync:
+                self.file.flush()
+                os.fsync(self.file.fileno())
+            self.file.close()
+            os.chmod(self.temp_path, FILE_MODE)
+            os.rename(self.temp_path, self.path)
+        except BaseException:
+            self.discard()
+            raise
+
+    def discard(self):
+        """throw the temporary file away and leave path as it is"""
+        self.file.close()
+        if os.path.exists(self.temp_path):
+            os.remove(self.temp_path)
+
+
+def write_atomically(path, content, fsync=False):
+    """Replace path by a file with the given content, see AtomicFile"""
+    atomic_file = AtomicFile(path)
+    try:
+        atomic_file.write(content)
+    except BaseException:
+        atomic_file.discard()
+        raise
+    atomic_file.commit(fsync)
+
+
+def fsync_directory(directory):
+    fd = os.open(directory or '.', os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
@@ -0,0 +1,145 @@
+"""Check many monitoring yaml files or directories without writing any Icinga configuration.
+
+Every path is read, generated, checked and rendered like monconfgenerator would do it, all
+problems found are reported instead of only the first one. The paths are checked by a pool of
+processes, the report is written as JSON or JUnit XML.
+"""
+from multiprocessing import Pool, cpu_count
+from xml.etree import ElementTree
+import json
+import logging
+import time
+
+from monitoring_config_generator import set_log_level_to_debug
+from monitoring_config_generator.fleet import read_lines
+from monitoring_config_generator.MonitoringConfigGenerator import (MonitoringConfigGenerator,
+                                                                   YamlToIcinga,
+                                                                   EXIT_CODE_CONFIG_WRITTEN,
+                                                                   EXIT_CODE_ERROR)
+from monitoring_config_generator.yaml_tools.config import YamlConfig
+from monitoring_config_generator.yaml_tools.readers import read_config_from_file, Header
+
+
+LOG = logging.getLogger("monconfgenerator")
+
+REPORT_FORMATS = ['json', 'junit']
+
+
+class CheckResult(object):
+    """The problems found in one path, as (exception name, message) pairs so they can be sent between processes"""
+
+    def __init__(self, path, errors, seconds):
+        self.path = path
+        self.errors = errors
+        self.seconds = seconds
+
+    @property
+    def ok(self):
+        return not self.errors
+
+    def to_dict(self):
+        return {'path': self.path,
+                'ok': self.ok,
+                'errors': [{'type': error_type, 'message': message} for error_type, message in self.errors],
+                'seconds': round(self.seconds, 6)}
+
+
+def find_errors(path, skip_checks=False):
+    yaml_config, _ = read_config_from_file(path)
+    if yaml_config is None:
+        raise Exception("Raw yaml config from source '%s' is 'None'." % path)
+    config = YamlConfig(yaml_config, skip_checks=skip_checks, report_all_errors=True)
+    if config.errors or not config.host:
+        return config.errors
+    MonitoringConfigGenerator.create_filename(config.host_name)
+    # rendering finds forbidden characters, the result is thrown away
+    for _ in YamlToIcinga(config, Header()).sections():
+        pass
+    return []
+
+
+def check_path(path, skip_checks=False):
+    start = time.time()
+    try:
+        errors = find_errors(path, skip_checks)
+    except Exception as e:
+        errors = [e]
+    errors = [(type(error).__name__, str(error)) for error in errors]
+    return CheckResult(path, errors, time.time() - start)
+
+
+def _check_path(arguments):
+    return check_path(*arguments)
+
+
+def check_paths(paths, skip_checks=False, workers=None):
+    """Check all paths, with more than one worker in a pool of processes. Results are in the order of paths"""
+    workers = cpu_count() if workers is None else workers
+    if workers < 1:
+        raise ValueError("workers must be at least 1, got %d" % workers)
+    arguments = [(path, skip_checks) for path in paths]
+    if workers == 1 or len(paths) < 2:
+        return map(_check_path, arguments)
+    pool = Pool(min(workers, len(paths)))
+    try:
+        return pool.map(_check_path, arguments, chunksize=max(1, len(paths) / (workers * 4)))
+    finally:
+        pool.close()
+        pool.join()
+
+
+def exit_code(results):
+    return EXIT_CODE_CONFIG_WRITTEN if all(result.ok for result in results) else EXIT_CODE_ERROR
+
+
+def json_report(results):
+    return json.dumps({'checked': len(results),
+                       'failed': len([result for result in results if not result.ok]),
+                       'results': [result.to_dict() for result in results]},
+                      indent=2, separators=(',', ': '), sort_keys=True)
+
+
+def junit_report(results):
+    suite = ElementTree.Element('testsuite', name='monconfgenerator',
+                                tests=str(len(results)),
+                                failures=str(len([result for result in results if not result.ok])),
+                                errors='0',
+                                time='%.6f' % sum(result.seconds for result in results))
+    for result in results:
+        case = ElementTree.SubElement(suite, 'testcase', classname='monconfgenerator', name=result.path,
+                                      time='%.6f' % result.seconds)
+        for error_type, message in result.errors:
+            failure = ElementTree.SubElement(case, 'failure', type=error_type, message=message)
+            failure.text = message
+    return ElementTree.tostring(suite, encoding='UTF-8')
+
+
+def report(results, report_format):
+    if report_format == 'json':
+        return json_report(results)
+    if report_format == 'junit':
+        return junit_report(results)
+    raise ValueError("Unknown report format %r, use one of %s" % (report_format, ', '.join(REPORT_FORMATS)))
+
+
+def run_check_only(arg):
+    """monconfgenerator --check-only, arg are the docopt arguments. Returns the exit code"""
+    if arg['--debug']:
+        set_log_level_to_debug()
+    if arg['--format'] not in REPORT_FORMATS:
+        LOG.error("Unknown report format %r, use one of %s" % (arg['--format'], ', '.join(REPORT_FORMATS)))
+        return EXIT_CODE_ERROR
+    paths = list(arg['PATH'])
+    if arg['--path-file']:
+        paths.extend(read_lines(arg['--path-file']))
+    workers = int(arg['--workers']) if arg['--workers'] else None
+
+    results = check_paths(paths, arg['--skip-checks'], workers)
+    output = report(results, arg['--format'])
+    if arg['--output']:
+        with open(arg['--output'], 'w') as report_file:
+            report_file.write(output + '\n')
+    else:
+        print output
+    LOG.info("%d checked, %d failed" % (len(results), len([result for result in results if not result.ok])))
+    return exit_code(results)
@@ -0,0 +1,363 @@
+"""monconfgenerator-daemon
+
+Keeps the Icinga monitoring configuration of many hosts up to date from a single
+long running process. Every host is generated again after DAEMON_INTERVAL seconds,
+varied by DAEMON_JITTER so the requests spread out. Hosts that are unreachable
+are retried with an exponentially growing delay of at most DAEMON_MAX_BACKOFF
+seconds. HTTP connections, parsed files and the header index are kept between runs.
+URLs are given like for monconfgenerator-fleet. On SIGHUP the configuration in
+/etc/monitoring_config_generator/config.yaml and the URL and host files are
+read again. SIGTERM and SIGINT stop the daemon after the running hosts are done.
+
+With --listen the daemon accepts HTTP notifications: POST /notify?host=<host name>
+generates that host at once, POST /push?host=<host name> generates it from the
+monitoring yaml sent as request body. Notifications for a host that is waiting or
+running already are combined into a single run.
+
+If RELOAD_COMMAND or RELOAD_SIGNAL is set, Icinga is reloaded once for all files
+written within RELOAD_DEBOUNCE seconds. With OUTPUT_SHARDS the shards are written
+about once a second for all hosts changed in between.
+
+Usage:
+  monconfgenerator-daemon [--debug] [--targetdir=<directory>] [--skip-checks] [--workers=<n>] [--fsync]
+                          [--interval=<seconds>] [--listen=<address>] [--url-file=<file>] [--host-file=<file>]
+                          [URL...]
+  monconfgenerator-daemon -h
+
+Options:
+  -h                    Show this message.
+  --debug               Print additional information.
+  --targetdir=DIR       The generated Icinga monitoring configuration is written
+                        into this directory. If no target directory is given its
+                        value is read from /etc/monitoring_config_generator/config.yaml
+  --skip-checks         Do not run checks on the yaml files received from the URLs.
+  --workers=N           Number of hosts processed concurrently. If not given its
+                        value is read from /etc/monitoring_config_generator/config.yaml
+  --fsync               Flush every written file to disk before it replaces the old one.
+                        Also enabled by FSYNC in /etc/monitoring_config_generator/config.yaml
+  --interval=SECONDS    Seconds between two runs for a host. If not given its value
+                        is read from /etc/monitoring_config_generator/config.yaml
+  --listen=ADDRESS      Accept notifications on ADDRESS, given as host:port or port.
+                        If not given its value is read from WEBHOOK_LISTEN in
+                        /etc/monitoring_config_generator/config.yaml
+  --url-file=FILE       Read additional URLs from FILE, one per line.
+  --host-file=FILE      Read additional host names from FILE, one per line.
+
+"""
+from multiprocessing.pool import ThreadPool
+import heapq
+import logging
+import random
+import signal
+import threading
+import time
+import urlparse
+
+from monitoring_config_generator import init_logging, set_log_level_to_debug, metrics
+from monitoring_config_generator.exceptions import HostUnreachableException
+from monitoring_config_generator.fleet import collect_urls
+from monitoring_config_generator.header_index import HeaderIndex
+from monitoring_config_generator.icinga_reload import IcingaReloader
+from monitoring_config_generator.MonitoringConfigGenerator import run_generator, EXIT_CODE_CONFIG_WRITTEN
+from monitoring_config_generator.settings import CONFIG, reload_config
+from monitoring_config_generator.shards import ShardedOutput
+from monitoring_config_generator.webhook import PushedFetcher, WebhookServer, parse_listen_address
+from monitoring_config_generator.yaml_tools.fetcher import HttpFetcher
+from monitoring_config_generator.yaml_tools.service_cache import SERVICE_CACHES
+
+
+LOG = logging.getLogger("monconfgenerator")
+
+# the longest the main loop sleeps, so signals are handled in time
+MAX_WAIT_SECONDS = 1.0
+INDEX_SYNC_SECONDS = 60
+METRICS_EXPORT_SECONDS = 15
+
+
+class Daemon(object):
+    """Generates the config of every URL again and again, at most workers hosts at a time.
+
+    The schedule is a heap of (due time, url). A host is scheduled again when its run finished,
+    a host that is still running is never started twice. get_urls is called at start and on
+    reload and returns the URLs to keep up to date. notify makes a host due at once, a host that is
+    running is started again as soon as it finished."""
+
+    def __init__(self, get_urls, debug_enabled=False, target_dir=None, skip_checks=False, workers=None,
+                 interval=None, fsync=None, listen=None, clock=time.time, random_generator=None):
+        self.get_urls = get_urls
+        self.debug_enabled = debug_enabled
+        self._target_dir = target_dir
+        self.skip_checks = skip_checks
+        self._workers = workers
+        self._interval = interval
+        self._fsync = fsync
+        self._listen = listen
+        self.clock = clock
+        self.random = random_generator or random.Random()
+        self.urls = set()
+        self.failures = {}
+        self.fetcher = None
+        self.header_index = None
+        self.sharded_output = None
+        self.reloader = IcingaReloader(clock)
+        self._schedule = []
+        self._running = set()
+        # hosts notified while running, and the latest document pushed for a host
+        self._notified_while_running = set()
+        self._pushed = {}
+        self._condition = threading.Condition()
+        self._stopped = False
+        self._reload_requested = False
+        self._last_index_sync = None
+        self._last_metrics_export = clock()
+
+    @property
+    def target_dir(self):
+        return self._target_dir or CONFIG['TARGET_DIR']
+
+    @property
+    def workers(self):
+        return int(CONFIG['FLEET_WORKERS'] if self._workers is None else self._workers)
+
+    @property
+    def interval(self):
+        return float(CONFIG['DAEMON_INTERVAL'] if self._interval is None else self._interval)
+
+    @property
+    def fsync(self):
+        return CONFIG['FSYNC'] if self._fsync is None else self._fsync
+
+    @property
+    def listen(self):
+        listen = CONFIG['WEBHOOK_LISTEN'] if self._listen is None else self._listen
+        return parse_listen_address(listen) if listen else None
+
+    def start(self):
+        self.fetcher = HttpFetcher()
+        self.header_index = HeaderIndex.load(self.target_dir)
+        self.sharded_output = self._create_sharded_output()
+        self._last_index_sync = self.clock()
+        self.set_urls(self.get_urls())
+
+    def _create_sharded_output(self):
+        if int(CONFIG['OUTPUT_SHARDS'] or 0) > 0:
+            return ShardedOutput(self.target_dir, CONFIG['OUTPUT_SHARDS'], self.header_index, self.fsync)
+        return None
+
+    def set_urls(self, urls):
+        """Keep exactly urls up to date, new ones are due at once"""
+        urls = set(urls)
+        now = self.clock()
+        with self._condition:
+            for url in urls - self.urls:
+                heapq.heappush(self._schedule, (now, url))
+            self.urls = urls
+            self._schedule = [(due, url) for due, url in self._schedule if url in urls]
+            heapq.heapify(self._schedule)
+            for url in list(self.failures):
+                if url not in urls:
+                    del self.failures[url]
+            for url in list(self._pushed):
+                if url not in urls:
+                    del self._pushed[url]
+        SERVICE_CACHES.enable(len(urls))
+        LOG.info("Keeping %d hosts up to date" % len(urls))
+
+    def next_delay(self, result):
+        """Seconds until the next run of a host, longer after every time it was unreachable in a row"""
+        delay = self.interval
+        if isinstance(result.error, HostUnreachableException):
+            failures = self.failures.get(result.source, 0) + 1
+            self.failures[result.source] = failures
+            delay = min(delay * 2 ** failures, max(float(CONFIG['DAEMON_MAX_BACKOFF']), delay))
+        else:
+            self.failures.pop(result.source, None)
+        jitter = float(CONFIG['DAEMON_JITTER'])
+        return delay * (1 + self.random.uniform(-jitter, jitter))
+
+    def find_url(self, host=None, url=None):
+        """The URL kept up to date for url or host name, None if there is none"""
+        with self._condition:
+            if url is not None:
+                return url if url in self.urls else None
+            if host is not None:
+                for candidate in self.urls:
+                    if urlparse.urlparse(candidate).hostname == host or candidate == host:
+                        return candidate
+        return None
+
+    def notify(self, url, pushed=None):
+        """Generate url as soon as possible, from the pushed response if given. False for unknown URLs"""
+        with self._condition:
+            if url not in self.urls:
+                return False
+            if pushed is not None:
+                self._pushed[url] = pushed
+            if url in self._running:
+                self._notified_while_running.add(url)
+            elif not any(due <= self.clock() for due, scheduled in self._schedule if scheduled == url):
+                self._schedule = [(due, scheduled) for due, scheduled in self._schedule if scheduled != url]
+                self._schedule.append((self.clock(), url))
+                heapq.heapify(self._schedule)
+            self._condition.notify()
+        return True
+
+    def generate(self, url):
+        with self._condition:
+            pushed = self._pushed.pop(url, None)
+        fetcher = self.fetcher if pushed is None else PushedFetcher(pushed)
+        return run_generator(url, self.debug_enabled, self.target_dir, self.skip_checks,
+                             fetcher=fetcher, header_index=self.header_index, fsync=self.fsync,
+                             sharded_output=self.sharded_output)
+
+    def finished(self, result):
+        with self._condition:
+            self._running.discard(result.source)
+            if result.source in self._notified_while_running:
+                self._notified_while_running.discard(result.source)
+                heapq.heappush(self._schedule, (self.clock(), result.source))
+            elif result.source in self.urls:
+                heapq.heappush(self._schedule, (self.clock() + self.next_delay(result), result.source))
+            self._condition.notify()
+        if result.exit_code == EXIT_CODE_CONFIG_WRITTEN:
+            LOG.info("%s: %s written" % (result.source, result.file_name))
+            if IcingaReloader.is_configured() and self.sharded_output is None:
+                self.reloader.changed(result.file_name)
+
+    def dispatch_due(self, pool):
+        """Start all hosts that are due, returns their URLs"""
+        now = self.clock()
+        due = []
+        with self._condition:
+            while self._schedule and self._schedule[0][0] <= now and not self._reload_requested:
+                _, url = heapq.heappop(self._schedule)
+                if url not in self._running:
+                    self._running.add(url)
+                    due.append(url)
+        for url in due:
+            pool.apply_async(self.generate, (url,), callback=self.finished)
+        return due
+
+    def seconds_until_next_due(self):
+        with self._condition:
+            if not self._schedule:
+                return MAX_WAIT_SECONDS
+            return min(max(self._schedule[0][0] - self.clock(), 0), MAX_WAIT_SECONDS)
+
+    def maintain(self):
+        """Reload if asked to and nothing is running, write the shards of changed hosts, keep the header index
+        in line with the target directory and reload Icinga once the debounce window of the written files is over"""
+        with self._condition:
+            reload_now = self._reload_requested and not self._running
+            if reload_now:
+                self._reload_requested = False
+        if reload_now:
+            self.reload()
+        self.flush_shards()
+        if self.clock() - self._last_index_sync >= INDEX_SYNC_SECONDS:
+            self.header_index.sync_with_directory()
+            self._last_index_sync = self.clock()
+        self.header_index.save()
+        self.reloader.reload_if_due()
+        if self.clock() - self._last_metrics_export >= METRICS_EXPORT_SECONDS:
+            metrics.export()
+            self._last_metrics_export = self.clock()
+
+    def flush_shards(self):
+        if self.sharded_output is None:
+            return
+        for shard in self.sharded_output.flush():
+            if IcingaReloader.is_configured():
+                self.reloader.changed(shard)
+
+    def reload(self):
+        LOG.info("Reloading configuration")
+        target_dir = self.target_dir
+        try:
+            reload_config()
+            urls = self.get_urls()
+        except Exception as e:
+            LOG.error("Reload failed, keeping the old configuration: %s" % e)
+            return
+        self.fetcher.close()
+        self.fetcher = HttpFetcher()
+        self.flush_shards()
+        # the metrics settings may have changed as well
+        metrics.export()
+        metrics.set_recorder(None)
+        if self.target_dir != target_dir:
+            self.header_index.save()
+            self.header_index = HeaderIndex.load(self.target_dir)
+        self.sharded_output = self._create_sharded_output()
+        self.set_urls(urls)
+
+    def request_reload(self, *_):
+        with self._condition:
+            self._reload_requested = True
+            self._condition.notify()
+
+    def stop(self, *_):
+        with self._condition:
+            self._stopped = True
+            self._condition.notify()
+
+    def start_listening(self):
+        """Serve notifications in a thread if an address to listen on is configured, returns the server"""
+        address = self.listen
+        if address is None:
+            return None
+        server = WebhookServer(address, self)
+        listener = threading.Thread(target=server.serve_forever, kwargs={'poll_interval': 0.5},
+                                    name='webhook')
+        listener.daemon = True
+        listener.start()
+        LOG.info("Listening for notifications on %s:%d" % server.server_address)
+        return server
+
+    def serve_forever(self):
+        self.start()
+        pool = ThreadPool(self.workers)
+        server = self.start_listening()
+        try:
+            while not self._stopped:
+                self.maintain()
+                self.dispatch_due(pool)
+                with self._condition:
+                    if not self._stopped:
+                        self._condition.wait(self.seconds_until_next_due())
+        finally:
+            if server is not None:
+                server.shutdown()
+                server.server_close()
+            LOG.info("Stopping, waiting for %d running hosts" % len(self._running))
+            pool.close()
+            pool.join()
+            self.flush_shards()
+            self.header_index.save()
+            self.fetcher.close()
+            self.reloader.reload()
+            metrics.export()
+
+
+def run_daemon():
+    from docopt import docopt
+    init_logging()
+    arg = docopt(__doc__, version='0.1.0')
+    if arg['--debug']:
+        set_log_level_to_debug()
+    daemon = Daemon(lambda: collect_urls(arg),
+                    arg['--debug'],
+                    arg['--targetdir'],
+                    arg['--skip-checks'],
+                    arg['--workers'],
+                    arg['--interval'],
+                    fsync=arg['--fsync'] or None,
+                    listen=arg['--listen'])
+    signal.signal(signal.SIGHUP, daemon.request_reload)
+    signal.signal(signal.SIGTERM, daemon.stop)
+    signal.signal(signal.SIGINT, daemon.stop)
+    daemon.serve_forever()
+
+
+if __name__ == '__main__':
+    run_daemon()
@@ -30,8 +30,16 @@ class ConfigurationContainsUndefinedVariables(IcingaCheckException):
     pass
 
 
+class CircularVariableDefinitionException(MonitoringConfigGeneratorException):
+    pass
+
+
 class NoSuchHostname(Exception):
     pass
 
 class HostUnreachableException(MonitoringConfigGeneratorException):
     pass
+
+
+class NotModifiedException(MonitoringConfigGeneratorException):
+    pass
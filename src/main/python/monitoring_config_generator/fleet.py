@@ -0,0 +1,213 @@
+"""monconfgenerator-fleet
+
+Creates the Icinga monitoring configuration for many hosts within a single
+process. Every URL is handled exactly like a single monconfgenerator run, but
+the runs share one interpreter and are executed by a bounded pool of workers.
+URLs are taken from the command line, from a file with one URL per line or from
+a file with one host name per line. Host names are turned into URLs using PORT
+and RESOURCE from /etc/monitoring_config_generator/config.yaml.
+A file name of '-' reads the list from stdin.
+If RELOAD_COMMAND or RELOAD_SIGNAL is set, Icinga is reloaded once at the end
+of the run if any file was written.
+With --profile every host is profiled and the profiles of the --profile-hosts
+slowest hosts are written into the given directory, as pstats and as stacks
+collapsed for flamegraph.pl. Profiling makes the run slower.
+
+Usage:
+  monconfgenerator-fleet [--debug] [--targetdir=<directory>] [--skip-checks] [--workers=<n>] [--fsync]
+                         [--url-file=<file>] [--host-file=<file>] [--profile=<directory>]
+                         [--profile-hosts=<n>] [URL...]
+  monconfgenerator-fleet -h
+
+Options:
+  -h                Show this message.
+  --debug           Print additional information.
+  --targetdir=DIR   The generated Icinga monitoring configuration is written
+                    into this directory. If no target directory is given its
+                    value is read from /etc/monitoring_config_generator/config.yaml
+  --skip-checks     Do not run checks on the yaml files received from the URLs.
+  --workers=N       Number of hosts processed concurrently. If not given its
+                    value is read from /etc/monitoring_config_generator/config.yaml
+  --fsync           Flush every written file to disk before it replaces the old one
+                    and sync the target directory once at the end of the run.
+                    Also enabled by FSYNC in /etc/monitoring_config_generator/config.yaml
+  --url-file=FILE   Read additional URLs from FILE, one per line.
+  --host-file=FILE  Read additional host names from FILE, one per line.
+  --profile=DIR     Write the profiles of the slowest hosts into DIR.
+  --profile-hosts=N  Number of slowest hosts to keep the profile of [default: 5].
+
+"""
+from datetime import datetime
+from multiprocessing.pool import ThreadPool
+import logging
+import sys
+
+from monitoring_config_generator import init_logging, metrics
+from monitoring_config_generator.MonitoringConfigGenerator import (run_generator,
+                                                                   EXIT_CODE_CONFIG_WRITTEN,
+                                                                   EXIT_CODE_ERROR,
+                                                                   EXIT_CODE_NOT_WRITTEN,
+                                                                   STATUS_UNCHANGED)
+from monitoring_config_generator.atomic_file import fsync_directory
+from monitoring_config_generator.header_index import HeaderIndex
+from monitoring_config_generator.icinga_reload import IcingaReloader
+from monitoring_config_generator.shards import ShardedOutput
+from monitoring_config_generator.settings import CONFIG
+from monitoring_config_generator.yaml_tools.fetcher import HttpFetcher
+
+
+LOG = logging.getLogger("monconfgenerator")
+
+
+def read_lines(file_name):
+    """Read a list file, skipping empty lines and comments. '-' means stdin"""
+    if file_name == '-':
+        lines = sys.stdin.readlines()
+    else:
+        with open(file_name) as list_file:
+            lines = list_file.readlines()
+    stripped_lines = [line.strip() for line in lines]
+    return [line for line in stripped_lines if line and not line.startswith('#')]
+
+
+def url_for_host(host_name):
+    return "http://%s:%s%s" % (host_name, CONFIG['PORT'], CONFIG['RESOURCE'])
+
+
+class FleetGenerator(object):
+    def __init__(self, urls, debug_enabled=False, target_dir=None, skip_checks=False, workers=None,
+                 fetcher=None, fsync=None, profiler=None):
+        self.urls = urls
+        self.debug_enabled = debug_enabled
+        self.target_dir = target_dir or CONFIG['TARGET_DIR']
+        self.skip_checks = skip_checks
+        self.workers = int(CONFIG['FLEET_WORKERS'] if workers is None else workers)
+        if self.workers < 1:
+            raise ValueError("Number of workers must be at least 1, got %d" % self.workers)
+        self.fetcher = fetcher
+        # a fetcher handed in is closed by its owner
+        self._owns_fetcher = fetcher is None
+        self.fsync = CONFIG['FSYNC'] if fsync is None else fsync
+        # profiles every host, a SlowestHosts keeps the slowest ones
+        self.profiler = profiler
+        self.header_index = None
+        self.sharded_output = None
+        self.written_shards = []
+
+    def _create_fetcher(self):
+        if self.fetcher is None:
+            self.fetcher = HttpFetcher()
+        return self.fetcher
+
+    def _generate_one(self, url):
+        return run_generator(url, self.debug_enabled, self.target_dir, self.skip_checks, self.profiler,
+                             fetcher=self.fetcher, header_index=self.header_index,
+                             fsync=self.fsync, sync_directory=False, sharded_output=self.sharded_output)
+
+    def generate(self):
+        """Run the generator for all URLs, returns one GenerationResult per URL in the given order"""
+        if not self.urls:
+            return []
+        self._create_fetcher()
+        self.header_index = HeaderIndex.load(self.target_dir)
+        if int(CONFIG['OUTPUT_SHARDS'] or 0) > 0:
+            self.sharded_output = ShardedOutput(self.target_dir, CONFIG['OUTPUT_SHARDS'], self.header_index,
+                                                self.fsync)
+        pool = ThreadPool(min(self.workers, len(self.urls)))
+        try:
+            results = pool.map(self._generate_one, self.urls, chunksize=1)
+        finally:
+            pool.close()
+            pool.join()
+            if self._owns_fetcher:
+                self.fetcher.close()
+                self.fetcher = None
+            if self.sharded_output is not None:
+                # every shard is written once for all of its changed hosts
+                self.written_shards = self.sharded_output.flush()
+            self.header_index.save()
+        if self.fsync and any(result.exit_code == EXIT_CODE_CONFIG_WRITTEN for result in results):
+            fsync_directory(self.target_dir)
+        return results
+
+    def written_files(self, results):
+        """the files written in the target directory, the shards with sharded output"""
+        if self.sharded_output is not None:
+            return self.written_shards
+        return [result.file_name for result in results if result.exit_code == EXIT_CODE_CONFIG_WRITTEN]
+
+    def reload_icinga(self, results, reloader=None):
+        """Reload Icinga once for all written files, returns True if it was reloaded"""
+        if not IcingaReloader.is_configured():
+            return False
+        reloader = reloader or IcingaReloader()
+        for file_name in self.written_files(results):
+            reloader.changed(file_name)
+        return reloader.reload()
+
+    @staticmethod
+    def exit_code(results):
+        """Aggregate exit code: error if any host failed, written if any host was written"""
+        exit_codes = set(result.exit_code for result in results)
+        if exit_codes - set([EXIT_CODE_CONFIG_WRITTEN, EXIT_CODE_NOT_WRITTEN]):
+            return EXIT_CODE_ERROR
+        if EXIT_CODE_CONFIG_WRITTEN in exit_codes:
+            return EXIT_CODE_CONFIG_WRITTEN
+        return EXIT_CODE_NOT_WRITTEN
+
+    @staticmethod
+    def summary(results):
+        written = len([r for r in results if r.exit_code == EXIT_CODE_CONFIG_WRITTEN])
+        unchanged = len([r for r in results if r.status == STATUS_UNCHANGED])
+        not_written = len([r for r in results if r.exit_code == EXIT_CODE_NOT_WRITTEN]) - unchanged
+        failed = len(results) - written - unchanged - not_written
+        return "%d hosts: %d written, %d unchanged, %d not written, %d failed" % (len(results), written, unchanged,
+                                                                                  not_written, failed)
+
+
+def collect_urls(arg):
+    urls = list(arg['URL'])
+    if arg['--url-file']:
+        urls.extend(read_lines(arg['--url-file']))
+    if arg['--host-file']:
+        urls.extend(url_for_host(host_name) for host_name in read_lines(arg['--host-file']))
+    return urls
+
+
+def generate_fleet_config():
+    from docopt import docopt
+    init_logging()
+    arg = docopt(__doc__, version='0.1.0')
+    profiler = None
+    if arg['--profile']:
+        from monitoring_config_generator.profiling import SlowestHosts
+        profiler = SlowestHosts(arg['--profile-hosts'])
+    start_time = datetime.now()
+    try:
+        fleet_generator = FleetGenerator(collect_urls(arg),
+                                         arg['--debug'],
+                                         arg['--targetdir'],
+                                         arg['--skip-checks'],
+                                         arg['--workers'],
+                                         fsync=arg['--fsync'] or None,
+                                         profiler=profiler)
+        results = fleet_generator.generate()
+        if profiler is not None:
+            profiler.write(arg['--profile'])
+        for result in results:
+            print "%s\t%s\t%s" % (result.exit_code, result.source, result.file_name or '-')
+        LOG.info(FleetGenerator.summary(results))
+        fleet_generator.reload_icinga(results)
+        exit_code = FleetGenerator.exit_code(results)
+    except BaseException as e:
+        LOG.error(e)
+        exit_code = EXIT_CODE_ERROR
+    finally:
+        stop_time = datetime.now()
+        LOG.info("finished in %s" % (stop_time - start_time))
+        metrics.export()
+    sys.exit(exit_code)
+
+
+if __name__ == '__main__':
+    generate_fleet_config()
@@ -0,0 +1,278 @@
+import fcntl
+import hashlib
+import json
+import logging
+import os
+import threading
+
+from monitoring_config_generator.atomic_file import write_atomically
+from monitoring_config_generator.shards import is_shard_file, read_blocks
+from monitoring_config_generator.yaml_tools.readers import Header
+
+
+INDEX_FILE_NAME = '.monconfgenerator-index.json'
+INDEX_LOCK_FILE_NAME = '.monconfgenerator-index.lock'
+INDEX_VERSION = 2
+CONFIG_SUFFIX = '.cfg'
+
+LOG = logging.getLogger("monconfgenerator")
+
+
+def content_hash(lines):
+    """sha1 of a generated config without the comment lines of its Header.
+
+    lines may or may not end with a newline, so it can be used for rendered lines and for lines read from a file"""
+    sha = hashlib.sha1()
+    in_header = True
+    for line in lines:
+        if in_header and line.startswith('#'):
+            continue
+        in_header = False
+        sha.update(line.rstrip('\n'))
+        sha.update('\n')
+    return sha.hexdigest()
+
+
+class HeaderIndex(object):
+    """Header, content hash and size of every config file in a target directory, kept in one file.
+
+    Freshness checks use the index instead of opening every generated config. The index also remembers
+    which config file was generated from which source URL, and the mtime and size of every file it
+    was built from. A missing or unreadable index is rebuilt from the headers of the config files;
+    files that were added, removed or changed by others since, e.g. edited by hand, are indexed again
+    on load. A single host run checks only the entries it looks up, fleet and daemon runs check the whole
+    directory. With sharded output the entries are still kept by the config file name of each host,
+    'shard' names the file the host is written to.
+
+    Several processes may work on the same target directory. save merges the changes of this index
+    into the index file as it is on disk, under a lock, so no process drops the entries of another."""
+
+    def __init__(self, target_dir, entries=None, sources=None, files=None):
+        self.target_dir = target_dir
+        self.entries = entries if entries is not None else {}
+        self.sources = sources if sources is not None else {}
+        # [mtime, size] of the files in the target directory when they were indexed or written
+        self.files = files if files is not None else {}
+        self.modified = False
+        # the keys changed since the last save, by the name of the dict they are in
+        self._changed = {'entries': set(), 'sources': set(), 'files': set()}
+        # the config file names whose entries were checked against the directory, None if all were
+        self._synced = None
+        self._lock = threading.Lock()
+
+    @property
+    def path(self):
+        return os.path.join(self.target_dir, INDEX_FILE_NAME)
+
+    @staticmethod
+    def config_file_names(target_dir):
+        try:
+            return set(name for name in os.listdir(target_dir) if name.endswith(CONFIG_SUFFIX))
+        except OSError:
+            return set()
+
+    @staticmethod
+    def indexed_files(entries):
+        """the files in the target directory the entries refer to"""
+        return set(entry.get('shard') or file_name for file_name, entry in entries.iteritems())
+
+    @staticmethod
+    def _read(index_path):
+        """the data of the index file, None if it is missing, unreadable or of another version"""
+        try:
+            with open(index_path) as index_file:
+                data = json.load(index_file)
+            if data['version'] == INDEX_VERSION:
+                return data
+            LOG.debug("Header index %s has version %s" % (index_path, data['version']))
+        except (IOError, ValueError, KeyError, TypeError) as e:
+            LOG.debug("Could not read header index %s: %s" % (index_path, e))
+        return None
+
+    @classmethod
+    def load(cls, target_dir, sync_all=True):
+        """The index of target_dir. Without sync_all an entry is checked against its file when it is looked up,
+        so a run generating a single host does not stat every file in the directory"""
+        data = cls._read(os.path.join(target_dir, INDEX_FILE_NAME))
+        if data is None:
+            return cls.rebuild(target_dir)
+        index = cls(target_dir, data['entries'], data['sources'], data['files'])
+        if sync_all:
+            index.sync_with_directory()
+        else:
+            index._synced = set()
+        return index
+
+    @classmethod
+    def rebuild(cls, target_dir):
+        LOG.info("Rebuilding header index of %s" % target_dir)
+        index = cls(target_dir)
+        for file_name in cls.config_file_names(target_dir):
+            index._index_file(file_name)
+        return index
+
+    def _stat(self, file_name):
+        """[mtime, size] of a file in the target directory, None if it does not exist"""
+        try:
+            stat = os.stat(os.path.join(self.target_dir, file_name))
+        except OSError:
+            return None
+        return [stat.st_mtime, stat.st_size]
+
+    def _set(self, kind, key, value):
+        """change a key of entries, sources or files, a value of None removes it. Called with the lock held"""
+        values = getattr(self, kind)
+        if values.get(key) == value:
+            return
+        if value is None:
+            del values[key]
+        else:
+            values[key] = value
+        self._changed[kind].add(key)
+        self.modified = True
+
+    def record_file(self, file_name):
+        """Remember the file in the target directory as it is now, after it was written"""
+        stat = self._stat(file_name)
+        with self._lock:
+            self._set('files', file_name, stat)
+
+    def _index_file(self, file_name):
+        path = os.path.join(self.target_dir, file_name)
+        # recorded before reading, a change while reading is found by the next sync
+        self.record_file(file_name)
+        if is_shard_file(file_name):
+            for host_file_name, block in read_blocks(path).iteritems():
+                lines = block.splitlines(True)
+                self.update(host_file_name, Header.from_lines(lines), content_hash(lines), len(block),
+                            shard=file_name, record_file=False)
+            return
+        try:
+            with open(path) as config_file:
+                lines = config_file.readlines()
+        except IOError:
+            return
+        self.update(file_name, Header.parse(path), content_hash(lines), sum(len(line) for line in lines),
+                    record_file=False)
+
+    def sync_with_directory(self):
+        """Index the config files that were added or changed by others and drop the ones that were removed.
+
+        A file counts as changed if its mtime or size differs from the time it was indexed or written.
+        The index is changed in place, so generators working with it concurrently don't lose their updates."""
+        stats = dict((file_name, self._stat(file_name)) for file_name in self.config_file_names(self.target_dir))
+        with self._lock:
+            changed = set(file_name for file_name, stat in stats.iteritems()
+                          if stat is not None and self.files.get(file_name) != stat)
+            for file_name, entry in self.entries.items():
+                indexed_file = entry.get('shard') or file_name
+                if stats.get(indexed_file) is None or indexed_file in changed:
+                    self._set('entries', file_name, None)
+            for file_name in self.files.keys():
+                if stats.get(file_name) is None:
+                    self._set('files', file_name, None)
+            changed |= set(stats) - self.indexed_files(self.entries)
+        for file_name in changed:
+            if stats[file_name] is not None:
+                self._index_file(file_name)
+        with self._lock:
+            for source, file_name in self.sources.items():
+                if file_name not in self.entries:
+                    self._set('sources', source, None)
+
+    def sync_file(self, file_name):
+        """Like sync_with_directory for the entry of a single config file, checks only its file or shard"""
+        with self._lock:
+            entry = self.entries.get(file_name)
+            indexed_file = entry.get('shard') or file_name if entry is not None else file_name
+            recorded = self.files.get(indexed_file)
+        stat = self._stat(indexed_file)
+        if stat is not None and stat == recorded:
+            return
+        with self._lock:
+            if entry is not None:
+                self._set('entries', file_name, None)
+            if stat is None and recorded is not None:
+                self._set('files', indexed_file, None)
+        if stat is not None:
+            self._index_file(indexed_file)
+
+    def _sync_once(self, file_name):
+        with self._lock:
+            if self._synced is None or file_name in self._synced:
+                return
+            self._synced.add(file_name)
+        self.sync_file(file_name)
+
+    def entry(self, file_name):
+        """A copy of the entry of the config file, None if it is unknown"""
+        self._sync_once(file_name)
+        with self._lock:
+            entry = self.entries.get(file_name)
+            return dict(entry) if entry is not None else None
+
+    def get(self, file_name):
+        """Header of the config file, an empty Header if it is unknown"""
+        entry = self.entry(file_name)
+        if entry is None:
+            return Header()
+        etag = str(entry['etag']) if entry['etag'] is not None else None
+        return Header(etag=etag, mtime=entry['mtime'])
+
+    def update_header(self, file_name, header):
+        """Record a new header for a file whose content did not change"""
+        with self._lock:
+            entry = self.entries[file_name]
+            if entry['etag'] != header.etag or entry['mtime'] != header.mtime:
+                self._set('entries', file_name, dict(entry, etag=header.etag, mtime=header.mtime))
+
+    def file_name_for_source(self, source):
+        with self._lock:
+            return self.sources.get(source)
+
+    def update(self, file_name, header, config_hash, size, source=None, shard=None, record_file=True):
+        """Record a written config, its file in the target directory is recorded as it is now"""
+        entry = {'etag': header.etag, 'mtime': header.mtime, 'hash': config_hash, 'size': size}
+        if shard:
+            entry['shard'] = shard
+        if record_file:
+            self.record_file(shard or file_name)
+        with self._lock:
+            self._set('entries', file_name, entry)
+        if source:
+            self.remember_source(source, file_name)
+
+    def remember_source(self, source, file_name):
+        with self._lock:
+            self._set('sources', source, file_name)
+
+    def _merge(self, data):
+        """Take everything from data, the index on disk, that was not changed here since the last save"""
+        for kind in 'entries', 'sources', 'files':
+            values, on_disk, changed = getattr(self, kind), data[kind], self._changed[kind]
+            for key in set(values) - set(on_disk) - changed:
+                del values[key]
+            for key, value in on_disk.iteritems():
+                if key not in changed:
+                    values[key] = value
+
+    def save(self):
+        """Merge the changes into the index file and replace it atomically. Failures are logged since the
+        index can always be rebuilt"""
+        with self._lock:
+            if not self.modified:
+                return
+            try:
+                with open(os.path.join(self.target_dir, INDEX_LOCK_FILE_NAME), 'a') as lock_file:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX)
+                    on_disk = self._read(self.path)
+                    if on_disk is not None:
+                        self._merge(on_disk)
+                    data = {'version': INDEX_VERSION, 'entries': self.entries, 'sources': self.sources,
+                            'files': self.files}
+                    write_atomically(self.path, json.dumps(data, separators=(',', ':')))
+                self.modified = False
+                for changed in self._changed.itervalues():
+                    changed.clear()
+            except (IOError, OSError) as e:
+                LOG.warn("Could not write header index %s: %s" % (self.path, e))
@@ -0,0 +1,123 @@
+"""Tells Icinga about changed configuration files, at most once per RELOAD_DEBOUNCE seconds.
+
+Either RELOAD_COMMAND is run or RELOAD_SIGNAL is sent to the process in RELOAD_PID_FILE. If
+RELOAD_PREFLIGHT is set, e.g. to 'icinga -v /etc/icinga/icinga.cfg', it is run first and Icinga
+is only reloaded if it succeeds. The commands get the path of a temporary file with the changed
+file names, one per line, in the environment variable MONCONFGENERATOR_CHANGED_FILES_LIST. A
+file and not the names themselves, a single environment variable is limited to 128 KiB on Linux.
+"""
+import logging
+import os
+import shlex
+import signal
+import subprocess
+import tempfile
+import threading
+import time
+
+from monitoring_config_generator.exceptions import MonitoringConfigGeneratorException
+from monitoring_config_generator.settings import CONFIG
+
+
+LOG = logging.getLogger("monconfgenerator")
+
+CHANGED_FILES_VARIABLE = 'MONCONFGENERATOR_CHANGED_FILES_LIST'
+
+
+def split_command(command):
+    """A command from config.yaml, either a list of arguments or a string split like a shell would"""
+    if isinstance(command, basestring):
+        return shlex.split(command)
+    return [str(argument) for argument in command]
+
+
+def signal_number(name):
+    """'SIGHUP', 'HUP' or 1 as signal number"""
+    if isinstance(name, int):
+        return name
+    name = str(name).upper()
+    number = getattr(signal, name if name.startswith('SIG') else 'SIG' + name, None)
+    if not isinstance(number, int):
+        raise MonitoringConfigGeneratorException("Unknown signal %r in RELOAD_SIGNAL" % name)
+    return number
+
+
+class IcingaReloader(object):
+    """Collects the changed files and reloads Icinga once for all files changed within a debounce window.
+
+    The window starts with the first change that was not reloaded yet. If the preflight or the
+    reload fails, the changed files are kept and the reload is tried again a window later.
+    The settings are read at the time of the reload, so a reloaded configuration takes effect."""
+
+    def __init__(self, clock=time.time):
+        self.clock = clock
+        self.changed_files = set()
+        self.first_change = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def is_configured():
+        return bool(CONFIG['RELOAD_COMMAND'] or CONFIG['RELOAD_SIGNAL'])
+
+    def changed(self, file_name):
+        with self._lock:
+            if self.first_change is None:
+                self.first_change = self.clock()
+            self.changed_files.add(file_name)
+
+    def seconds_until_due(self):
+        """None if nothing changed"""
+        with self._lock:
+            if self.first_change is None:
+                return None
+            return max(self.first_change + float(CONFIG['RELOAD_DEBOUNCE']) - self.clock(), 0)
+
+    def reload_if_due(self):
+        if self.seconds_until_due() == 0:
+            return self.reload()
+        return False
+
+    def reload(self):
+        """Reload now if anything changed, returns True if Icinga was reloaded"""
+        with self._lock:
+            changed_files = sorted(self.changed_files)
+            self.changed_files.clear()
+            self.first_change = None
+        if not changed_files or not self.is_configured():
+            return False
+        try:
+            self._preflight(changed_files)
+            self._reload(changed_files)
+        except Exception as e:
+            LOG.error("Icinga was not reloaded: %s" % e)
+            for file_name in changed_files:
+                self.changed(file_name)
+            return False
+        LOG.info("Icinga reloaded for %d changed files" % len(changed_files))
+        return True
+
+    @staticmethod
+    def _run(command, changed_files):
+        with tempfile.NamedTemporaryFile(prefix='monconfgenerator-changed-', suffix='.txt') as changed_files_list:
+            changed_files_list.write(''.join(file_name + '\n' for file_name in changed_files))
+            changed_files_list.flush()
+            environment = dict(os.environ)
+            environment[CHANGED_FILES_VARIABLE] = changed_files_list.name
+            process = subprocess.Popen(split_command(command), env=environment,
+                                       stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+            output = process.communicate()[0]
+        if process.returncode != 0:
+            raise MonitoringConfigGeneratorException("%s exited with %d: %s" %
+                                                     (command, process.returncode, output.strip()))
+
+    def _preflight(self, changed_files):
+        if CONFIG['RELOAD_PREFLIGHT']:
+            self._run(CONFIG['RELOAD_PREFLIGHT'], changed_files)
+
+    def _reload(self, changed_files):
+        if CONFIG['RELOAD_COMMAND']:
+            self._run(CONFIG['RELOAD_COMMAND'], changed_files)
+        else:
+            with open(CONFIG['RELOAD_PID_FILE']) as pid_file:
+                pid = int(pid_file.read().strip())
+            os.kill(pid, signal_number(CONFIG['RELOAD_SIGNAL']))
@@ -0,0 +1,237 @@
+"""Counters and histograms of the stages of a run, exported to a Prometheus textfile or to StatsD.
+
+METRICS in /etc/monitoring_config_generator/config.yaml selects the export:
+
+  prometheus  METRICS_TEXTFILE is replaced by the current values on every export, for the textfile
+              collector of the node exporter. Counters count since the start of the process.
+  statsd      counters and timings recorded since the last export are sent to METRICS_STATSD,
+              host:port, over UDP.
+
+Without METRICS nothing is recorded, every call ends in an empty method. Timings are recorded per
+host or file, never per service, so the instrumentation stays cheap also when enabled.
+"""
+import logging
+import socket
+import threading
+import time
+
+from monitoring_config_generator.atomic_file import write_atomically
+from monitoring_config_generator.settings import CONFIG
+
+
+LOG = logging.getLogger("monconfgenerator")
+
+# upper bounds in seconds, like the default buckets of the Prometheus client libraries
+HISTOGRAM_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# most StatsD servers take packets up to this size
+STATSD_PACKET_SIZE = 512
+
+
+class NullTimer(object):
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        return False
+
+NULL_TIMER = NullTimer()
+
+
+class NullRecorder(object):
+    """Records nothing, used when METRICS is not set"""
+    enabled = False
+
+    def increment(self, name, value=1):
+        pass
+
+    def observe(self, name, seconds):
+        pass
+
+    def timer(self, name):
+        return NULL_TIMER
+
+    def export(self):
+        pass
+
+
+class Timer(object):
+    def __init__(self, recorder, name):
+        self.recorder = recorder
+        self.name = name
+        self.start = None
+
+    def __enter__(self):
+        self.start = time.time()
+        return self
+
+    def __exit__(self, *_):
+        self.recorder.observe(self.name, time.time() - self.start)
+        return False
+
+
+class Histogram(object):
+    def __init__(self):
+        self.bucket_counts = [0] * len(HISTOGRAM_BUCKETS)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, seconds):
+        for position, bound in enumerate(HISTOGRAM_BUCKETS):
+            if seconds <= bound:
+                self.bucket_counts[position] += 1
+                break
+        self.count += 1
+        self.sum += seconds
+
+    def cumulative_counts(self):
+        counts, total = [], 0
+        for bucket_count in self.bucket_counts:
+            total += bucket_count
+            counts.append(total)
+        return counts
+
+
+class Recorder(NullRecorder):
+    """Keeps counters and histograms of seconds by name, shared by all threads"""
+    enabled = True
+
+    def __init__(self, prefix='monconfgenerator'):
+        self.prefix = prefix
+        self.counters = {}
+        self.histograms = {}
+        self._lock = threading.Lock()
+
+    def increment(self, name, value=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def observe(self, name, seconds):
+        with self._lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = Histogram()
+            histogram.observe(seconds)
+
+    def timer(self, name):
+        return Timer(self, name)
+
+
+class PrometheusTextfileRecorder(Recorder):
+    def __init__(self, path, prefix='monconfgenerator'):
+        Recorder.__init__(self, prefix)
+        self.path = path
+
+    def render(self):
+        lines = []
+        with self._lock:
+            for name in sorted(self.counters):
+                metric = '%s_%s_total' % (self.prefix, name)
+                lines.append('# TYPE %s counter' % metric)
+                lines.append('%s %d' % (metric, self.counters[name]))
+            for name in sorted(self.histograms):
+                histogram = self.histograms[name]
+                metric = '%s_%s' % (self.prefix, name)
+                lines.append('# TYPE %s histogram' % metric)
+                for bound, count in zip(HISTOGRAM_BUCKETS, histogram.cumulative_counts()):
+                    lines.append('%s_bucket{le="%s"} %d' % (metric, bound, count))
+                lines.append('%s_bucket{le="+Inf"} %d' % (metric, histogram.count))
+                lines.append('%s_sum %f' % (metric, histogram.sum))
+                lines.append('%s_count %d' % (metric, histogram.count))
+        return ''.join(line + '\n' for line in lines)
+
+    def export(self):
+        try:
+            write_atomically(self.path, self.render())
+        except (IOError, OSError) as e:
+            LOG.warn("Could not write metrics to %s: %s" % (self.path, e))
+
+
+class StatsdRecorder(Recorder):
+    """Sends what was recorded since the last export, timings one by one in milliseconds"""
+
+    def __init__(self, address, prefix='monconfgenerator'):
+        Recorder.__init__(self, prefix)
+        host, _, port = str(address).rpartition(':')
+        self.address = (host or 'localhost', int(port))
+        self.timings = []
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+    def observe(self, name, seconds):
+        Recorder.observe(self, name, seconds)
+        with self._lock:
+            self.timings.append((name, seconds))
+
+    def lines(self):
+        """the StatsD lines of everything recorded since the last call"""
+        with self._lock:
+            counters, self.counters = self.counters, {}
+            timings, self.timings = self.timings, []
+            self.histograms = {}
+        lines = ['%s.%s:%d|c' % (self.prefix, name, value) for name, value in sorted(counters.iteritems())]
+        lines.extend('%s.%s:%.3f|ms' % (self.prefix, name, seconds * 1000) for name, seconds in timings)
+        return lines
+
+    def export(self):
+        packet = []
+        for line in self.lines() + [None]:
+            if packet and (line is None or len('\n'.join(packet + [line])) > STATSD_PACKET_SIZE):
+                self._send('\n'.join(packet))
+                packet = []
+            if line is not None:
+                packet.append(line)
+
+    def _send(self, packet):
+        try:
+            self.socket.sendto(packet, self.address)
+        except socket.error as e:
+            LOG.debug("Could not send metrics to %s:%d: %s" % (self.address + (e,)))
+
+
+def create_recorder():
+    kind = CONFIG['METRICS']
+    prefix = CONFIG['METRICS_PREFIX']
+    if not kind:
+        return NullRecorder()
+    if kind == 'prometheus':
+        return PrometheusTextfileRecorder(CONFIG['METRICS_TEXTFILE'], prefix)
+    if kind == 'statsd':
+        return StatsdRecorder(CONFIG['METRICS_STATSD'], prefix)
+    LOG.warn("Unknown METRICS %r, use prometheus or statsd. Nothing is recorded" % kind)
+    return NullRecorder()
+
+
+_recorder = None
+_recorder_lock = threading.Lock()
+
+
+def recorder():
+    """the recorder selected by the settings, created on first use"""
+    global _recorder
+    if _recorder is None:
+        with _recorder_lock:
+            if _recorder is None:
+                _recorder = create_recorder()
+    return _recorder
+
+
+def set_recorder(new_recorder):
+    """Use new_recorder from now on, None selects it from the settings again, e.g. after they were reloaded"""
+    global _recorder
+    _recorder = new_recorder
+
+
+def increment(name, value=1):
+    recorder().increment(name, value)
+
+
+def observe(name, seconds):
+    recorder().observe(name, seconds)
+
+
+def timer(name):
+    """with timer(name): the seconds the block takes are added to the histogram name"""
+    return recorder().timer(name)
+
+
+def export():
+    recorder().export()
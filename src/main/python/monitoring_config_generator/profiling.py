@@ -0,0 +1,132 @@
+"""Profiles of generator runs: pstats files for pstats or snakeviz, and collapsed stacks for flamegraph.pl.
+
+cProfile records callers and callees, not complete stacks. The collapsed stacks are derived from
+them: every function starts from the profiled function and the time spent below a caller is split
+among the stacks it was called from in proportion to the time of each call site. For code that is
+called the same way from everywhere this gives the real stacks, otherwise a close approximation.
+"""
+import cProfile
+import heapq
+import logging
+import os
+import pstats
+import re
+import threading
+import time
+from collections import defaultdict
+
+from monitoring_config_generator.atomic_file import write_atomically
+
+
+LOG = logging.getLogger("monconfgenerator")
+
+COLLAPSED_SUFFIX = '.collapsed'
+PSTATS_SUFFIX = '.pstats'
+# deeper stacks are cut off, there is nothing to see in them on a flamegraph
+MAX_STACK_DEPTH = 100
+
+
+def frame_label(function):
+    file_name, line, name = function
+    if file_name == '~':
+        # built-in functions have no file
+        return name.replace(';', ',')
+    return ('%s (%s:%d)' % (name, os.path.basename(file_name), line)).replace(';', ',')
+
+
+def collapsed_stacks(stats):
+    """The lines of the collapsed stack file of pstats.Stats stats: frames separated by ';' and microseconds"""
+    callees = defaultdict(list)
+    for function, (_, _, _, _, callers) in stats.stats.iteritems():
+        for caller, (_, _, _, cumulative_time) in callers.iteritems():
+            callees[caller].append((function, cumulative_time))
+    roots = [function for function, (_, _, _, _, callers) in stats.stats.iteritems() if not callers]
+
+    microseconds = defaultdict(float)
+
+    def visit(function, stack, functions_on_stack, fraction):
+        _, _, total_time, cumulative_time, _ = stats.stats[function]
+        stack = stack + (frame_label(function),)
+        microseconds[';'.join(stack)] += total_time * fraction * 1e6
+        if len(stack) >= MAX_STACK_DEPTH:
+            return
+        for callee, call_site_time in callees[function]:
+            callee_time = stats.stats[callee][3]
+            # recursive calls are already part of the frame on the stack
+            if callee in functions_on_stack or callee_time <= 0:
+                continue
+            callee_fraction = fraction * min(call_site_time / callee_time, 1.0)
+            # stacks below a microsecond do not show up, and skipping them keeps the walk short
+            if callee_time * callee_fraction * 1e6 >= 1:
+                visit(callee, stack, functions_on_stack | frozenset([callee]), callee_fraction)
+
+    for root in roots:
+        visit(root, (), frozenset([root]), 1.0)
+    return ['%s %d' % (stack, round(value)) for stack, value in sorted(microseconds.iteritems()) if round(value) > 0]
+
+
+def write_profile(profile, path):
+    """Write the pstats of profile to path and its collapsed stacks next to it"""
+    stats = pstats.Stats(profile)
+    stats.dump_stats(path)
+    write_atomically(path + COLLAPSED_SUFFIX, "".join(line + "\n" for line in collapsed_stacks(stats)))
+    LOG.info("Profile written to %s and %s%s" % (path, path, COLLAPSED_SUFFIX))
+
+
+class Profiler(object):
+    """Profiles a single run and writes it to path"""
+
+    def __init__(self, path):
+        self.path = path
+
+    def run(self, name, function, *args, **kwargs):
+        profile = cProfile.Profile()
+        try:
+            return profile.runcall(function, *args, **kwargs)
+        finally:
+            write_profile(profile, self.path)
+
+
+class SlowestHosts(object):
+    """Profiles every run and keeps the profiles of the count slowest ones, for fleet runs.
+
+    Every worker thread profiles only itself, so the runs of other hosts do not show up in a profile.
+    Profiling makes every run slower, about twice as slow for pure Python code."""
+
+    def __init__(self, count):
+        self.count = int(count)
+        self._slowest = []
+        self._lock = threading.Lock()
+
+    def run(self, name, function, *args, **kwargs):
+        profile = cProfile.Profile()
+        start = time.time()
+        try:
+            return profile.runcall(function, *args, **kwargs)
+        finally:
+            self._keep(time.time() - start, name, profile)
+
+    def _keep(self, seconds, name, profile):
+        with self._lock:
+            if len(self._slowest) < self.count:
+                heapq.heappush(self._slowest, (seconds, name, profile))
+            elif self._slowest and seconds > self._slowest[0][0]:
+                heapq.heapreplace(self._slowest, (seconds, name, profile))
+
+    def slowest(self):
+        """(seconds, name, profile) of the kept runs, the slowest first"""
+        with self._lock:
+            return sorted(self._slowest, key=lambda kept: kept[0], reverse=True)
+
+    def write(self, directory):
+        """Write the kept profiles into directory, named by rank and host, returns the pstats paths"""
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        paths = []
+        for rank, (seconds, name, profile) in enumerate(self.slowest(), 1):
+            path = os.path.join(directory, '%02d-%s%s' % (rank, re.sub(r'[^\w.-]+', '_', name).strip('_'),
+                                                          PSTATS_SUFFIX))
+            LOG.info("%s took %.3f seconds" % (name, seconds))
+            write_profile(profile, path)
+            paths.append(path)
+        return paths
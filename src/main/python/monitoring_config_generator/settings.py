@@ -1,8 +1,9 @@
+from collections import MutableMapping
 import logging
 import os
-import sys
+import threading
 
-import yaml
+from monitoring_config_generator.yaml_tools.loader import safe_load
 
 
 LOG = logging.getLogger("monconfgenerator")
@@ -15,13 +16,40 @@ DEF_CONFIG = {'TARGET_DIR': '/etc/icinga/conf.d/generated',
               'META_KEYS': [],
               'PORT': "8935",
               'RESOURCE': "/monitoring",
+              'FLEET_WORKERS': 8,
+              'FSYNC': False,
+              'YAML_PARSE_WORKERS': 4,
+              'SERVICE_CACHE_HOSTS': None,
+              'DAEMON_INTERVAL': 300,
+              'DAEMON_JITTER': 0.1,
+              'DAEMON_MAX_BACKOFF': 3600,
+              'OUTPUT_SHARDS': 0,
+              'RELOAD_COMMAND': None,
+              'RELOAD_SIGNAL': None,
+              'RELOAD_PID_FILE': '/var/run/icinga/icinga.pid',
+              'RELOAD_PREFLIGHT': None,
+              'RELOAD_DEBOUNCE': 30,
+              'WEBHOOK_LISTEN': None,
+              'WEBHOOK_HOST': '127.0.0.1',
+              'WEBHOOK_TOKEN': None,
+              'WEBHOOK_MAX_BODY': 10 * 1024 * 1024,
+              'HTTP_CONNECT_TIMEOUT': 5,
+              'HTTP_READ_TIMEOUT': 30,
+              'HTTP_RETRIES': 2,
+              'HTTP_BACKOFF_FACTOR': 0.5,
+              'HTTP_MAX_CONNECTIONS': 32,
+              'HTTP_MAX_CONNECTIONS_PER_HOST': 2,
+              'HTTP_KEEPALIVE_HOSTS': 1024,
+              'METRICS': None,
+              'METRICS_TEXTFILE': '/var/lib/node_exporter/textfile_collector/monconfgenerator.prom',
+              'METRICS_STATSD': 'localhost:8125',
+              'METRICS_PREFIX': 'monconfgenerator',
 }
 
 CONFIG_FILE = '/etc/monitoring_config_generator/config.yaml'
 # get config file
 if 'MONITORING_CONFIG_GENERATOR_CONFIG' in os.environ and len(os.environ['MONITORING_CONFIG_GENERATOR_CONFIG']) > 0:
     CONFIG_FILE = os.environ['MONITORING_CONFIG_GENERATOR_CONFIG']
-    print 'Config file overridden in environment to: ' + CONFIG_FILE
 
 
 # directives in Icinga host- and service-definitions are mandatory, MonitoringConfigGenerator will check that
@@ -44,14 +72,78 @@ ICINGA_SERVICE_DIRECTIVES = ["host_name",
 def read_config(cfile=CONFIG_FILE):
     # merge defaults with config from config file
     if os.path.exists(cfile):
+        LOG.debug('Reading config file %s' % cfile)
         config_file = open(cfile)
-        new_config = yaml.load(config_file)
+        new_config = safe_load(config_file)
         config_file.close()
         CONFIG = dict(DEF_CONFIG.items() + new_config.items())
     else:
-        print >> sys.stderr, 'WARNING: config %s not found, using builtin defaults' % cfile
-        CONFIG = DEF_CONFIG
+        LOG.warn('config %s not found, using builtin defaults' % cfile)
+        CONFIG = dict(DEF_CONFIG)
     return CONFIG
 
 
-CONFIG = read_config()
+class LazyConfig(MutableMapping):
+    """The settings, read by load the first time they are used and not when this module is imported.
+
+    Behaves like the dict it replaces. Modules import it by name, so it is only ever changed in place."""
+
+    def __init__(self, load):
+        self._load = load
+        self._config = None
+        self._lock = threading.Lock()
+
+    @property
+    def loaded(self):
+        return self._config is not None
+
+    def _data(self):
+        if self._config is None:
+            with self._lock:
+                if self._config is None:
+                    self._config = self._load()
+        return self._config
+
+    def __getitem__(self, key):
+        return self._data()[key]
+
+    def __setitem__(self, key, value):
+        self._data()[key] = value
+
+    def __delitem__(self, key):
+        del self._data()[key]
+
+    def __iter__(self):
+        return iter(self._data())
+
+    def __len__(self):
+        return len(self._data())
+
+    def __contains__(self, key):
+        return key in self._data()
+
+    def get(self, key, default=None):
+        return self._data().get(key, default)
+
+    def clear(self):
+        self._data().clear()
+
+    def copy(self):
+        return dict(self._data())
+
+    def replace(self, new_config):
+        """Swap in all of new_config at once, a concurrent reader sees either the old or the new settings"""
+        with self._lock:
+            self._config = dict(new_config)
+
+    def __repr__(self):
+        return 'LazyConfig(%r)' % self._config if self.loaded else 'LazyConfig(not loaded)'
+
+
+def reload_config(cfile=None):
+    """Read the config file again. CONFIG is updated in place, so all modules that imported it see the new values"""
+    CONFIG.replace(read_config(cfile or CONFIG_FILE))
+    return CONFIG
+
+
+CONFIG = LazyConfig(read_config)
@@ -0,0 +1,146 @@
+"""Sharded output: the config of many hosts in OUTPUT_SHARDS files instead of one file per host.
+
+A host goes into the shard given by the hash of its config file name. In a shard every host has
+a block that starts with a '# Host: <file name>' line followed by the config exactly as it would
+be written to its own file, header included. The header index keeps an entry for every host, so
+freshness checks work as before.
+"""
+from collections import defaultdict
+from contextlib import contextmanager
+import fcntl
+import hashlib
+import logging
+import os
+import threading
+
+from monitoring_config_generator.atomic_file import write_atomically
+
+
+HOST_MARKER = '# Host: '
+SHARD_FILE_PREFIX = 'monconfgenerator-shard-'
+SHARD_FILE_SUFFIX = '.cfg'
+LOCK_FILE_NAME = '.monconfgenerator-shards.lock'
+
+LOG = logging.getLogger("monconfgenerator")
+
+
+def shard_file_name(file_name, shards):
+    """The shard of the host config file_name. sha1 and not hash(), so all processes agree"""
+    shard = int(hashlib.sha1(file_name).hexdigest()[:8], 16) % shards
+    return '%s%03d%s' % (SHARD_FILE_PREFIX, shard, SHARD_FILE_SUFFIX)
+
+
+def is_shard_file(name):
+    return name.startswith(SHARD_FILE_PREFIX) and name.endswith(SHARD_FILE_SUFFIX)
+
+
+def read_blocks(path):
+    """The blocks of a shard by host config file name, a missing shard has none"""
+    blocks = {}
+    file_name = None
+    try:
+        with open(path) as shard:
+            for line in shard:
+                if line.startswith(HOST_MARKER):
+                    file_name = line[len(HOST_MARKER):].rstrip('\n')
+                    blocks[file_name] = []
+                elif file_name is not None:
+                    blocks[file_name].append(line)
+    except IOError:
+        return {}
+    return dict((file_name, "".join(lines)) for file_name, lines in blocks.iteritems())
+
+
+def render_shard(blocks):
+    return "".join("%s%s\n%s" % (HOST_MARKER, file_name, blocks[file_name]) for file_name in sorted(blocks))
+
+
+@contextmanager
+def locked_shards(target_dir):
+    """Serializes the changes of shards in target_dir between processes"""
+    with open(os.path.join(target_dir, LOCK_FILE_NAME), 'a') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        yield
+
+
+def remove_from_shard(target_dir, shard, file_name, fsync=False):
+    """Remove the block of the host config file_name from shard, for a host that is written to its own file
+    again since OUTPUT_SHARDS was turned off. Returns True if the shard was written"""
+    with locked_shards(target_dir):
+        path = os.path.join(target_dir, shard)
+        blocks = read_blocks(path)
+        if blocks.pop(file_name, None) is None:
+            return False
+        write_atomically(path, render_shard(blocks), fsync=fsync)
+    LOG.debug("Removed %s from %s" % (file_name, path))
+    return True
+
+
+class ShardedOutput(object):
+    """Collects the configs of hosts and writes every shard containing a changed host once on flush.
+
+    The header index entry of a host is updated after its shard was written, so the index never
+    claims content that is not on disk. A host that moved to another shard, because OUTPUT_SHARDS
+    changed, is removed from its old shard, and its own config file is removed once it is in a
+    shard. Without OUTPUT_SHARDS the generator removes a host from its shard with remove_from_shard.
+    Flushes of different processes are serialized by a lock file in the target directory."""
+
+    def __init__(self, target_dir, shards, header_index, fsync=False):
+        self.target_dir = target_dir
+        self.shards = int(shards)
+        self.header_index = header_index
+        self.fsync = fsync
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+
+    def shard_file_name(self, file_name):
+        return shard_file_name(file_name, self.shards)
+
+    def put(self, file_name, content, header, config_hash):
+        """Queue the config of a host, content includes its header"""
+        with self._lock:
+            self._pending[file_name] = (content, header, config_hash)
+
+    def flush(self):
+        """Write all shards with queued hosts, returns the names of the written shards"""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return []
+        with self._flush_lock:
+            with locked_shards(self.target_dir):
+                return self._write_shards(pending)
+
+    def _write_shards(self, pending):
+        changed = defaultdict(dict)
+        moved = defaultdict(set)
+        for file_name, block in pending.iteritems():
+            shard = self.shard_file_name(file_name)
+            changed[shard][file_name] = block
+            old_shard = (self.header_index.entry(file_name) or {}).get('shard')
+            if old_shard and old_shard != shard:
+                moved[old_shard].add(file_name)
+
+        written = []
+        # hosts are added to their new shard before they are removed from the old one
+        for shard in sorted(changed) + sorted(set(moved) - set(changed)):
+            path = os.path.join(self.target_dir, shard)
+            blocks = read_blocks(path)
+            for file_name in moved[shard]:
+                blocks.pop(file_name, None)
+            for file_name, (content, _, _) in changed[shard].iteritems():
+                blocks[file_name] = content
+            write_atomically(path, render_shard(blocks), fsync=self.fsync)
+            written.append(shard)
+            LOG.debug("Created %s with %d hosts" % (path, len(blocks)))
+            for file_name, (content, header, config_hash) in changed[shard].iteritems():
+                self._remove_host_file(file_name)
+                self.header_index.update(file_name, header, config_hash, len(content), shard=shard)
+        return written
+
+    def _remove_host_file(self, file_name):
+        try:
+            os.remove(os.path.join(self.target_dir, file_name))
+        except OSError:
+            pass
@@ -0,0 +1,108 @@
+"""Embedded HTTP listener of monconfgenerator-daemon.
+
+POST /notify?host=<host name> (or ?url=<url>) asks the daemon to generate that host right away.
+POST /push?host=<host name> with the monitoring yaml (or JSON, msgpack) as body generates the host
+from the pushed document instead of downloading it. The host has to be one the daemon keeps up
+to date. If WEBHOOK_TOKEN is set, requests have to send it in the X-Monconfgenerator-Token header.
+"""
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from SocketServer import ThreadingMixIn
+import hashlib
+import hmac
+import logging
+import time
+import urlparse
+
+from monitoring_config_generator.settings import CONFIG
+from monitoring_config_generator.yaml_tools.readers import Header, http_date, is_host
+
+
+LOG = logging.getLogger("monconfgenerator")
+
+TOKEN_HEADER = 'X-Monconfgenerator-Token'
+
+
+def parse_listen_address(address):
+    """'host:port' or 'port', the host defaults to WEBHOOK_HOST"""
+    host, _, port = str(address).rpartition(':')
+    return host or CONFIG['WEBHOOK_HOST'], int(port)
+
+
+class PushedResponse(object):
+    """A pushed monitoring document, looking like the response of yaml-server"""
+    status_code = 200
+
+    def __init__(self, content, content_type=None):
+        self.content = content
+        self.headers = {'etag': '%s%s"' % (Header.PUSHED_ETAG_PREFIX, hashlib.sha1(content).hexdigest()),
+                        'last-modified': http_date(time.time())}
+        if content_type:
+            self.headers['content-type'] = content_type
+
+
+class PushedFetcher(object):
+    """Stands in for HttpFetcher and answers with the pushed document instead of asking the server"""
+
+    def __init__(self, response):
+        self.response = response
+
+    def get(self, url, headers=None):
+        return self.response
+
+
+class WebhookServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, generator_daemon):
+        HTTPServer.__init__(self, address, WebhookHandler)
+        self.generator_daemon = generator_daemon
+
+
+class WebhookHandler(BaseHTTPRequestHandler):
+    def log_message(self, message_format, *args):
+        LOG.debug("webhook %s: %s" % (self.client_address[0], message_format % args))
+
+    def answer(self, status, message):
+        self.send_response(status)
+        self.send_header('Content-Type', 'text/plain')
+        self.send_header('Content-Length', str(len(message) + 1))
+        self.end_headers()
+        self.wfile.write(message + '\n')
+
+    def authorized(self):
+        token = CONFIG['WEBHOOK_TOKEN']
+        return not token or hmac.compare_digest(str(token), self.headers.get(TOKEN_HEADER, ''))
+
+    def read_body(self):
+        """the request body, None after an error has been answered"""
+        length = self.headers.get('Content-Length')
+        if length is None or not length.isdigit():
+            self.answer(411, 'Content-Length required')
+            return None
+        if int(length) > int(CONFIG['WEBHOOK_MAX_BODY']):
+            self.answer(413, 'document too large')
+            return None
+        return self.rfile.read(int(length))
+
+    def do_POST(self):
+        request = urlparse.urlparse(self.path)
+        query = urlparse.parse_qs(request.query)
+        if not self.authorized():
+            return self.answer(403, 'wrong or missing %s' % TOKEN_HEADER)
+        if request.path not in ('/notify', '/push'):
+            return self.answer(404, 'use /notify or /push')
+        generator_daemon = self.server.generator_daemon
+        url = generator_daemon.find_url(host=query.get('host', [None])[0], url=query.get('url', [None])[0])
+        if url is None:
+            return self.answer(404, 'unknown host')
+
+        pushed = None
+        if request.path == '/push':
+            if not is_host(urlparse.urlparse(url)):
+                return self.answer(400, 'documents can only be pushed for http urls')
+            body = self.read_body()
+            if body is None:
+                return
+            pushed = PushedResponse(body, self.headers.get('Content-Type'))
+        generator_daemon.notify(url, pushed)
+        self.answer(202, 'queued %s' % url)
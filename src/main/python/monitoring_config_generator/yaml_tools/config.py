@@ -1,6 +1,7 @@
 import logging
 import re
 
+from monitoring_config_generator import metrics
 from monitoring_config_generator.exceptions import (UnknownSectionException,
                                                     MandatoryDirectiveMissingException,
                                                     HostNamesNotEqualException,
@@ -10,151 +11,200 @@ from monitoring_config_generator.exceptions import (UnknownSectionException,
 from monitoring_config_generator.settings import (ICINGA_HOST_DIRECTIVES,
                                                   ICINGA_SERVICE_DIRECTIVES)
 from monitoring_config_generator.yaml_tools.merger import dict_merge
+from monitoring_config_generator.yaml_tools.service_cache import CachedService
+from monitoring_config_generator.yaml_tools.variables import VariableResolver, VARIABLE_PATTERN
 
 
 SUPPORTED_SECTIONS = ['defaults', 'variables', 'host', 'services']
-VARIABLE_PATTERN = '\$\{[^}]+\}'
+
+
+UNDEFINED_VARIABLE = re.compile(VARIABLE_PATTERN)
+SERVICE_DIRECTIVES = frozenset(ICINGA_SERVICE_DIRECTIVES)
+SERVICE_DIRECTIVE_POSITIONS = dict((directive, position) for position, directive in enumerate(ICINGA_SERVICE_DIRECTIVES))
 
 
 class YamlConfig(object):
-    def __init__(self, yaml_config, skip_checks=False):
+    """Host and service definitions generated from a monitoring yaml.
+
+    Invalid configurations raise the first problem found. With report_all_errors the problems
+    found by the checks are collected in errors instead, so all of them can be reported at once."""
+
+    def __init__(self, yaml_config, skip_checks=False, service_cache=None, report_all_errors=False):
         self.logger = logging.getLogger("IcingaGenerator")
         self.yaml_config = yaml_config
         self.skip_checks = skip_checks
+        self.service_cache = service_cache
+        self.report_all_errors = report_all_errors
+        self.errors = []
         self.host = None
         self.services = []
+        # the services not taken from service_cache, only these have to be checked
+        self.generated_services = []
+        self._cached_services = {}
+        self.variables = None
+        self.defaults = None
         self.generate()
 
     @property
     def host_name(self):
         return self.host['host_name']
 
+    def _report(self, errors):
+        if errors and not self.report_all_errors:
+            raise errors[0]
+        self.errors.extend(errors)
+
     def run_pre_generation_checks(self):
         if not self.skip_checks:
             # check for unknown sections
             if self.yaml_config is not None:
-                for section in self.yaml_config:
-                    if not section in SUPPORTED_SECTIONS:
-                        raise UnknownSectionException("I don't know how to handle section '%s' " % section)
+                self._report([UnknownSectionException("I don't know how to handle section '%s' " % section)
+                              for section in self.yaml_config if section not in SUPPORTED_SECTIONS])
 
     def run_post_generation_checks(self):
-        if not self.skip_checks:
-            # check for all directives in host
-            for directive in ICINGA_HOST_DIRECTIVES:
-                if not directive in self.host:
-                    raise MandatoryDirectiveMissingException("Mandatory directive %s is missing from host-section" %
-                                                             directive)
-
-            # check for all directives in services
-            for directive in ICINGA_SERVICE_DIRECTIVES:
-                for service in self.services:
-                    if not directive in service:
-                        raise MandatoryDirectiveMissingException("Mandatory directive %s is missing from service %s" %
-                                                                 (directive, service))
-
-            # check host_name equal
-            all_host_names = set([service["host_name"] for service in self.services])
-            all_host_names.add(self.host["host_name"])
-
-            if len(all_host_names) > 1:
-                raise HostNamesNotEqualException("More than one host_name was generated: %s" % all_host_names)
-
-            # check service_description is unique
-            used_descriptions = set()
-            multiple_descriptions = set()
-
-            for service in self.services:
-                service_description = service["service_description"]
-                if service_description in used_descriptions:
-                    multiple_descriptions.add(service_description)
-                used_descriptions.add(service_description)
-
-            if len(multiple_descriptions) > 0:
-                raise ServiceDescriptionNotUniqueException("Service description %s used for more than one service" %
-                                                           multiple_descriptions)
+        self._report(self.validation_errors())
+
+    def validation_errors(self):
+        """Check the host and all services in a single pass over the services and return every problem found.
+
+        The problems are ordered like the checks used to raise them: missing host directives, missing
+        service directives, differing host names, duplicate service descriptions, undefined variables.
+        Only undefined variables are checked with skip_checks. Services taken from the service cache
+        passed the directive and variable checks before, they only take part in the host-wide checks."""
+        checks = not self.skip_checks
+        missing_in_host, missing_in_services = [], []
+        all_host_names, used_descriptions, multiple_descriptions = set(), set(), set()
+        undefined_variables = self._detect_undefined_variables(self.host)
+        if checks:
+            missing_in_host = [directive for directive in ICINGA_HOST_DIRECTIVES if directive not in self.host]
+            if 'host_name' in self.host:
+                all_host_names.add(self.host['host_name'])
+
+        generated = set(id(service) for service in self.generated_services)
+        for position, service in enumerate(self.services):
+            if id(service) in generated:
+                undefined_variables.update(self._detect_undefined_variables(service))
+                if checks:
+                    missing_in_services.extend((SERVICE_DIRECTIVE_POSITIONS[directive], position, directive)
+                                               for directive in SERVICE_DIRECTIVES.difference(service))
+            if checks:
+                # missing ones are already reported
+                if 'host_name' in service:
+                    all_host_names.add(service['host_name'])
+                if 'service_description' in service:
+                    service_description = service['service_description']
+                    if service_description in used_descriptions:
+                        multiple_descriptions.add(service_description)
+                    used_descriptions.add(service_description)
+
+        errors = [MandatoryDirectiveMissingException("Mandatory directive %s is missing from host-section" % directive)
+                  for directive in missing_in_host]
+        # in the order the directives were checked before: directive by directive, service by service
+        missing_in_services.sort()
+        errors.extend(MandatoryDirectiveMissingException("Mandatory directive %s is missing from service %s" %
+                                                         (directive, self.services[position]))
+                      for _, position, directive in missing_in_services)
+        if len(all_host_names) > 1:
+            errors.append(HostNamesNotEqualException("More than one host_name was generated: %s" % all_host_names))
+        if multiple_descriptions:
+            errors.append(ServiceDescriptionNotUniqueException("Service description %s used for more than one service" %
+                                                               multiple_descriptions))
+        if undefined_variables:
+            errors.append(ConfigurationContainsUndefinedVariables("Monitoring yaml contains undefined variables: '%s'" %
+                                                                  ', '.join(undefined_variables)))
+        return errors
 
     def _generate_monitoring_configuration(self, host_definition, service_definition):
-        self.generate_host_definition(host_definition)
-        self.generate_service_definitions(service_definition)
-        self.run_post_generation_checks()
-        self.configuration_contains_undefined_variables()
+        with metrics.timer('generate_seconds'):
+            self.generate_host_definition(host_definition)
+            self.generate_service_definitions(service_definition)
+        with metrics.timer('validate_seconds'):
+            self.run_post_generation_checks()
+        if self.service_cache is not None and not self.errors:
+            self.service_cache.replace(self.defaults, self._cached_services, checked=not self.skip_checks)
 
     def generate(self):
         self.run_pre_generation_checks()
 
+        # one resolver for all sections, so every variable is resolved only once
+        self.variables = VariableResolver(self.yaml_config.get('variables'))
+        self.defaults = self.generate_defaults()
+
         host_definition = self.yaml_config.get('host', {})
         service_definition = self.yaml_config.get("services", {})
 
         if service_definition:
             self._generate_monitoring_configuration(host_definition, service_definition)
+        metrics.increment('variable_expansions', self.variables.expansions)
+
+    def generate_defaults(self):
+        """merge and expand the defaults once, the host and every service start from a copy of them"""
+        defaults = {}
+        if 'defaults' in self.yaml_config:
+            dict_merge(defaults, self.yaml_config['defaults'])
+        self.apply_variables(defaults)
+        return defaults
 
     def generate_host_definition(self, host_definition):
         self.host = self.section_with_defaults(host_definition)
-        self.apply_variables(self.host)
+        self.apply_variables(self.host, host_definition.keys())
 
     def generate_service_definitions(self, service_definition):
         if not isinstance(service_definition, dict):
             raise MonitoringConfigGeneratorException("services must be a dict")
+        # cached services are only valid if they were generated with the same defaults, and checked if checks run
+        use_cache = (self.service_cache is not None and
+                     self.service_cache.is_usable(self.defaults, checked=not self.skip_checks))
         for yaml_service_id in sorted(service_definition.keys()):
-            self.services.append(self.generate_service_definition(service_definition[yaml_service_id], yaml_service_id))
+            yaml_service = service_definition[yaml_service_id]
+            cached = self.service_cache.lookup(yaml_service_id, yaml_service, self.variables) if use_cache else None
+            if cached is None:
+                definition = self.generate_service_definition(yaml_service, yaml_service_id)
+                self.generated_services.append(definition)
+                if self.service_cache is not None:
+                    cached = CachedService(yaml_service, self.referenced_variables(yaml_service, yaml_service_id),
+                                           definition)
+            else:
+                definition = cached.definition
+            self.services.append(definition)
+            if cached is not None:
+                self._cached_services[yaml_service_id] = cached
+
+    def referenced_variables(self, yaml_service, yaml_service_id):
+        """the value of every variable the expanded values of yaml_service refer to, None if undefined"""
+        names = set()
+        for value in yaml_service.values() + [yaml_service_id]:
+            if isinstance(value, str):
+                names.update(self.variables.referenced_names(value))
+        return dict((name, self.variables.get(name)) for name in names)
 
     def generate_service_definition(self, yaml_service, yaml_service_id):
         service_definition = self.section_with_defaults(yaml_service)
         service_definition["_service_id"] = yaml_service_id
-        self.apply_variables(service_definition)
+        self.apply_variables(service_definition, yaml_service.keys() + ["_service_id"])
         return service_definition
 
     def section_with_defaults(self, section):
-        new_section = {}
-        # put defaults in section first
-        if 'defaults' in self.yaml_config:
-            dict_merge(new_section, self.yaml_config['defaults'])
+        # put the already expanded defaults in section first, dict_merge leaves their values untouched
+        new_section = dict(self.defaults)
         # overwrite defaults with concrete values
         dict_merge(new_section, section)
         return new_section
 
-    def apply_variables(self, section):
-        variables = self.yaml_config.get('variables', {})
+    def apply_variables(self, section, keys=None):
+        """expand the variables in the values of the given keys, all keys by default"""
+        for key in (section.keys() if keys is None else keys):
+            value = section[key]
+            # yaml values are not always strings, they can be ints for instance
+            if isinstance(value, str):
+                section[key] = self.variables.expand(value)
 
-        sorted_keys = section.keys()
-        sorted_keys.sort()
-
-        while True:
-            variables_applied = False
-            for variable_name in variables.keys():
-                variable_syntax = "${%s}" % variable_name
-                variable_value = str(variables[variable_name])
-
-                # example for: x = 3:
-                # - variable_name == 'x'
-                # - variable_value == '3'
-                # - variable_syntax = '${x}'
-
-                for key in sorted_keys:
-                    value = section.get(key)
-                    # yaml values are not always strings, they can be ints for instance
-                    if isinstance(value, str) and variable_syntax in value:
-                        section[key] = value.replace(variable_syntax, variable_value)
-                        variables_applied = True
-
-            if not variables_applied:
-                break
-
-    def _detect_undefined_variables(self, settings):
+    @staticmethod
+    def _detect_undefined_variables(settings):
         undefined_variables = set()
-        for setting_key in settings:
-            variables = re.findall(VARIABLE_PATTERN, str(settings[setting_key]))
-            if variables:
-                undefined_variables.update(variables)
-
+        for value in settings.itervalues():
+            if not isinstance(value, str):
+                value = str(value)
+            if '${' in value:
+                undefined_variables.update(UNDEFINED_VARIABLE.findall(value))
         return undefined_variables
-
-    def configuration_contains_undefined_variables(self):
-        undefined_variables = set()
-        undefined_variables.update(self._detect_undefined_variables(self.host))
-        for settings_of_single_service in self.services:
-            undefined_variables.update(self._detect_undefined_variables(settings_of_single_service))
-        if undefined_variables:
-            raise ConfigurationContainsUndefinedVariables("Monitoring yaml contains undefined variables: '%s'" %
-                                                          ', '.join(undefined_variables))
-
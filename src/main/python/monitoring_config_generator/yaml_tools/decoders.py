@@ -0,0 +1,77 @@
+import json
+
+from monitoring_config_generator.exceptions import MonitoringConfigGeneratorException
+from monitoring_config_generator.yaml_tools.loader import safe_load
+
+
+JSON_TYPES = ['application/json', 'text/json']
+MSGPACK_TYPES = ['application/msgpack', 'application/x-msgpack']
+YAML_TYPES = ['application/x-yaml', 'application/yaml', 'text/yaml', 'text/x-yaml']
+
+_NOT_IMPORTED = object()
+_msgpack = _NOT_IMPORTED
+
+
+def msgpack_module():
+    """msgpack is optional and imported the first time it is needed, None if it is not installed"""
+    global _msgpack
+    if _msgpack is _NOT_IMPORTED:
+        try:
+            import msgpack
+        except ImportError:
+            msgpack = None
+        _msgpack = msgpack
+    return _msgpack
+
+
+def plain_strings(data):
+    """use str for strings that are pure ascii, like the yaml loader does, so all formats give the same config"""
+    if isinstance(data, dict):
+        return dict((plain_strings(key), plain_strings(value)) for key, value in data.iteritems())
+    if isinstance(data, list):
+        return [plain_strings(item) for item in data]
+    if isinstance(data, unicode):
+        try:
+            return data.encode('ascii')
+        except UnicodeEncodeError:
+            return data
+    return data
+
+
+def decode_json(content):
+    return plain_strings(json.loads(content))
+
+
+def decode_msgpack(content):
+    msgpack = msgpack_module()
+    if msgpack is None:
+        raise MonitoringConfigGeneratorException("Got msgpack, but the msgpack module is not installed")
+    return plain_strings(msgpack.unpackb(content, raw=False))
+
+
+def decode_yaml(content):
+    return safe_load(content)
+
+
+def accept_header():
+    """the formats we can decode, the cheaper ones preferred"""
+    types = ['application/json']
+    if msgpack_module() is not None:
+        types.append('application/x-msgpack;q=0.9')
+    types.extend(['%s;q=0.5' % media_type for media_type in YAML_TYPES])
+    types.append('*/*;q=0.1')
+    return ', '.join(types)
+
+
+def decoder_for(content_type):
+    media_type = (content_type or '').split(';')[0].strip().lower()
+    if media_type in JSON_TYPES or media_type.endswith('+json'):
+        return decode_json
+    if media_type in MSGPACK_TYPES:
+        return decode_msgpack
+    # yaml is what servers have always sent, whatever content type they announced
+    return decode_yaml
+
+
+def decode(content, content_type):
+    return decoder_for(content_type)(content)
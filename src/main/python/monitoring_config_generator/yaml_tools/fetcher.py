@@ -0,0 +1,60 @@
+import threading
+import urlparse
+
+from requests.adapters import HTTPAdapter
+from requests.packages.urllib3.util.retry import Retry
+import requests
+
+from monitoring_config_generator.settings import CONFIG
+
+
+RETRY_STATUS_CODES = (500, 502, 503, 504)
+
+
+class HttpFetcher(object):
+    """Fetches monitoring yaml from many hosts over a shared pool of keep-alive connections.
+
+    The number of requests in flight is capped globally and per host, every request
+    has a connect and a read timeout, and failed connections and 5xx answers are
+    retried with exponential backoff before giving up."""
+
+    def __init__(self, connect_timeout=None, read_timeout=None, retries=None, backoff_factor=None,
+                 max_connections=None, max_connections_per_host=None, keepalive_hosts=None):
+        def setting(value, name):
+            return CONFIG[name] if value is None else value
+
+        self.timeout = (setting(connect_timeout, 'HTTP_CONNECT_TIMEOUT'),
+                        setting(read_timeout, 'HTTP_READ_TIMEOUT'))
+        self.max_connections = int(setting(max_connections, 'HTTP_MAX_CONNECTIONS'))
+        self.max_connections_per_host = int(setting(max_connections_per_host, 'HTTP_MAX_CONNECTIONS_PER_HOST'))
+
+        retry = Retry(total=int(setting(retries, 'HTTP_RETRIES')),
+                      backoff_factor=float(setting(backoff_factor, 'HTTP_BACKOFF_FACTOR')),
+                      status_forcelist=RETRY_STATUS_CODES,
+                      raise_on_status=False)
+        adapter = HTTPAdapter(pool_connections=int(setting(keepalive_hosts, 'HTTP_KEEPALIVE_HOSTS')),
+                              pool_maxsize=self.max_connections_per_host,
+                              max_retries=retry)
+        self.session = requests.Session()
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+        self._connection_slots = threading.BoundedSemaphore(self.max_connections)
+        self._host_slots = {}
+        self._host_slots_lock = threading.Lock()
+
+    def _host_slot(self, url):
+        host = urlparse.urlparse(url).netloc
+        with self._host_slots_lock:
+            if host not in self._host_slots:
+                self._host_slots[host] = threading.BoundedSemaphore(self.max_connections_per_host)
+            return self._host_slots[host]
+
+    def get(self, url, headers=None):
+        """GET the url, raises the same requests exceptions as requests.get"""
+        with self._host_slot(url):
+            with self._connection_slots:
+                return self.session.get(url, headers=headers, timeout=self.timeout)
+
+    def close(self):
+        self.session.close()
@@ -0,0 +1,18 @@
+"""yaml is imported the first time something is parsed, runs that never parse yaml do without it"""
+
+_safe_loader = None
+
+
+def default_loader():
+    """the libyaml based loader is many times faster, PyYAML is not always built with it though"""
+    global _safe_loader
+    if _safe_loader is None:
+        import yaml
+        _safe_loader = getattr(yaml, 'CSafeLoader', None) or yaml.SafeLoader
+    return _safe_loader
+
+
+def safe_load(stream, loader=None):
+    """parse stream, a string or file, with the fastest safe loader available"""
+    import yaml
+    return yaml.load(stream, Loader=loader or default_loader())
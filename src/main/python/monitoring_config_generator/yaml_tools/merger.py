@@ -1,28 +1,109 @@
-import copy
+from multiprocessing.pool import ThreadPool
+import atexit
 import glob
 import os
-import yaml
+import threading
+
+from monitoring_config_generator.settings import CONFIG
+from monitoring_config_generator.yaml_tools.loader import safe_load
+
+
+def merged(a, b):
+    """returns the merge of b into a without changing a or b:
+    dicts are merged recursively, lists are concatenated and all other values of b replace the ones of a.
+    Values that don't take part in the merge are shared with a and b instead of being copied."""
+    if isinstance(a, dict) and isinstance(b, dict):
+        result = dict(a)
+        for key in b:
+            result[key] = merged(a[key], b[key]) if key in a else b[key]
+        return result
+    if isinstance(a, list) and isinstance(b, list):
+        return a + b
+    return b
 
 
 def dict_merge(a, b):
     """merges b into a
     based on http://stackoverflow.com/questions/7204805/python-dictionaries-of-dictionaries-merge
-    and extended to also merge arrays and to replace the content of keys with the same name"""
+    and extended to also merge arrays and to replace the content of keys with the same name.
+    Only a itself is changed: its nested values are replaced by merged copies and may be shared with b,
+    so the nested values of a and b must not be changed in place afterwards."""
     for key in b:
         if key in a:
-            if isinstance(a[key], dict) and isinstance(b[key], dict):
-                dict_merge(a[key], b[key])
-            elif isinstance(a[key], list) and isinstance(b[key], list):
-                a[key].extend(b[key])
-            else:
-                # use deepcopy cause b might be a list
-                a[key] = copy.deepcopy(b[key])
+            a[key] = merged(a[key], b[key])
         else:
-            # use deepcopy cause b might be a list
-            a[key] = copy.deepcopy(b[key])
+            a[key] = b[key]
+
+
+class FragmentCache(object):
+    """Parsed yaml files by device and inode, valid as long as mtime and size of the file are the same.
+
+    Fragments shared by many hosts, like common defaults, are parsed only once per process, also
+    if the hosts refer to them by symlinks or hardlinks. The cached documents are shared, which is
+    fine since merging never changes them."""
+
+    def __init__(self):
+        self._fragments = {}
+        # the inode every path was last loaded from, to forget files that were replaced
+        self._inodes = {}
+        self._lock = threading.Lock()
+
+    def load(self, path):
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+        inode = (stat.st_dev, stat.st_ino)
+        version = (stat.st_mtime, stat.st_size)
+        with self._lock:
+            cached = self._fragments.get(inode)
+        if cached is not None and cached[0] == version:
+            return cached[1]
+        with open(path) as yaml_file:
+            data = safe_load(yaml_file)
+        with self._lock:
+            replaced = self._inodes.get(path)
+            if replaced is not None and replaced != inode:
+                self._fragments.pop(replaced, None)
+            self._inodes[path] = inode
+            self._fragments[inode] = (version, data)
+        return data
+
+    def clear(self):
+        with self._lock:
+            self._fragments.clear()
+            self._inodes.clear()
+
+
+FRAGMENT_CACHE = FragmentCache()
+
+_parse_pool = None
+_parse_pool_pid = None
+_parse_pool_lock = threading.Lock()
+
+
+def _get_parse_pool():
+    global _parse_pool, _parse_pool_pid
+    with _parse_pool_lock:
+        # a forked process inherits the pool, but not its threads
+        if _parse_pool is None or _parse_pool_pid != os.getpid():
+            _parse_pool = ThreadPool(int(CONFIG['YAML_PARSE_WORKERS']))
+            _parse_pool_pid = os.getpid()
+        return _parse_pool
+
+
+@atexit.register
+def _close_parse_pool():
+    """stop the threads of the pool while the interpreter still works, they fail noisily during its shutdown"""
+    global _parse_pool
+    with _parse_pool_lock:
+        if _parse_pool is not None and _parse_pool_pid == os.getpid():
+            _parse_pool.close()
+            _parse_pool.join()
+        _parse_pool = None
 
 
 def merge_yaml_files(d):
+    """merge the yaml files in d, or the file d. The result shares values with the cached fragments,
+    so it must not be changed in place, YamlConfig copies every section it modifies"""
     data = {}
     files = []
     if os.path.isfile(d):
@@ -30,8 +111,13 @@ def merge_yaml_files(d):
     else:
         files = sorted(glob.glob(os.path.join(d, '*.yaml')))
 
-    for f in files:
-        new_data = yaml.safe_load(file(f))
+    if len(files) > 1 and int(CONFIG['YAML_PARSE_WORKERS']) > 1:
+        # parse in parallel, but merge in sorted order so the result stays the same
+        fragments = _get_parse_pool().map(FRAGMENT_CACHE.load, files)
+    else:
+        fragments = [FRAGMENT_CACHE.load(f) for f in files]
+
+    for new_data in fragments:
         dict_merge(data, new_data)
 
     return data
@@ -1,17 +1,29 @@
-import datetime
 import os
 import os.path
 import urlparse
 import socket
+from email.utils import formatdate, mktime_tz, parsedate_tz
 from time import localtime, strftime, time
 
-from requests.exceptions import RequestException, ConnectionError, Timeout
-import requests
-import yaml
-
-from monitoring_config_generator.exceptions import MonitoringConfigGeneratorException, HostUnreachableException
+from monitoring_config_generator import metrics
+from monitoring_config_generator.exceptions import MonitoringConfigGeneratorException, HostUnreachableException, \
+    NotModifiedException
+from monitoring_config_generator.settings import CONFIG
+from monitoring_config_generator.yaml_tools.decoders import accept_header, decode
 from monitoring_config_generator.yaml_tools.merger import merge_yaml_files
 
+
+def http_date(mtime):
+    """Format mtime like Last-Modified, in GMT"""
+    return formatdate(mtime, usegmt=True)
+
+
+def parse_http_date(value):
+    """The mtime of a Last-Modified value, the inverse of http_date, None if it is no date"""
+    parsed = parsedate_tz(value)
+    return mktime_tz(parsed) if parsed else None
+
+
 def is_file(parsed_uri):
     return parsed_uri.scheme in ['', 'file']
 
@@ -20,26 +32,43 @@ def is_host(parsed_uri):
     return parsed_uri.scheme in ['http', 'https']
 
 
-def read_config(uri):
+def read_config(uri, fetcher=None, header=None):
     uri_parsed = urlparse.urlparse(uri)
     if is_file(uri_parsed):
         return read_config_from_file(uri_parsed.path)
     elif is_host(uri_parsed):
-        return read_config_from_host(uri)
+        return read_config_from_host(uri, fetcher=fetcher, header=header)
     else:
         raise ValueError('Given url was not acceptable %s' % uri)
 
 
 def read_config_from_file(path):
-    yaml_config = merge_yaml_files(path)
+    with metrics.timer('parse_seconds'):
+        yaml_config = merge_yaml_files(path)
     etag = None
     mtime = os.path.getmtime(path)
     return yaml_config, Header(etag=etag, mtime=mtime)
 
 
-def read_config_from_host(url):
+def read_config_from_host(url, fetcher=None, header=None):
+    """Download the monitoring yaml, either with a single request or through the pool of a shared HttpFetcher.
+
+    If the header of the previously generated config is given, the request is made conditional
+    and NotModifiedException is raised when the server answers 304 Not Modified.
+    JSON and msgpack are asked for before yaml, the response is decoded according to its Content-Type."""
+    # imported here, reading files does not need requests
+    from requests.exceptions import RequestException, ConnectionError, Timeout
+    import requests
+
+    request_headers = header.conditional_headers() if header is not None else {}
+    request_headers['Accept'] = accept_header()
     try:
-        response = requests.get(url)
+        with metrics.timer('fetch_seconds'):
+            if fetcher is None:
+                response = requests.get(url, headers=request_headers,
+                                        timeout=(CONFIG['HTTP_CONNECT_TIMEOUT'], CONFIG['HTTP_READ_TIMEOUT']))
+            else:
+                response = fetcher.get(url, headers=request_headers)
     except socket.error as e:
         msg = "Could not open socket for '%s', error: %s" % (url, e)
         raise HostUnreachableException(msg)
@@ -57,12 +86,17 @@ def read_config_from_host(url):
         return response.headers[field] if field in response.headers else None
 
     if response.status_code == 200:
-        yaml_config = yaml.safe_load(response.content)
+        metrics.increment('bytes_fetched', len(response.content))
+        with metrics.timer('parse_seconds'):
+            yaml_config = decode(response.content, get_from_header('content-type'))
         etag = get_from_header('etag')
         if '\n' in etag:
             raise MonitoringConfigGeneratorException('Newline found in etag!')
         mtime = get_from_header('last-modified')
-        mtime = datetime.datetime.strptime(mtime, '%a, %d %b %Y %H:%M:%S %Z').strftime('%s') if mtime else int(time())
+        mtime = (parse_http_date(mtime) if mtime else None) or int(time())
+    elif response.status_code == 304:
+        metrics.increment('not_modified')
+        raise NotModifiedException("Request %s returned 304 Not Modified" % url)
     else:
         msg = "Request %s returned with status %s. I don't know how to handle that." % (url, response.status_code)
         raise MonitoringConfigGeneratorException(msg)
@@ -74,6 +108,8 @@ class Header(object):
     MON_CONF_GEN_COMMENT = '# Created by MonitoringConfigGenerator'
     ETAG_COMMENT = '# ETag: '
     MTIME_COMMMENT = '# MTime: '
+    # the ETag of a document pushed to the daemon starts with this, see webhook.PushedResponse
+    PUSHED_ETAG_PREFIX = '"push-'
 
     def __init__(self, etag=None, mtime=0):
         self.etag = etag
@@ -88,12 +124,31 @@ class Header(object):
     def __repr__(self):
         return "Header(%s, %d)" % (self.etag, self.mtime)
 
+    @property
+    def is_pushed(self):
+        """True if ETag and mtime are made up for a pushed document instead of coming from the server"""
+        return bool(self.etag) and self.etag.startswith(Header.PUSHED_ETAG_PREFIX)
+
     def is_newer_than(self, other):
+        # the server does not know the time of a push, whatever it answers next replaces the pushed config
+        if other.is_pushed:
+            return True
         if self.etag != other.etag or self.etag is None:
             return cmp(self.mtime, other.mtime) > 0
         else:
             return False
 
+    def conditional_headers(self):
+        """Request headers that let the server answer 304 if nothing changed since this header was created"""
+        headers = {}
+        if self.is_pushed:
+            return headers
+        if self.etag:
+            headers['If-None-Match'] = self.etag
+        if self.mtime:
+            headers['If-Modified-Since'] = http_date(self.mtime)
+        return headers
+
     def serialize(self):
         lines = []
         time_string = strftime("%Y-%m-%d %H:%M:%S", localtime())
@@ -106,6 +161,17 @@ class Header(object):
 
     @staticmethod
     def parse(file_name):
+        try:
+            with open(file_name, 'r') as config_file:
+                return Header.from_lines(config_file)
+        except IOError as e:
+            # it is totally fine to not have an etag, in that case there
+            # will just be no caching and the server will have to deliver the data again
+            return Header()
+
+    @staticmethod
+    def from_lines(lines):
+        """The Header written at the start of lines of a generated config"""
         etag, mtime = None, 0
 
         def extract(comment, current_value):
@@ -114,16 +180,9 @@ class Header(object):
                 value = line.rstrip()[len(comment):]
             return value or current_value
 
-        try:
-            with open(file_name, 'r') as config_file:
-                for line in config_file.xreadlines():
-                    etag = extract(Header.ETAG_COMMENT, etag)
-                    mtime = extract(Header.MTIME_COMMMENT, mtime)
-                    if etag and mtime:
-                        break
-        except IOError as e:
-            # it is totally fine to not have an etag, in that case there
-            # will just be no caching and the server will have to deliver the data again
-            pass
-        finally:
-            return Header(etag=etag, mtime=mtime)
+        for line in lines:
+            etag = extract(Header.ETAG_COMMENT, etag)
+            mtime = extract(Header.MTIME_COMMMENT, mtime)
+            if etag and mtime:
+                break
+        return Header(etag=etag, mtime=mtime)
@@ -0,0 +1,125 @@
+from collections import OrderedDict
+from contextlib import contextmanager
+import threading
+
+from monitoring_config_generator.settings import CONFIG
+
+
+def normalized(source):
+    """the yaml of a service in a form that tells apart values that render differently,
+    == does not: 1, 1.0 and True are all equal"""
+    return repr(source)
+
+
+class CachedService(object):
+    """A generated service definition, the yaml it was generated from and the resolved value of
+    every variable that yaml refers to. rendered is filled in when the definition is rendered"""
+
+    def __init__(self, source, variables, definition):
+        self.source = normalized(source)
+        self.variables = variables
+        self.definition = definition
+        self.rendered = None
+
+    def is_valid_for(self, source, resolver):
+        if normalized(source) != self.source:
+            return False
+        for name, value in self.variables.iteritems():
+            if resolver.get(name) != value:
+                return False
+        return True
+
+
+class ServiceCache(object):
+    """The services generated for one host in its previous run.
+
+    A service is generated, checked and rendered again only if its own yaml, the defaults or the
+    value of one of the variables it refers to changed. The other services are taken as they are.
+    defaults are the merged and expanded defaults all cached services were generated with, indent
+    is the INDENT all renderings were made with, both normalized. checked tells if the services passed the checks,
+    services generated with skip_checks are only taken by runs that skip the checks as well."""
+
+    def __init__(self):
+        self.defaults = None
+        self.checked = False
+        self.indent = None
+        self.services = {}
+        self._by_definition = {}
+
+    def lookup(self, service_id, source, resolver):
+        """the cached service for the yaml source of service_id if it is still valid, otherwise None.
+        The caller has to make sure the defaults did not change"""
+        cached = self.services.get(service_id)
+        if cached is None or not cached.is_valid_for(source, resolver):
+            return None
+        return cached
+
+    def is_usable(self, defaults, checked):
+        """True if the cached services were generated with defaults and checked if checks are required"""
+        return self.defaults == normalized(defaults) and (self.checked or not checked)
+
+    def replace(self, defaults, services, checked=True):
+        """remember the services of a successful run, a dict of service id to CachedService"""
+        self.defaults = normalized(defaults)
+        self.checked = checked
+        self.services = services
+        self._by_definition = dict((id(cached.definition), cached) for cached in services.itervalues())
+
+    def rendered(self, definition, indent, render):
+        """render(definition), the result is kept as long as definition is cached"""
+        if indent != self.indent:
+            for cached in self.services.itervalues():
+                cached.rendered = None
+            self.indent = indent
+        cached = self._by_definition.get(id(definition))
+        if cached is None or cached.definition is not definition:
+            return render(definition)
+        if cached.rendered is None:
+            cached.rendered = render(definition)
+        return cached.rendered
+
+
+class ServiceCaches(object):
+    """The ServiceCache of the max_hosts most recently generated sources.
+
+    Only the daemon generates a source more than once, a single or fleet run would pay for caches
+    that are never used. So the caches are off until enable is called with the number of sources
+    that are generated over and over. A cache is handed out to one generator at a time. If the
+    same source is generated concurrently, the second generator starts with an empty cache."""
+
+    def __init__(self):
+        self.max_hosts = 0
+        self._caches = OrderedDict()
+        self._lock = threading.Lock()
+
+    def enable(self, hosts):
+        """Keep the caches of hosts sources, SERVICE_CACHE_HOSTS overrides the number if set, 0 turns them off"""
+        configured = CONFIG['SERVICE_CACHE_HOSTS']
+        with self._lock:
+            self.max_hosts = int(hosts if configured is None else configured)
+            self._trim()
+
+    def _trim(self):
+        while len(self._caches) > max(self.max_hosts, 0):
+            self._caches.popitem(last=False)
+
+    @contextmanager
+    def cache_for(self, source):
+        if self.max_hosts < 1:
+            yield None
+            return
+        with self._lock:
+            cache = self._caches.pop(source, None) or ServiceCache()
+        try:
+            yield cache
+        finally:
+            with self._lock:
+                self._caches[source] = cache
+                self._trim()
+
+    def clear(self):
+        with self._lock:
+            self._caches.clear()
+
+
+SERVICE_CACHES = ServiceCaches()
@@ -0,0 +1,65 @@
+import re
+
+from monitoring_config_generator.exceptions import CircularVariableDefinitionException
+
+
+# also used by config to find references that were left undefined
+VARIABLE_PATTERN = '\$\{[^}]+\}'
+VARIABLE_REFERENCE = re.compile(VARIABLE_PATTERN)
+
+
+def variable_name(reference):
+    """name of the variable ${name} refers to"""
+    return reference[2:-1]
+
+
+class VariableResolver(object):
+    """Substitutes ${name} with the value of the variable name.
+
+    Variables may refer to other variables. Every variable is resolved at most once, the first
+    time it is referenced, and the result is remembered, so each value is expanded in a single
+    regex pass. References to unknown variables are left untouched."""
+
+    def __init__(self, variables):
+        # variables are substituted as strings, also their names: ${5} refers to the variable 5
+        self.variables = dict((str(name), value) for name, value in (variables or {}).items())
+        self.resolved = {}
+        self._resolving = []
+        # values that contained a reference, reported as metric once per config
+        self.expansions = 0
+
+    def __getitem__(self, name):
+        if name not in self.resolved:
+            if name in self._resolving:
+                cycle = self._resolving[self._resolving.index(name):] + [name]
+                raise CircularVariableDefinitionException("Variables refer to each other in a circle: %s" %
+                                                          ' -> '.join(cycle))
+            self._resolving.append(name)
+            try:
+                self.resolved[name] = self.expand(str(self.variables[name]))
+            finally:
+                self._resolving.pop()
+        return self.resolved[name]
+
+    def get(self, name, default=None):
+        """the resolved value of variable name, default if there is no such variable"""
+        if name in self.variables:
+            return self[name]
+        return default
+
+    def referenced_names(self, value):
+        if '${' not in value:
+            return set()
+        return set(variable_name(reference) for reference in VARIABLE_REFERENCE.findall(value))
+
+    def _substitute(self, match):
+        name = variable_name(match.group(0))
+        if name in self.variables:
+            return self[name]
+        return match.group(0)
+
+    def expand(self, value):
+        if '${' not in value:
+            return value
+        self.expansions += 1
+        return VARIABLE_REFERENCE.sub(self._substitute, value)
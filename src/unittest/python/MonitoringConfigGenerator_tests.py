@@ -8,7 +8,8 @@ from mock import patch, Mock
 os.environ['MONITORING_CONFIG_GENERATOR_CONFIG'] = "testdata/testconfig.yaml"
 from monitoring_config_generator.settings import CONFIG
 from monitoring_config_generator.yaml_tools.readers import Header
-from monitoring_config_generator.MonitoringConfigGenerator import MonitoringConfigGenerator
+from monitoring_config_generator.MonitoringConfigGenerator import MonitoringConfigGenerator, STATUS_WRITTEN, \
+    STATUS_UNCHANGED, STATUS_UP_TO_DATE
 from monitoring_config_generator.exceptions import *
 from test_logger import init_test_logger
 
@@ -34,6 +35,10 @@ class TestMonitoringConfigGeneratorConstructor(unittest.TestCase):
 
 
 class TestMonitoringConfigGeneratorGenerate(unittest.TestCase):
+    def setUp(self):
+        shutil.rmtree(CONFIG["TARGET_DIR"], True)
+        os.mkdir(CONFIG["TARGET_DIR"])
+
     @patch('monitoring_config_generator.MonitoringConfigGenerator.read_config')
     def test_empty_yaml_source_raises_syste_exit(self, read_config_mock):
         read_config_mock.return_value = (None, None)
@@ -41,6 +46,28 @@ class TestMonitoringConfigGeneratorGenerate(unittest.TestCase):
         mcg = MonitoringConfigGenerator(target_uri)
         self.assertRaises(SystemExit, mcg.generate)
 
+    @patch('monitoring_config_generator.MonitoringConfigGenerator.YamlConfig')
+    @patch('monitoring_config_generator.MonitoringConfigGenerator.read_config')
+    def test_returns_none_if_the_source_was_not_modified(self, read_config_mock, yaml_config_mock):
+        read_config_mock.side_effect = NotModifiedException
+        mcg = MonitoringConfigGenerator('http://example.com:8935/monitoring')
+        self.assertEquals(None, mcg.generate())
+        self.assertFalse(yaml_config_mock.called)
+
+    @patch('monitoring_config_generator.MonitoringConfigGenerator.read_config')
+    def test_passes_header_of_previous_run_for_host_urls(self, read_config_mock):
+        read_config_mock.side_effect = NotModifiedException
+        with open(os.path.join(CONFIG['TARGET_DIR'], 'example.com.cfg'), 'w') as f:
+            f.write('\n'.join(Header(etag='abc', mtime=1).serialize()))
+        MonitoringConfigGenerator('http://example.com:8935/monitoring').generate()
+        self.assertEquals(Header(etag='abc', mtime=1), read_config_mock.call_args[1]['header'])
+
+    @patch('monitoring_config_generator.MonitoringConfigGenerator.read_config')
+    def test_passes_no_header_for_files(self, read_config_mock):
+        read_config_mock.side_effect = NotModifiedException
+        MonitoringConfigGenerator('/path/to/example.com.yaml').generate()
+        self.assertEquals(None, read_config_mock.call_args[1]['header'])
+
     @patch('monitoring_config_generator.MonitoringConfigGenerator.YamlConfig')
     @patch('monitoring_config_generator.MonitoringConfigGenerator.read_config')
     def test_unexpanded_variables_raises_an_error(self, read_config_mock, yaml_config_mock):
@@ -126,6 +153,42 @@ class TestMonitoringConfigGeneratorGenerate(unittest.TestCase):
         self.assertEquals(None, mcg.generate())
 
 
+class TestUnchangedConfigIsNotWritten(unittest.TestCase):
+    def setUp(self):
+        shutil.rmtree(CONFIG["TARGET_DIR"], True)
+        os.mkdir(CONFIG["TARGET_DIR"])
+        self.yaml_file = os.path.abspath('testdata/itest_testhost03_new_format/testhost03.yaml')
+        self.output_path = os.path.join(CONFIG["TARGET_DIR"], 'testhost03.cfg')
+
+    @patch('os.path.getmtime')
+    def generate(self, mtime, getmtime_mock):
+        getmtime_mock.return_value = mtime
+        generator = MonitoringConfigGenerator(self.yaml_file)
+        return generator.generate(), generator.status
+
+    def test_newer_source_with_same_content_is_not_written(self):
+        self.assertEquals(('testhost03.cfg', STATUS_WRITTEN), self.generate(1))
+        with open(self.output_path) as output_file:
+            first_content = output_file.read()
+
+        self.assertEquals((None, STATUS_UNCHANGED), self.generate(2))
+
+        with open(self.output_path) as output_file:
+            self.assertEquals(first_content, output_file.read())
+
+    def test_new_header_of_unchanged_config_is_remembered(self):
+        self.generate(1)
+        self.generate(2)
+        self.assertEquals((None, STATUS_UP_TO_DATE), self.generate(2))
+
+    def test_config_edited_by_hand_is_written_again(self):
+        self.generate(1)
+        with open(self.output_path, 'a') as output_file:
+            output_file.write('# edited by hand\n')
+
+        self.assertEquals(('testhost03.cfg', STATUS_WRITTEN), self.generate(2))
+
+
 class Test(unittest.TestCase):
     def setUp(self):
         self.testDir = "testdata"
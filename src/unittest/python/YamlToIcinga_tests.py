@@ -1,9 +1,40 @@
 import os
+import shutil
 import unittest
-from mock import Mock
+from hypothesis import given, strategies
+from mock import Mock, patch
 
 os.environ['MONITORING_CONFIG_GENERATOR_CONFIG'] = "testdata/testconfig.yaml"
-from monitoring_config_generator.MonitoringConfigGenerator import YamlToIcinga
+from monitoring_config_generator.MonitoringConfigGenerator import YamlToIcinga, OutputWriter
+from monitoring_config_generator.header_index import content_hash
+from monitoring_config_generator.settings import CONFIG
+from monitoring_config_generator.yaml_tools.config import YamlConfig
+from monitoring_config_generator.yaml_tools.readers import Header, read_config_from_file
+
+
+def render_lines_in_memory(yaml_config, header):
+    """how YamlToIcinga rendered the config before it streamed, as reference"""
+    lines = list(header.serialize())
+    for section_name, sections in ('host', [yaml_config.host]), ('service', yaml_config.services):
+        for section_data in sections:
+            lines.append("")
+            lines.append("define %s {" % section_name)
+            for key in sorted(section_data.keys()):
+                lines.append("%s%-45s%s" % (CONFIG['INDENT'], key, YamlToIcinga.value_to_icinga(section_data[key])))
+            lines.append("}")
+    return "".join([line + "\n" for line in lines])
+
+
+# printable ascii without the forbidden characters, a str like the yaml loader returns
+texts = strategies.text(alphabet=[chr(c) for c in range(32, 127) if chr(c) != '}'], max_size=8).map(str)
+scalars = strategies.none() | strategies.booleans() | strategies.integers() | strategies.floats() | texts
+values = scalars | strategies.lists(scalars, max_size=4)
+sections = strategies.dictionaries(texts | strategies.integers(), values, max_size=6)
+
+
+def testhost03():
+    yaml_config, _ = read_config_from_file('testdata/itest_testhost03_new_format/testhost03.yaml')
+    return YamlConfig(yaml_config)
 
 
 class Test(unittest.TestCase):
@@ -25,6 +56,10 @@ class Test(unittest.TestCase):
         self.assertEquals(",,,", YamlToIcinga.value_to_icinga([None, None, None, None]))
         self.assertEquals(",23,42,", YamlToIcinga.value_to_icinga([None, "23", 42, None]))
 
+    @staticmethod
+    def render(config, header):
+        return "".join(YamlToIcinga(config, header).sections())
+
     def _get_config_mock(self, host=None, services=None):
         config = Mock()
         config.host = host or {}
@@ -42,11 +77,86 @@ class Test(unittest.TestCase):
         for forbidden in '\n', '}':
             # Forbidden character in 'host' section.
             config = self._get_config_mock(host={'key': 'xx%syy' % forbidden})
-            self.assertRaises(Exception, YamlToIcinga, config, header)
+            self.assertRaises(Exception, self.render, config, header)
             config = self._get_config_mock(host={'xx%syy' % forbidden: "value"})
-            self.assertRaises(Exception, YamlToIcinga, config, header)
+            self.assertRaises(Exception, self.render, config, header)
 
             config = self._get_config_mock(services={'foo': 'xx%syy' % forbidden})
-            self.assertRaises(Exception, YamlToIcinga, config, header)
+            self.assertRaises(Exception, self.render, config, header)
             config = self._get_config_mock(services={'xx%syy' % forbidden: "value"})
-            self.assertRaises(Exception, YamlToIcinga, config, header)
+            self.assertRaises(Exception, self.render, config, header)
+
+    def test_renders_the_same_bytes_as_before(self):
+        yaml_config, header = testhost03(), Header(etag='abc', mtime=1234)
+        self.assertEquals(render_lines_in_memory(yaml_config, header), self.render(yaml_config, header))
+
+    @given(sections, strategies.lists(sections, max_size=4))
+    def test_renders_the_same_bytes_as_before_for_any_section(self, host, services):
+        config, header = Mock(host=host, services=services), Header(etag='abc', mtime=1234)
+        self.assertEquals(render_lines_in_memory(config, header), self.render(config, header))
+
+    def test_value_to_icinga_list_of_unicode(self):
+        self.assertEquals("a,b", YamlToIcinga.value_to_icinga([u"a", "b"]))
+        self.assertIs(str, type(YamlToIcinga.value_to_icinga([u"a", "b"])))
+        self.assertRaises(UnicodeEncodeError, YamlToIcinga.value_to_icinga, [u"\xe4"])
+
+    def test_renders_one_chunk_per_section(self):
+        yaml_config = testhost03()
+        sections = list(YamlToIcinga(yaml_config, Header(etag='abc')).sections())
+        self.assertEquals(2 + len(yaml_config.services), len(sections))
+        self.assertTrue(sections[1].startswith("\ndefine host {\n"))
+
+    def test_icinga_lines(self):
+        yaml_config, header = testhost03(), Header(etag='abc', mtime=1234)
+        self.assertEquals(render_lines_in_memory(yaml_config, header).split("\n")[:-1],
+                          YamlToIcinga(yaml_config, header).icinga_lines)
+
+
+class TestOutputWriterWriteConfig(unittest.TestCase):
+    def setUp(self):
+        shutil.rmtree(CONFIG["TARGET_DIR"], True)
+        os.mkdir(CONFIG["TARGET_DIR"])
+        self.path = os.path.join(CONFIG["TARGET_DIR"], 'testhost03.cfg')
+        self.yaml_icinga = YamlToIcinga(testhost03(), Header(etag='abc', mtime=1234))
+
+    def read(self):
+        with open(self.path) as written_file:
+            return written_file.read()
+
+    def test_writes_the_config_and_returns_hash_and_size(self):
+        written, config_hash, size = OutputWriter(self.path).write_config(self.yaml_icinga)
+        self.assertTrue(written)
+        content = self.read()
+        self.assertEquals(content, "".join(self.yaml_icinga.sections()))
+        self.assertEquals(content_hash(content.splitlines(True)), config_hash)
+        self.assertEquals(len(content), size)
+
+    def test_keeps_the_old_file_if_unchanged(self):
+        with open(self.path, 'w') as old_file:
+            old_file.write('old\n')
+        written, config_hash, _ = OutputWriter(self.path).write_config(self.yaml_icinga, is_unchanged=lambda h: True)
+        self.assertFalse(written)
+        self.assertEquals('old\n', self.read())
+        self.assertEquals(['testhost03.cfg'], os.listdir(CONFIG["TARGET_DIR"]))
+
+    def test_unchanged_config_does_not_touch_the_disk(self):
+        with patch('monitoring_config_generator.MonitoringConfigGenerator.AtomicFile') as atomic_file_mock:
+            written, config_hash, size = OutputWriter(self.path).write_config(self.yaml_icinga,
+                                                                              is_unchanged=lambda h: True)
+        self.assertFalse(written)
+        self.assertFalse(atomic_file_mock.called)
+        self.assertEquals((config_hash, size), OutputWriter(self.path).write_config(self.yaml_icinga)[1:])
+
+    def test_writes_the_config_if_changed(self):
+        written, config_hash, _ = OutputWriter(self.path).write_config(self.yaml_icinga, is_unchanged=lambda h: False)
+        self.assertTrue(written)
+        self.assertEquals("".join(self.yaml_icinga.sections()), self.read())
+        self.assertEquals(content_hash(self.read().splitlines(True)), config_hash)
+
+    def test_keeps_the_old_file_if_rendering_fails(self):
+        with open(self.path, 'w') as old_file:
+            old_file.write('old\n')
+        config = Mock(host={'key': 'value'}, services=[{'key': 'forbidden }'}])
+        self.assertRaises(Exception, OutputWriter(self.path).write_config, YamlToIcinga(config, Header()))
+        self.assertEquals('old\n', self.read())
+        self.assertEquals(['testhost03.cfg'], os.listdir(CONFIG["TARGET_DIR"]))
@@ -0,0 +1,75 @@
+import os
+import shutil
+import stat
+import unittest
+
+from mock import patch
+
+os.environ['MONITORING_CONFIG_GENERATOR_CONFIG'] = "testdata/testconfig.yaml"
+from monitoring_config_generator.settings import CONFIG
+from monitoring_config_generator.atomic_file import write_atomically, fsync_directory, FILE_MODE
+from monitoring_config_generator.MonitoringConfigGenerator import OutputWriter
+
+
+class TestWriteAtomically(unittest.TestCase):
+    def setUp(self):
+        self.target_dir = CONFIG["TARGET_DIR"]
+        shutil.rmtree(self.target_dir, True)
+        os.mkdir(self.target_dir)
+        self.path = os.path.join(self.target_dir, 'host.cfg')
+
+    def read(self):
+        with open(self.path) as written_file:
+            return written_file.read()
+
+    def test_replaces_the_file_without_leaving_temporary_files(self):
+        write_atomically(self.path, 'old\n')
+        write_atomically(self.path, 'new\n')
+        self.assertEquals('new\n', self.read())
+        self.assertEquals(['host.cfg'], os.listdir(self.target_dir))
+
+    def test_uses_the_mode_open_would_use(self):
+        write_atomically(self.path, 'content\n')
+        self.assertEquals(FILE_MODE, stat.S_IMODE(os.stat(self.path).st_mode))
+
+    @patch('monitoring_config_generator.atomic_file.os.rename')
+    def test_keeps_the_old_file_if_the_rename_fails(self, rename_mock):
+        with open(self.path, 'w') as old_file:
+            old_file.write('old\n')
+        rename_mock.side_effect = OSError('rename failed')
+
+        self.assertRaises(OSError, write_atomically, self.path, 'new\n')
+
+        self.assertEquals('old\n', self.read())
+        self.assertEquals(['host.cfg'], os.listdir(self.target_dir))
+
+    @patch('monitoring_config_generator.atomic_file.os.fsync')
+    def test_fsyncs_only_if_asked_to(self, fsync_mock):
+        write_atomically(self.path, 'content\n')
+        self.assertFalse(fsync_mock.called)
+        write_atomically(self.path, 'content\n', fsync=True)
+        self.assertEquals(1, fsync_mock.call_count)
+
+    @patch('monitoring_config_generator.atomic_file.os.fsync')
+    def test_fsync_directory(self, fsync_mock):
+        fsync_directory(self.target_dir)
+        self.assertEquals(1, fsync_mock.call_count)
+
+
+class TestOutputWriter(unittest.TestCase):
+    def setUp(self):
+        shutil.rmtree(CONFIG["TARGET_DIR"], True)
+        os.mkdir(CONFIG["TARGET_DIR"])
+        self.path = os.path.join(CONFIG["TARGET_DIR"], 'host.cfg')
+
+    def test_writes_one_line_per_entry(self):
+        OutputWriter(self.path).write_lines(['# header', '', 'define host {', '}'])
+        with open(self.path) as written_file:
+            self.assertEquals('# header\n\ndefine host {\n}\n', written_file.read())
+
+    @patch('monitoring_config_generator.MonitoringConfigGenerator.fsync_directory')
+    def test_syncs_the_directory_if_asked_to(self, fsync_directory_mock):
+        OutputWriter(self.path).write_lines(['line'])
+        self.assertFalse(fsync_directory_mock.called)
+        OutputWriter(self.path, fsync=True, sync_directory=True).write_lines(['line'])
+        fsync_directory_mock.assert_called_once_with(CONFIG["TARGET_DIR"])
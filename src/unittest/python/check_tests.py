@@ -0,0 +1,123 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from xml.etree import ElementTree
+
+from mock import patch
+
+os.environ['MONITORING_CONFIG_GENERATOR_CONFIG'] = "testdata/testconfig.yaml"
+from monitoring_config_generator.check import check_path, check_paths, exit_code, report, run_check_only
+from monitoring_config_generator.MonitoringConfigGenerator import generate_config, EXIT_CODE_ERROR
+from monitoring_config_generator.settings import CONFIG
+
+
+VALID = 'testdata/itest_testhost03_new_format/testhost03.yaml'
+MULTIFILE = 'testdata/itest_testhost07_multifile_dir/testhost07'
+
+INVALID_YAML = '''
+host:
+    host_name: host.domain.tld
+services:
+    s1:
+        host_name: other.domain.tld
+        service_description: s1
+        check_command: ${UNDEFINED}
+'''
+
+FORBIDDEN_YAML = '''
+defaults:
+    check_period: 24x7
+    max_check_attempts: 3
+    notification_interval: 120
+    notification_period: 24x7
+host:
+    host_name: host.domain.tld
+services:
+    s1:
+        host_name: host.domain.tld
+        service_description: s1
+        check_command: "check }"
+'''
+
+
+class TestCheck(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.invalid = self.write('invalid.yaml', INVALID_YAML)
+        self.forbidden = self.write('forbidden.yaml', FORBIDDEN_YAML)
+        shutil.rmtree(CONFIG['TARGET_DIR'], True)
+        os.mkdir(CONFIG['TARGET_DIR'])
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write(self, name, content):
+        path = os.path.join(self.directory, name)
+        with open(path, 'w') as yaml_file:
+            yaml_file.write(content)
+        return path
+
+    def test_valid_file_and_directory(self):
+        for path in VALID, MULTIFILE:
+            result = check_path(path)
+            self.assertTrue(result.ok, result.errors)
+
+    def test_reports_all_errors(self):
+        result = check_path(self.invalid)
+        self.assertFalse(result.ok)
+        error_types = set(error_type for error_type, _ in result.errors)
+        self.assertEquals(set(['MandatoryDirectiveMissingException', 'HostNamesNotEqualException',
+                               'ConfigurationContainsUndefinedVariables']), error_types)
+
+    def test_skip_checks(self):
+        result = check_path(self.invalid, skip_checks=True)
+        self.assertEquals(['ConfigurationContainsUndefinedVariables'], [error_type for error_type, _ in result.errors])
+
+    def test_renders_the_config(self):
+        result = check_path(self.forbidden)
+        self.assertEquals(1, len(result.errors))
+        self.assertIn("forbidden newline or '}'", result.errors[0][1])
+
+    def test_missing_path(self):
+        self.assertFalse(check_path(os.path.join(self.directory, 'missing.yaml')).ok)
+
+    def test_checks_in_processes_and_keeps_the_order(self):
+        paths = [VALID, self.invalid, MULTIFILE, self.forbidden]
+        results = check_paths(paths, workers=2)
+        self.assertEquals(paths, [result.path for result in results])
+        self.assertEquals([True, False, True, False], [result.ok for result in results])
+        self.assertEquals(EXIT_CODE_ERROR, exit_code(results))
+        self.assertEquals(0, exit_code(results[::2]))
+
+    def test_writes_no_files(self):
+        check_paths([VALID, MULTIFILE], workers=1)
+        self.assertEquals([], os.listdir(CONFIG['TARGET_DIR']))
+
+    def test_json_report(self):
+        results = json.loads(report(check_paths([VALID, self.invalid], workers=1), 'json'))
+        self.assertEquals(2, results['checked'])
+        self.assertEquals(1, results['failed'])
+        self.assertEquals([True, False], [result['ok'] for result in results['results']])
+
+    def test_junit_report(self):
+        suite = ElementTree.fromstring(report(check_paths([VALID, self.forbidden], workers=1), 'junit'))
+        self.assertEquals('2', suite.get('tests'))
+        self.assertEquals('1', suite.get('failures'))
+        self.assertEquals([VALID, self.forbidden], [case.get('name') for case in suite.findall('testcase')])
+        self.assertEquals(1, len(suite.findall('testcase/failure')))
+
+    def test_check_only_option(self):
+        output = os.path.join(self.directory, 'report.xml')
+        with patch('sys.argv', ['monconfgenerator', '--check-only', '--workers=1', '--format=junit',
+                                '--output=%s' % output, VALID]):
+            with self.assertRaises(SystemExit) as context:
+                generate_config()
+        self.assertEquals(0, context.exception.code)
+        self.assertEquals('0', ElementTree.parse(output).getroot().get('failures'))
+
+    def test_unknown_format(self):
+        arguments = {'--debug': False, '--format': 'yaml', 'PATH': [VALID], '--path-file': None,
+                     '--workers': '1', '--skip-checks': False, '--output': None}
+        self.assertEquals(EXIT_CODE_ERROR, run_check_only(arguments))
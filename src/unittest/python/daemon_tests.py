@@ -0,0 +1,254 @@
+import os
+import shutil
+import threading
+import unittest
+
+from mock import patch, Mock
+
+os.environ['MONITORING_CONFIG_GENERATOR_CONFIG'] = "testdata/testconfig.yaml"
+from monitoring_config_generator.daemon import Daemon
+from monitoring_config_generator.exceptions import HostUnreachableException
+from monitoring_config_generator.MonitoringConfigGenerator import (GenerationResult,
+                                                                   EXIT_CODE_CONFIG_WRITTEN,
+                                                                   EXIT_CODE_NOT_WRITTEN)
+from monitoring_config_generator.settings import CONFIG, DEF_CONFIG, read_config, reload_config
+from monitoring_config_generator.yaml_tools.service_cache import ServiceCaches
+from test_doubles import Clock, ImmediatePool
+
+
+class HeldPool(object):
+    """keeps the tasks until they are released"""
+
+    def __init__(self):
+        self.tasks = []
+
+    def apply_async(self, function, args, callback):
+        self.tasks.append((function, args, callback))
+
+    def release(self):
+        tasks, self.tasks = self.tasks, []
+        for function, args, callback in tasks:
+            callback(function(*args))
+
+
+@patch.dict('monitoring_config_generator.daemon.CONFIG', {'DAEMON_INTERVAL': 100, 'DAEMON_JITTER': 0.1,
+                                                          'DAEMON_MAX_BACKOFF': 1000})
+class TestDaemonSchedule(unittest.TestCase):
+    def setUp(self):
+        shutil.rmtree(CONFIG['TARGET_DIR'], True)
+        os.mkdir(CONFIG['TARGET_DIR'])
+        self.clock = Clock()
+        self.urls = ['http://a', 'http://b']
+        self.daemon = Daemon(lambda: self.urls, clock=self.clock)
+        self.daemon.start()
+        self.results = {}
+        generate_patcher = patch.object(self.daemon, 'generate', side_effect=self.generate)
+        self.generate_mock = generate_patcher.start()
+        self.addCleanup(generate_patcher.stop)
+
+    def generate(self, url):
+        return self.results.get(url, GenerationResult(url, EXIT_CODE_NOT_WRITTEN))
+
+    def due(self):
+        return sorted((due - self.clock.now, url) for due, url in self.daemon._schedule)
+
+    def test_all_hosts_are_due_at_start(self):
+        self.assertEquals(['http://a', 'http://b'], sorted(self.daemon.dispatch_due(ImmediatePool())))
+
+    def test_hosts_are_scheduled_again_with_jitter(self):
+        self.daemon.dispatch_due(ImmediatePool())
+        for delay, _ in self.due():
+            self.assertTrue(90 <= delay <= 110, delay)
+        self.assertEquals([], self.daemon.dispatch_due(ImmediatePool()))
+
+        self.clock.now += 111
+        self.assertEquals(['http://a', 'http://b'], sorted(self.daemon.dispatch_due(ImmediatePool())))
+
+    def test_unreachable_hosts_back_off(self):
+        self.results['http://a'] = GenerationResult('http://a', EXIT_CODE_NOT_WRITTEN,
+                                                    error=HostUnreachableException('down'))
+        delays = []
+        for _ in range(5):
+            self.daemon.dispatch_due(ImmediatePool())
+            delay = dict((url, delay) for delay, url in self.due())['http://a']
+            delays.append(delay)
+            self.clock.now += delay
+        for delay, expected in zip(delays, [200, 400, 800, 1000, 1000]):
+            self.assertTrue(expected * 0.9 <= delay <= expected * 1.1, (delays, expected))
+
+        del self.results['http://a']
+        self.daemon.dispatch_due(ImmediatePool())
+        self.assertTrue(dict((url, delay) for delay, url in self.due())['http://a'] <= 110)
+
+    def test_running_hosts_are_not_started_twice(self):
+        pool = HeldPool()
+        self.daemon.dispatch_due(pool)
+        self.daemon.set_urls(self.urls + ['http://c'])
+        self.assertEquals(['http://c'], self.daemon.dispatch_due(pool))
+        pool.release()
+        self.assertEquals(3, self.generate_mock.call_count)
+
+    @patch.dict('monitoring_config_generator.yaml_tools.service_cache.CONFIG', {'SERVICE_CACHE_HOSTS': None})
+    def test_service_caches_are_sized_for_all_hosts(self):
+        with patch('monitoring_config_generator.daemon.SERVICE_CACHES', ServiceCaches()) as caches:
+            self.daemon.set_urls(self.urls + ['http://c'])
+        self.assertEquals(3, caches.max_hosts)
+
+    def test_removed_hosts_are_not_scheduled_again(self):
+        pool = HeldPool()
+        self.daemon.dispatch_due(pool)
+        self.daemon.set_urls(['http://a'])
+        pool.release()
+        self.assertEquals(['http://a'], [url for _, url in self.due()])
+
+    @patch.dict('monitoring_config_generator.icinga_reload.CONFIG', {'RELOAD_COMMAND': 'true', 'RELOAD_DEBOUNCE': 30})
+    @patch('monitoring_config_generator.icinga_reload.IcingaReloader._run')
+    def test_icinga_is_reloaded_once_per_debounce_window(self, run_mock):
+        self.results['http://a'] = GenerationResult('http://a', EXIT_CODE_CONFIG_WRITTEN, 'a.cfg')
+        self.results['http://b'] = GenerationResult('http://b', EXIT_CODE_CONFIG_WRITTEN, 'b.cfg')
+        pool = HeldPool()
+        self.daemon.dispatch_due(pool)
+        pool.release()
+        self.daemon.maintain()
+        self.assertFalse(run_mock.called)
+
+        self.clock.now += 30
+        self.daemon.maintain()
+        self.daemon.maintain()
+        run_mock.assert_called_once_with('true', ['a.cfg', 'b.cfg'])
+
+    @patch('monitoring_config_generator.daemon.reload_config')
+    def test_reload_waits_for_running_hosts(self, reload_config_mock):
+        pool = HeldPool()
+        self.daemon.dispatch_due(pool)
+        self.urls = ['http://a', 'http://new']
+        self.daemon.request_reload()
+
+        self.daemon.maintain()
+        self.assertFalse(reload_config_mock.called)
+        pool.release()
+        # due again, but nothing is started while a reload is pending
+        self.clock.now += 1000
+        self.assertEquals([], self.daemon.dispatch_due(pool))
+
+        self.daemon.maintain()
+        self.assertTrue(reload_config_mock.called)
+        self.assertEquals(['http://a', 'http://new'], sorted(self.daemon.dispatch_due(pool)))
+
+
+@patch.dict('monitoring_config_generator.daemon.CONFIG', {'DAEMON_INTERVAL': 100, 'DAEMON_JITTER': 0.1})
+class TestNotify(unittest.TestCase):
+    def setUp(self):
+        shutil.rmtree(CONFIG['TARGET_DIR'], True)
+        os.mkdir(CONFIG['TARGET_DIR'])
+        self.clock = Clock()
+        self.daemon = Daemon(lambda: ['http://a.example.com/monitoring', 'http://b.example.com:8935/monitoring'],
+                             clock=self.clock)
+        self.daemon.start()
+        self.addCleanup(self.daemon.fetcher.close)
+        self.generated = []
+        run_generator_patcher = patch('monitoring_config_generator.daemon.run_generator', side_effect=self.generate)
+        run_generator_patcher.start()
+        self.addCleanup(run_generator_patcher.stop)
+        self.daemon.dispatch_due(ImmediatePool())
+        self.generated = []
+
+    def generate(self, url, *args, **kwargs):
+        self.generated.append((url, kwargs['fetcher']))
+        return GenerationResult(url, EXIT_CODE_NOT_WRITTEN)
+
+    def test_finds_urls_by_host_name_or_url(self):
+        self.assertEquals('http://b.example.com:8935/monitoring', self.daemon.find_url(host='b.example.com'))
+        self.assertEquals('http://a.example.com/monitoring',
+                          self.daemon.find_url(url='http://a.example.com/monitoring'))
+        self.assertIsNone(self.daemon.find_url(host='c.example.com'))
+        self.assertIsNone(self.daemon.find_url(url='http://c.example.com/monitoring'))
+
+    def test_notified_host_is_due_at_once(self):
+        self.assertTrue(self.daemon.notify('http://a.example.com/monitoring'))
+        self.assertEquals(['http://a.example.com/monitoring'], self.daemon.dispatch_due(ImmediatePool()))
+        self.assertIs(self.daemon.fetcher, self.generated[0][1])
+
+    def test_unknown_urls_are_refused(self):
+        self.assertFalse(self.daemon.notify('http://c.example.com/monitoring'))
+        self.assertEquals([], self.daemon.dispatch_due(ImmediatePool()))
+
+    def test_repeated_notifications_are_coalesced(self):
+        for _ in range(5):
+            self.daemon.notify('http://a.example.com/monitoring')
+        self.assertEquals(2, len(self.daemon._schedule))
+        self.daemon.dispatch_due(ImmediatePool())
+        self.assertEquals(1, len(self.generated))
+
+    def test_notifications_while_running_give_one_more_run(self):
+        self.clock.now += 1000
+        pool = HeldPool()
+        self.daemon.dispatch_due(pool)
+        for _ in range(3):
+            self.daemon.notify('http://a.example.com/monitoring')
+        self.assertEquals([], self.daemon.dispatch_due(pool))
+
+        pool.release()
+        self.assertEquals(['http://a.example.com/monitoring'], self.daemon.dispatch_due(pool))
+        pool.release()
+        self.assertEquals([], self.daemon.dispatch_due(pool))
+        self.assertEquals(3, len(self.generated))
+
+    def test_the_latest_pushed_document_is_generated_once(self):
+        first, latest = Mock(), Mock()
+        self.daemon.notify('http://a.example.com/monitoring', first)
+        self.daemon.notify('http://a.example.com/monitoring', latest)
+        self.daemon.dispatch_due(ImmediatePool())
+        self.assertIs(latest, self.generated[0][1].response)
+
+        self.daemon.notify('http://a.example.com/monitoring')
+        self.daemon.dispatch_due(ImmediatePool())
+        self.assertIs(self.daemon.fetcher, self.generated[1][1])
+
+
+class TestServeForever(unittest.TestCase):
+    def setUp(self):
+        shutil.rmtree(CONFIG['TARGET_DIR'], True)
+        os.mkdir(CONFIG['TARGET_DIR'])
+
+    @patch('monitoring_config_generator.daemon.run_generator')
+    def test_generates_until_stopped_and_shares_fetcher_and_index(self, run_generator_mock):
+        daemon = Daemon(lambda: ['http://a', 'http://b'], workers=2)
+        generated = threading.Event()
+
+        def generate(url, *args, **kwargs):
+            if run_generator_mock.call_count >= 2:
+                generated.set()
+            return GenerationResult(url, EXIT_CODE_CONFIG_WRITTEN, 'a.cfg')
+        run_generator_mock.side_effect = generate
+
+        thread = threading.Thread(target=daemon.serve_forever)
+        thread.start()
+        generated.wait(5)
+        daemon.stop()
+        thread.join(5)
+
+        self.assertFalse(thread.is_alive())
+        self.assertEquals(2, run_generator_mock.call_count)
+        fetchers = set(id(call[1]['fetcher']) for call in run_generator_mock.call_args_list)
+        indexes = set(id(call[1]['header_index']) for call in run_generator_mock.call_args_list)
+        self.assertEquals((1, 1), (len(fetchers), len(indexes)))
+
+
+class TestReloadConfig(unittest.TestCase):
+    def test_updates_config_in_place(self):
+        original = dict(CONFIG)
+        config = CONFIG
+        try:
+            CONFIG['INDENT'] = 'changed'
+            reload_config()
+            self.assertIs(config, CONFIG)
+            self.assertEquals(original, CONFIG)
+        finally:
+            CONFIG.clear()
+            CONFIG.update(original)
+
+    def test_missing_config_file_gives_a_copy_of_the_defaults(self):
+        config = read_config('testdata/missing.yaml')
+        self.assertEquals(DEF_CONFIG, config)
+        self.assertIsNot(DEF_CONFIG, config)
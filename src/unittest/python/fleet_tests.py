@@ -0,0 +1,137 @@
+import os
+import shutil
+import unittest
+
+from mock import patch, ANY, Mock
+
+os.environ['MONITORING_CONFIG_GENERATOR_CONFIG'] = "testdata/testconfig.yaml"
+from monitoring_config_generator.settings import CONFIG
+from monitoring_config_generator.fleet import FleetGenerator, read_lines, url_for_host
+from monitoring_config_generator.MonitoringConfigGenerator import (GenerationResult,
+                                                                   EXIT_CODE_CONFIG_WRITTEN,
+                                                                   EXIT_CODE_ERROR,
+                                                                   EXIT_CODE_NOT_WRITTEN,
+                                                                   STATUS_UNCHANGED)
+from test_logger import init_test_logger
+
+
+class TestFleetExitCode(unittest.TestCase):
+    def results(self, *exit_codes):
+        return [GenerationResult('url%d' % i, exit_code) for i, exit_code in enumerate(exit_codes)]
+
+    def test_exit_code_is_error_if_any_host_failed(self):
+        results = self.results(EXIT_CODE_CONFIG_WRITTEN, EXIT_CODE_ERROR, EXIT_CODE_NOT_WRITTEN)
+        self.assertEquals(EXIT_CODE_ERROR, FleetGenerator.exit_code(results))
+
+    def test_exit_code_is_error_for_system_exit_messages(self):
+        results = self.results(EXIT_CODE_CONFIG_WRITTEN, "Raw yaml config is 'None'")
+        self.assertEquals(EXIT_CODE_ERROR, FleetGenerator.exit_code(results))
+
+    def test_exit_code_is_written_if_any_host_was_written(self):
+        results = self.results(EXIT_CODE_NOT_WRITTEN, EXIT_CODE_CONFIG_WRITTEN)
+        self.assertEquals(EXIT_CODE_CONFIG_WRITTEN, FleetGenerator.exit_code(results))
+
+    def test_exit_code_is_not_written_if_nothing_changed(self):
+        results = self.results(EXIT_CODE_NOT_WRITTEN, EXIT_CODE_NOT_WRITTEN)
+        self.assertEquals(EXIT_CODE_NOT_WRITTEN, FleetGenerator.exit_code(results))
+
+    def test_summary(self):
+        results = self.results(EXIT_CODE_NOT_WRITTEN, EXIT_CODE_CONFIG_WRITTEN, EXIT_CODE_ERROR)
+        results.append(GenerationResult('unchanged', EXIT_CODE_NOT_WRITTEN, status=STATUS_UNCHANGED))
+        self.assertEquals("4 hosts: 1 written, 1 unchanged, 1 not written, 1 failed", FleetGenerator.summary(results))
+
+    @patch.dict('monitoring_config_generator.icinga_reload.CONFIG', {'RELOAD_COMMAND': 'true'})
+    @patch('monitoring_config_generator.icinga_reload.IcingaReloader._run')
+    def test_reloads_icinga_once_for_all_written_files(self, run_mock):
+        results = self.results(EXIT_CODE_CONFIG_WRITTEN, EXIT_CODE_NOT_WRITTEN, EXIT_CODE_CONFIG_WRITTEN)
+        results[0].file_name, results[2].file_name = 'b.cfg', 'a.cfg'
+        self.assertTrue(FleetGenerator([]).reload_icinga(results))
+        run_mock.assert_called_once_with('true', ['a.cfg', 'b.cfg'])
+
+    @patch.dict('monitoring_config_generator.icinga_reload.CONFIG', {'RELOAD_COMMAND': 'true'})
+    @patch('monitoring_config_generator.icinga_reload.IcingaReloader._run')
+    def test_does_not_reload_icinga_if_nothing_was_written(self, run_mock):
+        self.assertFalse(FleetGenerator([]).reload_icinga(self.results(EXIT_CODE_NOT_WRITTEN, EXIT_CODE_ERROR)))
+        self.assertFalse(run_mock.called)
+
+
+class TestFleetInput(unittest.TestCase):
+    def setUp(self):
+        shutil.rmtree(CONFIG["TARGET_DIR"], True)
+        os.mkdir(CONFIG["TARGET_DIR"])
+
+    def test_read_lines_skips_empty_lines_and_comments(self):
+        list_file = os.path.join(CONFIG["TARGET_DIR"], 'hosts.txt')
+        with open(list_file, 'w') as f:
+            f.write("# fleet\nhost1\n\n  host2  \n")
+        self.assertEquals(['host1', 'host2'], read_lines(list_file))
+
+    def test_url_for_host_uses_port_and_resource_setting(self):
+        self.assertEquals('http://host1:8935/monitoring', url_for_host('host1'))
+
+    def test_rejects_less_than_one_worker(self):
+        self.assertRaises(ValueError, FleetGenerator, ['url'], workers=0)
+
+
+class TestFleetGenerate(unittest.TestCase):
+    def setUp(self):
+        shutil.rmtree(CONFIG["TARGET_DIR"], True)
+        os.mkdir(CONFIG["TARGET_DIR"])
+
+    init_test_logger()
+
+    def test_generates_all_hosts_in_order(self):
+        urls = [os.path.abspath(os.path.join('testdata', directory, yaml_file)) for directory, yaml_file in
+                [('itest_testhost03_new_format', 'testhost03.yaml'),
+                 ('itest_testhost04_defaults', 'testhost04.yaml'),
+                 ('itest_testhost08_variables', 'testhost08.other.domain.yaml'),
+                 ('itest_testhost05_variables', 'testhost05.yaml')]]
+
+        results = FleetGenerator(urls, workers=2).generate()
+
+        self.assertEquals(urls, [result.source for result in results])
+        self.assertEquals([EXIT_CODE_CONFIG_WRITTEN, EXIT_CODE_CONFIG_WRITTEN, EXIT_CODE_ERROR,
+                           EXIT_CODE_CONFIG_WRITTEN],
+                          [result.exit_code for result in results])
+        for file_name in ['testhost03.cfg', 'testhost04.cfg', 'testhost05.cfg']:
+            self.assertTrue(os.path.exists(os.path.join(CONFIG["TARGET_DIR"], file_name)))
+
+    def test_second_run_does_not_write_again(self):
+        url = os.path.abspath('testdata/itest_testhost03_new_format/testhost03.yaml')
+        FleetGenerator([url]).generate()
+        results = FleetGenerator([url]).generate()
+        self.assertEquals(EXIT_CODE_NOT_WRITTEN, FleetGenerator.exit_code(results))
+
+    @patch('monitoring_config_generator.fleet.run_generator')
+    def test_passes_options_to_each_run(self, run_generator_mock):
+        run_generator_mock.return_value = GenerationResult('url', EXIT_CODE_CONFIG_WRITTEN)
+        FleetGenerator(['url1', 'url2'], True, '/target', True).generate()
+        self.assertEquals(2, run_generator_mock.call_count)
+        run_generator_mock.assert_any_call('url1', True, '/target', True, None, fetcher=ANY, header_index=ANY,
+                                           fsync=False, sync_directory=False, sharded_output=None)
+
+    @patch('monitoring_config_generator.fleet.HttpFetcher')
+    @patch('monitoring_config_generator.fleet.run_generator')
+    def test_closes_its_fetcher(self, run_generator_mock, fetcher_mock):
+        run_generator_mock.side_effect = Exception('failed')
+        self.assertRaises(Exception, FleetGenerator(['url1']).generate)
+        fetcher_mock.return_value.close.assert_called_once_with()
+
+    @patch('monitoring_config_generator.fleet.run_generator')
+    def test_leaves_a_fetcher_it_was_given_open(self, run_generator_mock):
+        run_generator_mock.return_value = GenerationResult('url', EXIT_CODE_CONFIG_WRITTEN)
+        fetcher = Mock()
+        FleetGenerator(['url1'], fetcher=fetcher).generate()
+        self.assertFalse(fetcher.close.called)
+
+    def test_no_urls_gives_no_results(self):
+        self.assertEquals([], FleetGenerator([]).generate())
+
+    @patch('monitoring_config_generator.fleet.fsync_directory')
+    @patch('monitoring_config_generator.atomic_file.os.fsync')
+    def test_fsync_syncs_every_file_and_the_directory_once(self, fsync_mock, fsync_directory_mock):
+        urls = [os.path.abspath('testdata/itest_testhost03_new_format/testhost03.yaml'),
+                os.path.abspath('testdata/itest_testhost04_defaults/testhost04.yaml')]
+        FleetGenerator(urls, fsync=True).generate()
+        self.assertEquals(2, fsync_mock.call_count)
+        fsync_directory_mock.assert_called_once_with(CONFIG['TARGET_DIR'])
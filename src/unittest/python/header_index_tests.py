@@ -0,0 +1,222 @@
+import json
+import os
+import shutil
+import unittest
+
+from mock import patch
+import yaml
+
+os.environ['MONITORING_CONFIG_GENERATOR_CONFIG'] = "testdata/testconfig.yaml"
+from monitoring_config_generator.settings import CONFIG
+from monitoring_config_generator.header_index import HeaderIndex, content_hash, INDEX_FILE_NAME, \
+    INDEX_LOCK_FILE_NAME
+from monitoring_config_generator.yaml_tools.readers import Header
+from monitoring_config_generator.MonitoringConfigGenerator import MonitoringConfigGenerator
+
+
+class TestContentHash(unittest.TestCase):
+    def test_ignores_the_header(self):
+        body = ['', 'define host {', '}']
+        self.assertEquals(content_hash(Header(etag='a', mtime=1).serialize() + body),
+                          content_hash(Header(etag='b', mtime=2).serialize() + body))
+
+    def test_same_hash_for_rendered_lines_and_lines_read_from_a_file(self):
+        body = ['', 'define host {', '}']
+        self.assertEquals(content_hash(body), content_hash([line + '\n' for line in body]))
+
+    def test_differs_for_different_content(self):
+        self.assertNotEquals(content_hash(['', 'define host {', '}']),
+                             content_hash(['', 'define service {', '}']))
+
+
+class TestHeaderIndex(unittest.TestCase):
+    def setUp(self):
+        self.target_dir = CONFIG["TARGET_DIR"]
+        shutil.rmtree(self.target_dir, True)
+        os.mkdir(self.target_dir)
+
+    def write_config(self, file_name, header, body=('', 'define host {', '}')):
+        with open(os.path.join(self.target_dir, file_name), 'w') as config_file:
+            for line in header.serialize() + list(body):
+                config_file.write(line + '\n')
+
+    def test_unknown_file_gives_empty_header(self):
+        self.assertEquals(Header(), HeaderIndex(self.target_dir).get('unknown.cfg'))
+
+    def test_is_rebuilt_from_config_headers_if_missing(self):
+        self.write_config('host1.cfg', Header(etag='a', mtime=1))
+        self.write_config('host2.cfg', Header(mtime=2))
+
+        index = HeaderIndex.load(self.target_dir)
+
+        self.assertEquals(Header(etag='a', mtime=1), index.get('host1.cfg'))
+        self.assertEquals(Header(mtime=2), index.get('host2.cfg'))
+        self.assertEquals(content_hash(['', 'define host {', '}']), index.entries['host1.cfg']['hash'])
+
+    def test_saved_index_is_used_without_reading_the_configs(self):
+        self.write_config('host1.cfg', Header(etag='a', mtime=1))
+        HeaderIndex.load(self.target_dir).save()
+
+        with patch('monitoring_config_generator.header_index.Header.parse') as parse_mock:
+            index = HeaderIndex.load(self.target_dir)
+
+        self.assertFalse(parse_mock.called)
+        self.assertEquals(Header(etag='a', mtime=1), index.get('host1.cfg'))
+
+    def test_is_rebuilt_if_config_files_were_added(self):
+        self.write_config('host1.cfg', Header(etag='a', mtime=1))
+        HeaderIndex.load(self.target_dir).save()
+        self.write_config('host2.cfg', Header(etag='b', mtime=2))
+
+        self.assertEquals(Header(etag='b', mtime=2), HeaderIndex.load(self.target_dir).get('host2.cfg'))
+
+    def test_config_edited_by_hand_is_indexed_again(self):
+        self.write_config('host1.cfg', Header(etag='a', mtime=1))
+        HeaderIndex.load(self.target_dir).save()
+        body = ('', 'define host {', '    edited by hand', '}')
+        self.write_config('host1.cfg', Header(etag='a', mtime=1), body)
+
+        index = HeaderIndex.load(self.target_dir)
+
+        self.assertEquals(content_hash(list(body)), index.entries['host1.cfg']['hash'])
+
+    def test_config_changed_without_changing_its_size_is_indexed_again(self):
+        self.write_config('host1.cfg', Header(etag='a', mtime=1))
+        HeaderIndex.load(self.target_dir).save()
+        path = os.path.join(self.target_dir, 'host1.cfg')
+        self.write_config('host1.cfg', Header(etag='b', mtime=1))
+        stat = os.stat(path)
+        os.utime(path, (stat.st_atime, stat.st_mtime + 10))
+
+        self.assertEquals(Header(etag='b', mtime=1), HeaderIndex.load(self.target_dir).get('host1.cfg'))
+
+    def test_concurrent_saves_keep_the_entries_of_both(self):
+        self.write_config('host1.cfg', Header(etag='a', mtime=1))
+        HeaderIndex.load(self.target_dir).save()
+        first, second = HeaderIndex.load(self.target_dir), HeaderIndex.load(self.target_dir)
+        self.write_config('host2.cfg', Header(etag='b', mtime=2))
+        first.update('host2.cfg', Header(etag='b', mtime=2), 'hash2', 42, source='http://host2/monitoring')
+        self.write_config('host3.cfg', Header(etag='c', mtime=3))
+        second.update('host3.cfg', Header(etag='c', mtime=3), 'hash3', 42, source='http://host3/monitoring')
+
+        first.save()
+        second.save()
+
+        with patch('monitoring_config_generator.header_index.Header.parse') as parse_mock:
+            index = HeaderIndex.load(self.target_dir)
+        self.assertFalse(parse_mock.called)
+        self.assertEquals(['host1.cfg', 'host2.cfg', 'host3.cfg'], sorted(index.entries))
+        self.assertEquals(['http://host2/monitoring', 'http://host3/monitoring'], sorted(index.sources))
+        self.assertEquals(['host1.cfg', 'host2.cfg', 'host3.cfg'], sorted(second.entries))
+
+    def test_sources_of_removed_configs_are_dropped(self):
+        self.write_config('host1.cfg', Header(etag='a', mtime=1))
+        index = HeaderIndex.load(self.target_dir)
+        index.remember_source('http://host1/monitoring', 'host1.cfg')
+        index.save()
+        os.remove(os.path.join(self.target_dir, 'host1.cfg'))
+
+        self.assertEquals({}, HeaderIndex.load(self.target_dir).sources)
+
+    def test_is_rebuilt_if_unreadable(self):
+        self.write_config('host1.cfg', Header(etag='a', mtime=1))
+        with open(os.path.join(self.target_dir, INDEX_FILE_NAME), 'w') as index_file:
+            index_file.write('{broken')
+
+        self.assertEquals(Header(etag='a', mtime=1), HeaderIndex.load(self.target_dir).get('host1.cfg'))
+
+    def test_sync_with_directory(self):
+        self.write_config('host1.cfg', Header(etag='a', mtime=1))
+        self.write_config('host2.cfg', Header(etag='b', mtime=2))
+        index = HeaderIndex.load(self.target_dir)
+        index.modified = False
+        os.remove(os.path.join(self.target_dir, 'host1.cfg'))
+        self.write_config('host3.cfg', Header(etag='c', mtime=3))
+
+        index.sync_with_directory()
+
+        self.assertEquals(['host2.cfg', 'host3.cfg'], sorted(index.entries))
+        self.assertEquals(Header(etag='c', mtime=3), index.get('host3.cfg'))
+        self.assertTrue(index.modified)
+
+    def test_without_sync_all_only_the_entries_looked_up_are_checked(self):
+        for number in range(1, 4):
+            self.write_config('host%d.cfg' % number, Header(etag='a', mtime=number))
+        HeaderIndex.load(self.target_dir).save()
+        self.write_config('host1.cfg', Header(etag='b', mtime=1), ('', 'define host {', '    edited', '}'))
+        os.remove(os.path.join(self.target_dir, 'host2.cfg'))
+
+        with patch('os.stat', wraps=os.stat) as stat_mock:
+            index = HeaderIndex.load(self.target_dir, sync_all=False)
+            self.assertEquals(Header(etag='b', mtime=1), index.get('host1.cfg'))
+            self.assertEquals(Header(etag='b', mtime=1), index.get('host1.cfg'))
+
+        # checked once, and recorded again after it was indexed
+        self.assertEquals([os.path.join(self.target_dir, 'host1.cfg')] * 2,
+                          [call[0][0] for call in stat_mock.call_args_list])
+        self.assertIn('host2.cfg', index.entries)
+        self.assertEquals(Header(), index.get('host2.cfg'))
+        self.assertNotIn('host2.cfg', index.entries)
+
+    def test_without_sync_all_a_new_config_is_indexed_when_looked_up(self):
+        self.write_config('host1.cfg', Header(etag='a', mtime=1))
+        HeaderIndex.load(self.target_dir).save()
+        self.write_config('host2.cfg', Header(etag='b', mtime=2))
+
+        index = HeaderIndex.load(self.target_dir, sync_all=False)
+
+        self.assertEquals(Header(etag='b', mtime=2), index.get('host2.cfg'))
+        self.assertTrue(index.modified)
+
+    def test_without_sync_all_unchanged_entries_are_not_saved(self):
+        self.write_config('host1.cfg', Header(etag='a', mtime=1))
+        HeaderIndex.load(self.target_dir).save()
+
+        index = HeaderIndex.load(self.target_dir, sync_all=False)
+        index.get('host1.cfg')
+
+        self.assertFalse(index.modified)
+
+    def test_save_writes_entries_and_sources(self):
+        index = HeaderIndex(self.target_dir)
+        index.update('host1.cfg', Header(etag='a', mtime=1), 'hash', 42, source='http://host1/monitoring')
+        index.save()
+
+        with open(os.path.join(self.target_dir, INDEX_FILE_NAME)) as index_file:
+            data = json.load(index_file)
+        self.assertEquals({'etag': 'a', 'mtime': 1, 'hash': 'hash', 'size': 42}, data['entries']['host1.cfg'])
+        self.assertEquals({'http://host1/monitoring': 'host1.cfg'}, data['sources'])
+        self.assertEquals(sorted([INDEX_FILE_NAME, INDEX_LOCK_FILE_NAME]), sorted(os.listdir(self.target_dir)))
+
+    def test_save_does_nothing_if_unmodified(self):
+        HeaderIndex(self.target_dir).save()
+        self.assertEquals([], os.listdir(self.target_dir))
+
+
+class TestGeneratorUsesHeaderIndex(unittest.TestCase):
+    def setUp(self):
+        shutil.rmtree(CONFIG["TARGET_DIR"], True)
+        os.mkdir(CONFIG["TARGET_DIR"])
+
+    def test_written_config_is_recorded_in_the_index(self):
+        yaml_file = os.path.abspath('testdata/itest_testhost03_new_format/testhost03.yaml')
+        MonitoringConfigGenerator(yaml_file).generate()
+
+        index = HeaderIndex.load(CONFIG["TARGET_DIR"])
+        with open(os.path.join(CONFIG["TARGET_DIR"], 'testhost03.cfg')) as config_file:
+            lines = config_file.readlines()
+        self.assertEquals(Header.parse(os.path.join(CONFIG["TARGET_DIR"], 'testhost03.cfg')),
+                          index.get('testhost03.cfg'))
+        self.assertEquals(content_hash(lines), index.entries['testhost03.cfg']['hash'])
+        self.assertEquals(sum(len(line) for line in lines), index.entries['testhost03.cfg']['size'])
+
+    @patch('monitoring_config_generator.MonitoringConfigGenerator.read_config')
+    def test_source_is_remembered_for_conditional_requests(self, read_config_mock):
+        with open('testdata/itest_testhost03_new_format/testhost03.yaml') as yaml_file:
+            read_config_mock.return_value = (yaml.safe_load(yaml_file), Header(etag='a', mtime=1))
+        url = 'http://some-alias:8935/monitoring'
+        MonitoringConfigGenerator(url).generate()
+
+        MonitoringConfigGenerator(url).generate()
+
+        self.assertEquals(Header(etag='a', mtime=1), read_config_mock.call_args[1]['header'])
@@ -0,0 +1,111 @@
+import os
+import shutil
+import signal
+import tempfile
+import unittest
+
+from mock import patch
+
+os.environ['MONITORING_CONFIG_GENERATOR_CONFIG'] = "testdata/testconfig.yaml"
+from monitoring_config_generator.exceptions import MonitoringConfigGeneratorException
+from monitoring_config_generator.icinga_reload import IcingaReloader, split_command, signal_number
+from test_doubles import Clock
+
+
+RELOAD_SETTINGS = {'RELOAD_COMMAND': None, 'RELOAD_SIGNAL': None, 'RELOAD_PID_FILE': None,
+                   'RELOAD_PREFLIGHT': None, 'RELOAD_DEBOUNCE': 30}
+
+
+class TestHelpers(unittest.TestCase):
+    def test_split_command(self):
+        self.assertEquals(['icinga', '-v', '/etc/icinga/my config.cfg'],
+                          split_command('icinga -v "/etc/icinga/my config.cfg"'))
+        self.assertEquals(['kill', '-HUP', '1'], split_command(['kill', '-HUP', 1]))
+
+    def test_signal_number(self):
+        self.assertEquals(signal.SIGHUP, signal_number('SIGHUP'))
+        self.assertEquals(signal.SIGHUP, signal_number('hup'))
+        self.assertEquals(signal.SIGUSR1, signal_number(signal.SIGUSR1))
+        self.assertRaises(MonitoringConfigGeneratorException, signal_number, 'SIGNOTHING')
+
+
+@patch.dict('monitoring_config_generator.icinga_reload.CONFIG', RELOAD_SETTINGS)
+class TestIcingaReloader(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.log = os.path.join(self.directory, 'log')
+        self.clock = Clock()
+        self.reloader = IcingaReloader(self.clock)
+
+    def logging_command(self, name, exit_code=0):
+        return ['sh', '-c', 'echo %s >> %s; cat "$MONCONFGENERATOR_CHANGED_FILES_LIST" >> %s; exit %d' % (name, self.log, self.log, exit_code)]
+
+    def logged(self):
+        if not os.path.exists(self.log):
+            return []
+        with open(self.log) as log:
+            return log.read().split()
+
+    def configure(self, **settings):
+        from monitoring_config_generator.icinga_reload import CONFIG
+        CONFIG.update(settings)
+
+    def test_reloads_once_per_debounce_window(self):
+        self.configure(RELOAD_COMMAND=self.logging_command('reload'))
+        self.reloader.changed('a.cfg')
+        self.clock.now += 20
+        self.reloader.changed('b.cfg')
+        self.reloader.changed('a.cfg')
+        self.assertEquals(10, self.reloader.seconds_until_due())
+        self.assertFalse(self.reloader.reload_if_due())
+
+        self.clock.now += 10
+        self.assertTrue(self.reloader.reload_if_due())
+        self.assertEquals(['reload', 'a.cfg', 'b.cfg'], self.logged())
+        self.assertIsNone(self.reloader.seconds_until_due())
+        self.assertFalse(self.reloader.reload_if_due())
+
+    def test_passes_more_changed_files_than_fit_into_an_environment_variable(self):
+        self.configure(RELOAD_COMMAND=self.logging_command('reload'))
+        changed_files = ['host%05d.some.domain.cfg' % number for number in range(10000)]
+        self.assertTrue(len('\n'.join(changed_files)) > 128 * 1024)
+        for file_name in changed_files:
+            self.reloader.changed(file_name)
+        self.assertTrue(self.reloader.reload())
+        self.assertEquals(['reload'] + changed_files, self.logged())
+
+    def test_nothing_changed_nothing_reloaded(self):
+        self.configure(RELOAD_COMMAND=self.logging_command('reload'))
+        self.assertFalse(self.reloader.reload())
+        self.assertEquals([], self.logged())
+
+    def test_preflight_runs_first(self):
+        self.configure(RELOAD_COMMAND=self.logging_command('reload'), RELOAD_PREFLIGHT=self.logging_command('check'))
+        self.reloader.changed('a.cfg')
+        self.assertTrue(self.reloader.reload())
+        self.assertEquals(['check', 'a.cfg', 'reload', 'a.cfg'], self.logged())
+
+    def test_failed_preflight_keeps_the_changes_for_the_next_window(self):
+        self.configure(RELOAD_COMMAND=self.logging_command('reload'),
+                       RELOAD_PREFLIGHT=self.logging_command('check', exit_code=1))
+        self.reloader.changed('a.cfg')
+        self.assertFalse(self.reloader.reload())
+        self.assertEquals(['check', 'a.cfg'], self.logged())
+        self.assertEquals(30, self.reloader.seconds_until_due())
+
+    def test_sends_signal_to_pid_from_file(self):
+        pid_file = os.path.join(self.directory, 'icinga.pid')
+        with open(pid_file, 'w') as pid:
+            pid.write('4711\n')
+        self.configure(RELOAD_SIGNAL='SIGHUP', RELOAD_PID_FILE=pid_file)
+        self.reloader.changed('a.cfg')
+        with patch('monitoring_config_generator.icinga_reload.os.kill') as kill_mock:
+            self.assertTrue(self.reloader.reload())
+        kill_mock.assert_called_once_with(4711, signal.SIGHUP)
+
+    def test_changes_are_dropped_without_reload_settings(self):
+        self.assertFalse(IcingaReloader.is_configured())
+        self.reloader.changed('a.cfg')
+        self.assertFalse(self.reloader.reload())
+        self.assertIsNone(self.reloader.seconds_until_due())
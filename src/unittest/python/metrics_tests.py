@@ -0,0 +1,139 @@
+import os
+import shutil
+import socket
+import tempfile
+import unittest
+
+from mock import patch
+
+os.environ['MONITORING_CONFIG_GENERATOR_CONFIG'] = "testdata/testconfig.yaml"
+from monitoring_config_generator import metrics
+from monitoring_config_generator.metrics import NullRecorder, Recorder, PrometheusTextfileRecorder, \
+    StatsdRecorder, NULL_TIMER, create_recorder
+from monitoring_config_generator.MonitoringConfigGenerator import MonitoringConfigGenerator
+from monitoring_config_generator.settings import CONFIG
+from monitoring_config_generator.yaml_tools.config import YamlConfig
+
+
+class TestRecorders(unittest.TestCase):
+    def test_null_recorder_records_nothing(self):
+        recorder = NullRecorder()
+        recorder.increment('files_written')
+        recorder.observe('fetch_seconds', 1.0)
+        self.assertIs(NULL_TIMER, recorder.timer('fetch_seconds'))
+        self.assertFalse(hasattr(recorder, 'counters'))
+
+    def test_recorder_counts_and_times(self):
+        recorder = Recorder()
+        recorder.increment('files_written')
+        recorder.increment('files_written', 2)
+        with recorder.timer('write_seconds'):
+            pass
+        recorder.observe('write_seconds', 0.3)
+        recorder.observe('write_seconds', 20)
+
+        self.assertEquals({'files_written': 3}, recorder.counters)
+        histogram = recorder.histograms['write_seconds']
+        self.assertEquals(3, histogram.count)
+        self.assertEquals(1, histogram.bucket_counts[0])
+        self.assertEquals(2, histogram.cumulative_counts()[-1])
+
+    def test_prometheus_textfile(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, 'monconfgenerator.prom')
+        recorder = PrometheusTextfileRecorder(path, 'mcg')
+        recorder.increment('not_modified', 4)
+        recorder.observe('fetch_seconds', 0.2)
+
+        recorder.export()
+
+        with open(path) as textfile:
+            lines = textfile.read().splitlines()
+        self.assertEquals(['# TYPE mcg_not_modified_total counter', 'mcg_not_modified_total 4'], lines[:2])
+        self.assertIn('# TYPE mcg_fetch_seconds histogram', lines)
+        self.assertIn('mcg_fetch_seconds_bucket{le="0.1"} 0', lines)
+        self.assertIn('mcg_fetch_seconds_bucket{le="0.25"} 1', lines)
+        self.assertIn('mcg_fetch_seconds_bucket{le="+Inf"} 1', lines)
+        self.assertIn('mcg_fetch_seconds_count 1', lines)
+
+    def test_statsd_sends_what_was_recorded_since_the_last_export(self):
+        server = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.addCleanup(server.close)
+        server.bind(('127.0.0.1', 0))
+        server.settimeout(5)
+        recorder = StatsdRecorder('127.0.0.1:%d' % server.getsockname()[1], 'mcg')
+        self.addCleanup(recorder.socket.close)
+        recorder.increment('bytes_fetched', 1234)
+        recorder.observe('fetch_seconds', 0.25)
+
+        recorder.export()
+
+        self.assertEquals('mcg.bytes_fetched:1234|c\nmcg.fetch_seconds:250.000|ms', server.recv(4096))
+        self.assertEquals([], recorder.lines())
+
+    def test_statsd_packets_are_split(self):
+        recorder = StatsdRecorder('localhost:8125')
+        self.addCleanup(recorder.socket.close)
+        for number in range(50):
+            recorder.increment('counter_%02d' % number)
+        with patch.object(recorder, '_send') as send_mock:
+            recorder.export()
+        packets = [call[0][0] for call in send_mock.call_args_list]
+        self.assertTrue(len(packets) > 1)
+        self.assertTrue(all(len(packet) <= metrics.STATSD_PACKET_SIZE for packet in packets))
+        self.assertEquals(50, sum(len(packet.split('\n')) for packet in packets))
+
+
+class TestCreateRecorder(unittest.TestCase):
+    @patch.dict(CONFIG, {'METRICS': None})
+    def test_nothing_is_recorded_by_default(self):
+        self.assertIs(NullRecorder, type(create_recorder()))
+
+    @patch.dict(CONFIG, {'METRICS': 'prometheus', 'METRICS_TEXTFILE': '/tmp/x.prom', 'METRICS_PREFIX': 'p'})
+    def test_prometheus(self):
+        recorder = create_recorder()
+        self.assertIsInstance(recorder, PrometheusTextfileRecorder)
+        self.assertEquals(('/tmp/x.prom', 'p'), (recorder.path, recorder.prefix))
+
+    @patch.dict(CONFIG, {'METRICS': 'statsd', 'METRICS_STATSD': 'statsd.local:9125'})
+    def test_statsd(self):
+        recorder = create_recorder()
+        recorder.socket.close()
+        self.assertEquals(('statsd.local', 9125), recorder.address)
+
+    @patch.dict(CONFIG, {'METRICS': 'graphite'})
+    def test_unknown_export_records_nothing(self):
+        self.assertIs(NullRecorder, type(create_recorder()))
+
+
+class TestInstrumentation(unittest.TestCase):
+    def setUp(self):
+        self.recorder = Recorder()
+        metrics.set_recorder(self.recorder)
+        self.addCleanup(metrics.set_recorder, None)
+
+    def test_variable_expansions_are_counted(self):
+        YamlConfig({'variables': {'A': 'a', 'B': '${A}b'},
+                    'defaults': {'notes': '${B}', 'check_period': '24x7'},
+                    'host': {'host_name': 'h'},
+                    'services': {'s': {'service_description': 's', 'notes_url': 'plain'}}},
+                   skip_checks=True)
+        # ${B} in the defaults and ${A} while resolving B
+        self.assertEquals(2, self.recorder.counters['variable_expansions'])
+        self.assertIn('generate_seconds', self.recorder.histograms)
+        self.assertIn('validate_seconds', self.recorder.histograms)
+
+    def test_generator_stages_are_recorded(self):
+        shutil.rmtree(CONFIG["TARGET_DIR"], True)
+        os.mkdir(CONFIG["TARGET_DIR"])
+        yaml_file = os.path.abspath('testdata/itest_testhost03_new_format/testhost03.yaml')
+
+        MonitoringConfigGenerator(yaml_file).generate()
+        with patch('os.path.getmtime', return_value=2 ** 31):
+            MonitoringConfigGenerator(yaml_file).generate()
+
+        self.assertEquals({'services_rendered': 4, 'files_written': 1, 'files_unchanged': 1,
+                           'variable_expansions': 0}, self.recorder.counters)
+        for stage in 'parse_seconds', 'generate_seconds', 'write_seconds', 'host_seconds':
+            self.assertEquals(2, self.recorder.histograms[stage].count, stage)
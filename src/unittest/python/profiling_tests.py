@@ -0,0 +1,106 @@
+import os
+import pstats
+import shutil
+import tempfile
+import unittest
+
+from mock import patch
+
+os.environ['MONITORING_CONFIG_GENERATOR_CONFIG'] = "testdata/testconfig.yaml"
+from monitoring_config_generator.fleet import FleetGenerator
+from monitoring_config_generator.MonitoringConfigGenerator import run_generator, EXIT_CODE_CONFIG_WRITTEN
+from monitoring_config_generator.profiling import Profiler, SlowestHosts, collapsed_stacks, frame_label, \
+    COLLAPSED_SUFFIX
+from monitoring_config_generator.settings import CONFIG
+
+
+def leaf(n):
+    return sum(i * i for i in xrange(n))
+
+
+def middle():
+    return leaf(20000) + leaf(20000)
+
+
+def top():
+    return middle() + leaf(40000)
+
+
+class ProfileDirectory(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        shutil.rmtree(CONFIG["TARGET_DIR"], True)
+        os.mkdir(CONFIG["TARGET_DIR"])
+        self.yaml_file = os.path.abspath('testdata/itest_testhost03_new_format/testhost03.yaml')
+
+
+class TestCollapsedStacks(ProfileDirectory):
+    def profile_of_top(self):
+        path = os.path.join(self.directory, 'top.pstats')
+        self.assertEquals(top(), Profiler(path).run('top', top))
+        return path
+
+    def test_frame_label(self):
+        self.assertEquals('leaf (profiling_tests.py:17)', frame_label(('/src/profiling_tests.py', 17, 'leaf')))
+        self.assertEquals("<method 'join' of 'str' objects>", frame_label(('~', 0, "<method 'join' of 'str' objects>")))
+        self.assertEquals('f (a,b.py:1)', frame_label(('a;b.py', 1, 'f')))
+
+    def test_stacks_follow_the_calls(self):
+        stacks = dict(line.rsplit(' ', 1) for line in collapsed_stacks(pstats.Stats(self.profile_of_top())))
+        top_frame, middle_frame, leaf_frame = [
+            frame_label((function.func_code.co_filename, function.func_code.co_firstlineno, function.__name__))
+            for function in (top, middle, leaf)]
+
+        self.assertTrue(any(stack.startswith(';'.join([top_frame, middle_frame, leaf_frame])) for stack in stacks))
+        self.assertTrue(any(stack.startswith(';'.join([top_frame, leaf_frame])) for stack in stacks))
+        self.assertFalse(any(stack.startswith(middle_frame) for stack in stacks))
+        self.assertTrue(all(int(microseconds) > 0 for microseconds in stacks.values()))
+
+    def test_profiler_writes_pstats_and_collapsed_stacks(self):
+        path = self.profile_of_top()
+        self.assertTrue(pstats.Stats(path).total_tt > 0)
+        with open(path + COLLAPSED_SUFFIX) as collapsed:
+            self.assertEquals(collapsed_stacks(pstats.Stats(path)), collapsed.read().splitlines())
+
+    def test_profiler_writes_the_profile_of_a_failed_run(self):
+        path = os.path.join(self.directory, 'failed.pstats')
+        self.assertRaises(ZeroDivisionError, Profiler(path).run, 'failed', lambda: 1 / 0)
+        self.assertTrue(os.path.exists(path + COLLAPSED_SUFFIX))
+
+    def test_run_generator_profiles_generate(self):
+        path = os.path.join(self.directory, 'host.pstats')
+        result = run_generator(self.yaml_file, profiler=Profiler(path))
+        self.assertEquals(EXIT_CODE_CONFIG_WRITTEN, result.exit_code)
+        roots = [function[2] for function, (_, _, _, _, callers) in pstats.Stats(path).stats.iteritems()
+                 if not callers and function[0] != '~']
+        self.assertEquals(['generate'], roots)
+        self.assertIn('render_section', [name for _, _, name in pstats.Stats(path).stats])
+
+
+class TestSlowestHosts(ProfileDirectory):
+    def test_keeps_the_slowest_runs(self):
+        slowest_hosts = SlowestHosts(2)
+        for name, seconds in [('a', 3), ('b', 1), ('c', 5), ('d', 2)]:
+            with patch('monitoring_config_generator.profiling.time.time', side_effect=[0, seconds]):
+                self.assertEquals(name, slowest_hosts.run(name, lambda: name))
+        self.assertEquals([(5, 'c'), (3, 'a')], [(seconds, name) for seconds, name, _ in slowest_hosts.slowest()])
+
+    def test_keeps_failed_runs(self):
+        slowest_hosts = SlowestHosts(1)
+        self.assertRaises(ZeroDivisionError, slowest_hosts.run, 'failed', lambda: 1 / 0)
+        self.assertEquals(['failed'], [name for _, name, _ in slowest_hosts.slowest()])
+
+    def test_fleet_writes_the_profiles_of_the_slowest_hosts(self):
+        slowest_hosts = SlowestHosts(1)
+        results = FleetGenerator([self.yaml_file, self.yaml_file + '.missing'], profiler=slowest_hosts).generate()
+        self.assertEquals(2, len(results))
+
+        directory = os.path.join(self.directory, 'profiles')
+        paths = slowest_hosts.write(directory)
+
+        self.assertEquals(1, len(paths))
+        self.assertTrue(os.path.basename(paths[0]).startswith('01-'))
+        self.assertTrue(paths[0].endswith('.pstats'))
+        self.assertEquals(sorted([os.path.basename(paths[0]), os.path.basename(paths[0]) + COLLAPSED_SUFFIX]),
+                          sorted(os.listdir(directory)))
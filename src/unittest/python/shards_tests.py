@@ -0,0 +1,194 @@
+import os
+import shutil
+import time
+import unittest
+
+from mock import patch
+
+os.environ['MONITORING_CONFIG_GENERATOR_CONFIG'] = "testdata/testconfig.yaml"
+from monitoring_config_generator.atomic_file import write_atomically
+from monitoring_config_generator.daemon import Daemon
+from monitoring_config_generator.fleet import FleetGenerator
+from monitoring_config_generator.header_index import HeaderIndex, content_hash
+from monitoring_config_generator.MonitoringConfigGenerator import (MonitoringConfigGenerator,
+                                                                   EXIT_CODE_CONFIG_WRITTEN,
+                                                                   EXIT_CODE_NOT_WRITTEN)
+from monitoring_config_generator.settings import CONFIG
+from monitoring_config_generator.shards import (ShardedOutput, shard_file_name, is_shard_file, read_blocks,
+                                                render_shard)
+from monitoring_config_generator.yaml_tools.readers import Header
+from test_doubles import ImmediatePool
+
+
+HOSTS = ['itest_testhost03_new_format/testhost03.yaml',
+         'itest_testhost04_defaults/testhost04.yaml',
+         'itest_testhost05_variables/testhost05.yaml']
+
+
+def touch(path):
+    """a later mtime than path had, also within the same second, headers keep whole seconds"""
+    mtime = max(time.time(), os.path.getmtime(path) + 1)
+    os.utime(path, (mtime, mtime))
+
+
+def block(etag, body='\ndefine host {\n}\n'):
+    return "".join(line + "\n" for line in Header(etag=etag, mtime=1).serialize()) + body
+
+
+class TestShardFiles(unittest.TestCase):
+    def test_shard_of_a_host_is_stable(self):
+        self.assertEquals('monconfgenerator-shard-003.cfg', shard_file_name('testhost03.cfg', 4))
+        self.assertEquals(shard_file_name('a.cfg', 16), shard_file_name('a.cfg', 16))
+        self.assertTrue(is_shard_file(shard_file_name('a.cfg', 16)))
+        self.assertFalse(is_shard_file('testhost03.cfg'))
+
+    def test_hosts_spread_over_the_shards(self):
+        shards = set(shard_file_name('host%d.cfg' % i, 8) for i in range(200))
+        self.assertEquals(8, len(shards))
+
+    def test_blocks_are_read_back_as_written(self):
+        blocks = {'b.cfg': block('"b"'), 'a.cfg': block('"a"', '\ndefine host {\n    host_name a\n}\n')}
+        path = os.path.join(CONFIG['TARGET_DIR'], 'shard.cfg')
+        shutil.rmtree(CONFIG['TARGET_DIR'], True)
+        os.mkdir(CONFIG['TARGET_DIR'])
+        with open(path, 'w') as shard:
+            shard.write(render_shard(blocks))
+        self.assertEquals(blocks, read_blocks(path))
+        self.assertEquals({}, read_blocks(path + '.missing'))
+
+
+class TestShardedOutput(unittest.TestCase):
+    def setUp(self):
+        self.target_dir = CONFIG['TARGET_DIR']
+        shutil.rmtree(self.target_dir, True)
+        os.mkdir(self.target_dir)
+        self.index = HeaderIndex(self.target_dir)
+        self.output = ShardedOutput(self.target_dir, 4, self.index)
+
+    def put(self, file_name, etag, output=None):
+        content = block(etag)
+        (output or self.output).put(file_name, content, Header(etag=etag, mtime=1),
+                                    content_hash(content.splitlines(True)))
+
+    def test_flush_writes_each_shard_once_and_updates_the_index(self):
+        for i in range(10):
+            self.put('host%d.cfg' % i, '"%d"' % i)
+        with patch('monitoring_config_generator.shards.write_atomically', wraps=write_atomically) as write_mock:
+            written = self.output.flush()
+        self.assertEquals(sorted(written),
+                          sorted(os.path.basename(call[0][0]) for call in write_mock.call_args_list))
+        self.assertEquals(set(written), set(shard_file_name('host%d.cfg' % i, 4) for i in range(10)))
+        self.assertEquals('"3"', self.index.get('host3.cfg').etag)
+        self.assertEquals(shard_file_name('host3.cfg', 4), self.index.entries['host3.cfg']['shard'])
+        self.assertEquals([], self.output.flush())
+
+    def test_only_shards_of_changed_hosts_are_rewritten(self):
+        for i in range(10):
+            self.put('host%d.cfg' % i, '"%d"' % i)
+        self.output.flush()
+        self.put('host3.cfg', '"new"')
+        self.assertEquals([shard_file_name('host3.cfg', 4)], self.output.flush())
+        blocks = read_blocks(os.path.join(self.target_dir, shard_file_name('host3.cfg', 4)))
+        self.assertIn('# ETag: "new"\n', blocks['host3.cfg'])
+
+    def test_host_file_is_replaced_by_its_block(self):
+        open(os.path.join(self.target_dir, 'host1.cfg'), 'w').close()
+        self.put('host1.cfg', '"1"')
+        self.output.flush()
+        self.assertEquals([shard_file_name('host1.cfg', 4)],
+                          [name for name in os.listdir(self.target_dir) if name.endswith('.cfg')])
+
+    def test_host_moves_to_its_new_shard(self):
+        for i in range(10):
+            self.put('host%d.cfg' % i, '"%d"' % i)
+        self.output.flush()
+        resharded = ShardedOutput(self.target_dir, 7, self.index)
+        moving = [name for name in ('host%d.cfg' % i for i in range(10))
+                  if shard_file_name(name, 4) != shard_file_name(name, 7)][0]
+        self.put(moving, '"moved"', resharded)
+        resharded.flush()
+
+        shards_with_host = [name for name in os.listdir(self.target_dir) if is_shard_file(name) and
+                            moving in read_blocks(os.path.join(self.target_dir, name))]
+        self.assertEquals([shard_file_name(moving, 7)], shards_with_host)
+
+
+@patch.dict('monitoring_config_generator.MonitoringConfigGenerator.CONFIG', {'OUTPUT_SHARDS': 4})
+class TestShardedGeneration(unittest.TestCase):
+    def setUp(self):
+        self.target_dir = CONFIG['TARGET_DIR']
+        shutil.rmtree(self.target_dir, True)
+        os.mkdir(self.target_dir)
+
+    def urls(self):
+        return [os.path.abspath(os.path.join('testdata', host)) for host in HOSTS]
+
+    def config_files(self):
+        return sorted(name for name in os.listdir(self.target_dir) if name.endswith('.cfg'))
+
+    def test_single_run_writes_the_host_into_its_shard(self):
+        MonitoringConfigGenerator(self.urls()[0]).generate()
+        self.assertEquals([shard_file_name('testhost03.cfg', 4)], self.config_files())
+
+        with open('testdata/itest_testhost03_new_format/testhost03.cfg') as expected:
+            expected_body = [line for line in expected if not line.startswith('#')]
+        block_lines = read_blocks(os.path.join(self.target_dir, shard_file_name('testhost03.cfg', 4)))[
+            'testhost03.cfg'].splitlines(True)
+        self.assertEquals(expected_body, [line for line in block_lines if not line.startswith('#')])
+
+    def test_unchanged_hosts_are_not_written_again(self):
+        MonitoringConfigGenerator(self.urls()[0]).generate()
+        touch(self.urls()[0])
+        generator = MonitoringConfigGenerator(self.urls()[0])
+        self.assertIsNone(generator.generate())
+        self.assertEquals('unchanged', generator.status)
+
+    def test_host_leaves_its_shard_when_shards_are_turned_off(self):
+        for url in self.urls():
+            MonitoringConfigGenerator(url).generate()
+        shard = shard_file_name('testhost03.cfg', 4)
+        touch(self.urls()[0])
+
+        with patch.dict(CONFIG, {'OUTPUT_SHARDS': None}):
+            MonitoringConfigGenerator(self.urls()[0]).generate()
+
+        self.assertTrue(os.path.exists(os.path.join(self.target_dir, 'testhost03.cfg')))
+        hosts_in_shards = set()
+        for name in self.config_files():
+            if is_shard_file(name):
+                hosts_in_shards.update(read_blocks(os.path.join(self.target_dir, name)))
+        self.assertEquals(set(['testhost04.cfg', 'testhost05.cfg']), hosts_in_shards)
+        index = HeaderIndex.load(self.target_dir)
+        self.assertNotIn('shard', index.entry('testhost03.cfg'))
+        self.assertEquals(shard_file_name('testhost04.cfg', 4), index.entry('testhost04.cfg')['shard'])
+        self.assertEquals(index.files[shard], index._stat(shard))
+
+    @patch.dict('monitoring_config_generator.fleet.CONFIG', {'OUTPUT_SHARDS': 4})
+    def test_fleet_writes_shards_once_and_index_survives_reload(self):
+        fleet = FleetGenerator(self.urls())
+        results = fleet.generate()
+        self.assertEquals([EXIT_CODE_CONFIG_WRITTEN] * 3, [result.exit_code for result in results])
+        self.assertEquals(sorted(set(shard_file_name('testhost0%d.cfg' % i, 4) for i in (3, 4, 5))),
+                          sorted(fleet.written_shards))
+        self.assertEquals(sorted(fleet.written_shards), self.config_files())
+
+        index = HeaderIndex.load(self.target_dir)
+        rebuilt = HeaderIndex.rebuild(self.target_dir)
+        self.assertEquals(sorted(index.entries), ['testhost03.cfg', 'testhost04.cfg', 'testhost05.cfg'])
+        for file_name, entry in rebuilt.entries.items():
+            self.assertEquals(index.entries[file_name]['hash'], entry['hash'])
+            self.assertEquals(index.entries[file_name]['shard'], entry['shard'])
+
+        results = FleetGenerator(self.urls()).generate()
+        self.assertEquals([EXIT_CODE_NOT_WRITTEN] * 3, [result.exit_code for result in results])
+
+    def test_daemon_writes_shards_when_maintaining(self):
+        daemon = Daemon(lambda: self.urls())
+        daemon.start()
+        self.addCleanup(daemon.fetcher.close)
+        daemon.dispatch_due(ImmediatePool())
+        self.assertEquals([], self.config_files())
+
+        daemon.maintain()
+        self.assertEquals(sorted(set(shard_file_name('testhost0%d.cfg' % i, 4) for i in (3, 4, 5))),
+                          self.config_files())
@@ -0,0 +1,93 @@
+import json
+import os
+import subprocess
+import sys
+import unittest
+
+os.environ['MONITORING_CONFIG_GENERATOR_CONFIG'] = "testdata/testconfig.yaml"
+from monitoring_config_generator.settings import CONFIG, LazyConfig
+
+
+# the import time is measured by src/benchmark/python/startup_benchmark.py
+HEAVY_MODULES = ['requests', 'yaml', 'docopt', 'msgpack']
+
+REPORT = '''
+import json, logging, sys
+import monitoring_config_generator
+package_modules = [name for name in %(heavy_modules)r if name in sys.modules]
+import monitoring_config_generator.MonitoringConfigGenerator as mcg
+%(code)s
+from monitoring_config_generator.settings import CONFIG
+handlers = logging.getLogger('monconfgenerator').handlers
+print json.dumps({'package_modules': package_modules,
+                  'modules': [name for name in %(heavy_modules)r if name in sys.modules],
+                  'config_loaded': CONFIG.loaded,
+                  'handlers': [type(handler).__name__ for handler in handlers]})
+'''
+
+
+def run_python(code):
+    environment = dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path))
+    process = subprocess.Popen([sys.executable, '-c', code], env=environment,
+                               stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    stdout, stderr = process.communicate()
+    return process.returncode, stdout, stderr
+
+
+class TestStartup(unittest.TestCase):
+    def report(self, code=''):
+        returncode, stdout, stderr = run_python(REPORT % {'code': code, 'heavy_modules': HEAVY_MODULES})
+        self.assertEquals(0, returncode, stderr)
+        self.assertEquals('', stderr)
+        return json.loads(stdout)
+
+    def test_import_loads_nothing_heavy_and_has_no_side_effects(self):
+        report = self.report()
+        self.assertEquals([], report['package_modules'])
+        self.assertEquals([], report['modules'])
+        self.assertFalse(report['config_loaded'])
+        self.assertEquals(['NullHandler'], report['handlers'])
+
+    def test_file_run_does_without_requests_and_docopt(self):
+        report = self.report("mcg.run_generator('testdata/itest_testhost03_new_format/testhost03.yaml')")
+        self.assertEquals(['yaml'], report['modules'])
+        self.assertTrue(report['config_loaded'])
+
+
+class TestLazyConfig(unittest.TestCase):
+    def setUp(self):
+        self.loads = []
+        self.config = LazyConfig(self.load)
+
+    def load(self):
+        self.loads.append(1)
+        return {'INDENT': '  ', 'PORT': '8935'}
+
+    def test_loads_once_on_first_use(self):
+        self.assertFalse(self.config.loaded)
+        self.assertEquals('  ', self.config['INDENT'])
+        self.assertEquals('8935', self.config.get('PORT'))
+        self.assertTrue('PORT' in self.config)
+        self.assertEquals(1, len(self.loads))
+
+    def test_behaves_like_a_dict(self):
+        self.config['NEW'] = 1
+        del self.config['PORT']
+        self.assertEquals({'INDENT': '  ', 'NEW': 1}, dict(self.config))
+        self.assertEquals({'INDENT': '  ', 'NEW': 1}, self.config.copy())
+        self.config.clear()
+        self.config.update({'A': 2})
+        self.assertEquals(['A'], list(self.config))
+        self.assertEquals(1, len(self.config))
+
+    def test_replace_swaps_all_settings_at_once(self):
+        old_settings = self.config._data()
+        self.config.replace({'INDENT': '    '})
+        # a reader still holding the old settings finds every key
+        self.assertEquals({'INDENT': '  ', 'PORT': '8935'}, old_settings)
+        self.assertEquals({'INDENT': '    '}, self.config.copy())
+        self.assertEquals(1, len(self.loads))
+
+    def test_settings_are_lazy(self):
+        self.assertIsInstance(CONFIG, LazyConfig)
+        self.assertEquals('testdata/out', CONFIG['TARGET_DIR'])
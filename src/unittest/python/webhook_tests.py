@@ -0,0 +1,108 @@
+import os
+import shutil
+import threading
+import unittest
+
+import requests
+from mock import patch
+
+os.environ['MONITORING_CONFIG_GENERATOR_CONFIG'] = "testdata/testconfig.yaml"
+from monitoring_config_generator.daemon import Daemon
+from monitoring_config_generator.MonitoringConfigGenerator import EXIT_CODE_CONFIG_WRITTEN
+from monitoring_config_generator.settings import CONFIG
+from monitoring_config_generator.webhook import (PushedFetcher, PushedResponse, WebhookServer,
+                                                 parse_listen_address, TOKEN_HEADER)
+from monitoring_config_generator.yaml_tools.readers import read_config_from_host
+from test_doubles import ImmediatePool
+
+
+URL = 'http://testhost03.example.com:8935/monitoring'
+
+
+class TestParseListenAddress(unittest.TestCase):
+    def test_host_and_port(self):
+        self.assertEquals(('0.0.0.0', 8936), parse_listen_address('0.0.0.0:8936'))
+
+    @patch.dict('monitoring_config_generator.webhook.CONFIG', {'WEBHOOK_HOST': '127.0.0.1'})
+    def test_port_only_listens_on_webhook_host(self):
+        self.assertEquals(('127.0.0.1', 8936), parse_listen_address(8936))
+        self.assertEquals(('127.0.0.1', 8936), parse_listen_address(':8936'))
+
+
+class TestPushedFetcher(unittest.TestCase):
+    def test_pushed_document_is_read_like_a_download(self):
+        fetcher = PushedFetcher(PushedResponse('host:\n    host_name: pushed\n', 'application/x-yaml'))
+        yaml_config, header = read_config_from_host(URL, fetcher=fetcher)
+        self.assertEquals({'host': {'host_name': 'pushed'}}, yaml_config)
+        self.assertTrue(header.etag.startswith('"push-'))
+        self.assertIsNotNone(header.mtime)
+
+    def test_pushed_json(self):
+        fetcher = PushedFetcher(PushedResponse('{"host": {"host_name": "pushed"}}', 'application/json'))
+        self.assertEquals({'host': {'host_name': 'pushed'}}, read_config_from_host(URL, fetcher=fetcher)[0])
+
+
+class TestWebhookServer(unittest.TestCase):
+    def setUp(self):
+        shutil.rmtree(CONFIG['TARGET_DIR'], True)
+        os.mkdir(CONFIG['TARGET_DIR'])
+        self.daemon = Daemon(lambda: [URL, 'testdata/itest_testhost04_defaults'])
+        self.daemon.start()
+        self.addCleanup(self.daemon.fetcher.close)
+        # the initial runs are done, only notified hosts are due
+        self.daemon._schedule = []
+        self.server = WebhookServer(('127.0.0.1', 0), self.daemon)
+        thread = threading.Thread(target=self.server.serve_forever, kwargs={'poll_interval': 0.05})
+        thread.start()
+        self.addCleanup(thread.join)
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+
+    def post(self, path, data=None, headers=None):
+        return requests.post('http://127.0.0.1:%d%s' % (self.server.server_address[1], path),
+                             data=data, headers=headers)
+
+    def test_notify_by_host_name(self):
+        response = self.post('/notify?host=testhost03.example.com')
+        self.assertEquals(202, response.status_code)
+        self.assertEquals([URL], [url for _, url in self.daemon._schedule])
+
+    def test_notify_by_url(self):
+        self.assertEquals(202, self.post('/notify?url=testdata/itest_testhost04_defaults').status_code)
+        self.assertEquals(['testdata/itest_testhost04_defaults'], [url for _, url in self.daemon._schedule])
+
+    def test_unknown_hosts_and_paths(self):
+        self.assertEquals(404, self.post('/notify?host=unknown.example.com').status_code)
+        self.assertEquals(404, self.post('/notify').status_code)
+        self.assertEquals(404, self.post('/other?host=testhost03.example.com').status_code)
+        self.assertEquals([], self.daemon._schedule)
+
+    def test_pushed_document_is_generated(self):
+        with open('testdata/itest_testhost03_new_format/testhost03.yaml') as monitoring_yaml:
+            response = self.post('/push?host=testhost03.example.com', monitoring_yaml.read(),
+                                 {'Content-Type': 'application/x-yaml'})
+        self.assertEquals(202, response.status_code)
+
+        results = []
+        with patch.object(self.daemon, 'finished', side_effect=results.append):
+            self.daemon.dispatch_due(ImmediatePool())
+        self.assertEquals(EXIT_CODE_CONFIG_WRITTEN, results[0].exit_code, results[0].error)
+        self.assertTrue(os.path.exists(os.path.join(CONFIG['TARGET_DIR'], 'testhost03.cfg')))
+        self.assertTrue(self.daemon.header_index.get('testhost03.cfg').is_pushed)
+
+    def test_documents_can_only_be_pushed_for_http_urls(self):
+        response = self.post('/push?url=testdata/itest_testhost04_defaults', 'host: {}')
+        self.assertEquals(400, response.status_code)
+
+    @patch.dict('monitoring_config_generator.webhook.CONFIG', {'WEBHOOK_MAX_BODY': 10})
+    def test_too_large_documents_are_refused(self):
+        self.assertEquals(413, self.post('/push?host=testhost03.example.com', 'x' * 11).status_code)
+        self.assertEquals([], self.daemon._schedule)
+
+    @patch.dict('monitoring_config_generator.webhook.CONFIG', {'WEBHOOK_TOKEN': 'secret'})
+    def test_token_is_required_if_configured(self):
+        self.assertEquals(403, self.post('/notify?host=testhost03.example.com').status_code)
+        self.assertEquals(403, self.post('/notify?host=testhost03.example.com',
+                                         headers={TOKEN_HEADER: 'wrong'}).status_code)
+        self.assertEquals(202, self.post('/notify?host=testhost03.example.com',
+                                         headers={TOKEN_HEADER: 'secret'}).status_code)
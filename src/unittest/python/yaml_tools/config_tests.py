@@ -4,14 +4,105 @@ import shutil
 import unittest
 
 import yaml
+from hypothesis import given, strategies
 
 from monitoring_config_generator.exceptions import ConfigurationContainsUndefinedVariables, UnknownSectionException, \
-    MandatoryDirectiveMissingException, HostNamesNotEqualException, ServiceDescriptionNotUniqueException
-from monitoring_config_generator.settings import CONFIG
+    MandatoryDirectiveMissingException, HostNamesNotEqualException, ServiceDescriptionNotUniqueException, \
+    CircularVariableDefinitionException
+from monitoring_config_generator.settings import CONFIG, ICINGA_HOST_DIRECTIVES, ICINGA_SERVICE_DIRECTIVES
 from monitoring_config_generator.yaml_tools.config import YamlConfig
 from test_logger import init_test_logger
 
 
+def first_error_of_separate_checks(host, services):
+    """the checks YamlConfig ran one after the other before they were done in one pass, as reference"""
+    for directive in ICINGA_HOST_DIRECTIVES:
+        if not directive in host:
+            return MandatoryDirectiveMissingException("Mandatory directive %s is missing from host-section" % directive)
+    for directive in ICINGA_SERVICE_DIRECTIVES:
+        for service in services:
+            if not directive in service:
+                return MandatoryDirectiveMissingException("Mandatory directive %s is missing from service %s" %
+                                                          (directive, service))
+    all_host_names = set([service["host_name"] for service in services])
+    all_host_names.add(host["host_name"])
+    if len(all_host_names) > 1:
+        return HostNamesNotEqualException("More than one host_name was generated: %s" % all_host_names)
+    used_descriptions = set()
+    multiple_descriptions = set()
+    for service in services:
+        service_description = service["service_description"]
+        if service_description in used_descriptions:
+            multiple_descriptions.add(service_description)
+        used_descriptions.add(service_description)
+    if len(multiple_descriptions) > 0:
+        return ServiceDescriptionNotUniqueException("Service description %s used for more than one service" %
+                                                    multiple_descriptions)
+    undefined_variables = set()
+    for settings in [host] + services:
+        for setting_key in settings:
+            undefined_variables.update(re.findall('\$\{[^}]+\}', str(settings[setting_key])))
+    if undefined_variables:
+        return ConfigurationContainsUndefinedVariables("Monitoring yaml contains undefined variables: '%s'" %
+                                                       ', '.join(undefined_variables))
+
+
+def section(directives):
+    # drop a few directives, the remaining get one of few values, so names and descriptions collide
+    values = strategies.sampled_from(['a', 'b', '${UNDEFINED}', 1])
+    return strategies.fixed_dictionaries(dict((directive, values) for directive in directives)).flatmap(
+        lambda complete: strategies.sets(strategies.sampled_from(sorted(complete)), max_size=2).map(
+            lambda dropped: dict((key, value) for key, value in complete.items() if key not in dropped)))
+
+
+class TestValidation(unittest.TestCase):
+    @given(section(ICINGA_HOST_DIRECTIVES),
+           strategies.lists(section(ICINGA_SERVICE_DIRECTIVES), min_size=1, max_size=4))
+    def test_raises_the_same_error_as_the_separate_checks(self, host, services):
+        yaml_config = {'host': host, 'services': dict(('s%d' % i, service) for i, service in enumerate(services))}
+        expected = first_error_of_separate_checks(*self.generated(yaml_config))
+        try:
+            YamlConfig(yaml_config)
+        except Exception as e:
+            self.assertEquals((type(expected), str(expected)), (type(e), str(e)))
+        else:
+            self.assertIsNone(expected)
+
+    @staticmethod
+    def generated(yaml_config):
+        generated = YamlConfig(yaml_config, report_all_errors=True)
+        return generated.host, generated.services
+
+    def test_reports_all_errors(self):
+        input_yaml = '''
+            host:
+                host_name: host.domain.tld
+            services:
+                s1:
+                   host_name: other.domain.tld
+                   service_description: service 1
+                s2:
+                   host_name: host.domain.tld
+                   service_description: service 1
+                   check_command: ${UNDEFINED}
+        '''
+        yaml_config = YamlConfig(yaml.safe_load(input_yaml), report_all_errors=True)
+        self.assertEquals([MandatoryDirectiveMissingException] * (len(ICINGA_HOST_DIRECTIVES) - 1 +
+                                                                  len(ICINGA_SERVICE_DIRECTIVES) * 2 - 5) +
+                          [HostNamesNotEqualException, ServiceDescriptionNotUniqueException,
+                           ConfigurationContainsUndefinedVariables],
+                          [type(error) for error in yaml_config.errors])
+
+    def test_reports_all_unknown_sections(self):
+        yaml_config = YamlConfig({'unknown1': None, 'unknown2': None}, report_all_errors=True)
+        self.assertEquals([UnknownSectionException] * 2, [type(error) for error in yaml_config.errors])
+
+    def test_skip_checks_only_reports_undefined_variables(self):
+        yaml_config = YamlConfig({'services': {'s1': {'check_command': '${UNDEFINED}'}}},
+                                 skip_checks=True, report_all_errors=True)
+        self.assertEquals([ConfigurationContainsUndefinedVariables], [type(error) for error in yaml_config.errors])
+
+
 class YamlConfigTest(unittest.TestCase):
     def setUp(self):
         self.test_directory = "testdata"
@@ -254,3 +345,53 @@ class YamlConfigTest(unittest.TestCase):
                    service_description: service 1
         '''
         self.assertRaises(ServiceDescriptionNotUniqueException, self.run_config_gen, input_yaml)
+
+    def test_raises_an_error_if_variables_refer_to_each_other_in_a_circle(self):
+        input_yaml = '''
+            variables:
+                HOST_NAME: ${FQDN}
+                FQDN: ${HOST_NAME}.domain.tld
+            host:
+                host_name: ${HOST_NAME}
+            services:
+                s1:
+                   service_description: service 1
+        '''
+        self.assertRaises(CircularVariableDefinitionException, self.run_config_gen, input_yaml)
+
+    def test_merging_a_service_does_not_change_the_defaults_of_other_services(self):
+        input_yaml = '''
+            variables:
+                INTERVAL: 3
+            defaults:
+                host_name: host.domain.tld
+                check_period: 2
+                max_check_attempts: 5
+                notification_interval: 3
+                notification_period: 4
+                check_command: any_check_command
+                check_interval: ${INTERVAL}
+                contacts:
+                    - contact1
+            host:
+                contacts:
+                    - contact2
+            services:
+                s1:
+                   service_description: service 1
+                   contacts:
+                       - contact3
+                s2:
+                   service_description: service 2
+                   check_interval: ${INTERVAL}0
+        '''
+        yaml_parsed = yaml.load(input_yaml)
+        yaml_config = YamlConfig(yaml_parsed)
+
+        self.assertEquals(['contact1', 'contact2'], yaml_config.host['contacts'])
+        self.assertEquals(['contact1', 'contact3'], yaml_config.services[0]['contacts'])
+        self.assertEquals(['contact1'], yaml_config.services[1]['contacts'])
+        self.assertEquals('3', yaml_config.services[0]['check_interval'])
+        self.assertEquals('30', yaml_config.services[1]['check_interval'])
+        self.assertEquals(['contact1'], yaml_parsed['defaults']['contacts'])
+        self.assertEquals('${INTERVAL}', yaml_parsed['defaults']['check_interval'])
@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+import json
+import unittest
+
+from mock import patch
+
+from monitoring_config_generator.exceptions import MonitoringConfigGeneratorException
+from monitoring_config_generator.yaml_tools import decoders
+from monitoring_config_generator.yaml_tools.decoders import accept_header, decode
+from monitoring_config_generator.yaml_tools.loader import safe_load
+
+
+DOCUMENT = {'defaults': {'check_period': '24x7', 'max_check_attempts': 3, 'contacts': ['admins', 'ops']},
+            'host': {'host_name': 'host01', 'alias': u'h\xf6st', 'active': True, 'ratio': 0.5, 'nothing': None},
+            'services': {'s1': {'check_command': 'check_http!${NAME}'}}}
+
+
+class TestDecode(unittest.TestCase):
+    def assert_same_as_yaml(self, decoded):
+        self.assertEquals(DOCUMENT, decoded)
+        expected = safe_load(json.dumps(DOCUMENT))
+        self.assertEquals(expected, decoded)
+        # the configuration is rendered with str(), so the string types have to match yaml's as well
+        self.assertIs(type(expected['host']['host_name']), type(decoded['host']['host_name']))
+        self.assertIs(type(expected['host']['alias']), type(decoded['host']['alias']))
+        self.assertIs(str, type(decoded['defaults'].keys()[0]))
+
+    def test_json(self):
+        self.assert_same_as_yaml(decode(json.dumps(DOCUMENT), 'application/json; charset=utf-8'))
+
+    def test_json_suffix(self):
+        self.assert_same_as_yaml(decode(json.dumps(DOCUMENT), 'application/vnd.monitoring+json'))
+
+    def test_yaml_by_default(self):
+        self.assertEquals({'a': [1, 2]}, decode('a: [1, 2]', None))
+        self.assertEquals({'a': [1, 2]}, decode('a: [1, 2]', 'text/plain'))
+        self.assertEquals({'a': [1, 2]}, decode('a: [1, 2]', 'application/x-yaml'))
+
+    @unittest.skipIf(decoders.msgpack_module() is None, 'msgpack is not installed')
+    def test_msgpack(self):
+        packed = decoders.msgpack_module().packb(DOCUMENT, use_bin_type=True)
+        self.assert_same_as_yaml(decode(packed, 'application/x-msgpack'))
+
+    @patch.object(decoders, 'msgpack_module', return_value=None)
+    def test_msgpack_without_msgpack_module(self, _):
+        self.assertRaises(MonitoringConfigGeneratorException, decode, '\x80', 'application/msgpack')
+
+    def test_accept_header_prefers_json_over_yaml(self):
+        header = accept_header()
+        self.assertTrue(header.startswith('application/json'))
+        self.assertIn('application/x-yaml;q=0.5', header)
+
+    @patch.object(decoders, 'msgpack_module', return_value=None)
+    def test_accept_header_without_msgpack_module(self, _):
+        self.assertNotIn('msgpack', accept_header())
@@ -0,0 +1,168 @@
+from multiprocessing.pool import ThreadPool
+import os
+import threading
+import time
+import unittest2
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from SocketServer import ThreadingMixIn
+
+os.environ['MONITORING_CONFIG_GENERATOR_CONFIG'] = "testdata/testconfig.yaml"
+from monitoring_config_generator.yaml_tools.fetcher import HttpFetcher
+from monitoring_config_generator.yaml_tools.readers import read_config_from_host
+from monitoring_config_generator.exceptions import MonitoringConfigGeneratorException, HostUnreachableException, \
+    NotModifiedException
+
+
+MONITORING_YAML = 'host:\n    host_name: testhost\n'
+
+
+class StandInServer(ThreadingMixIn, HTTPServer):
+    """Local stand-in for yaml-server, answers according to the path of the request"""
+    daemon_threads = True
+
+    def __init__(self):
+        HTTPServer.__init__(self, ('127.0.0.1', 0), StandInHandler)
+        self.lock = threading.Lock()
+        self.client_ports = set()
+        self.requests = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.failures_left = 0
+
+    @property
+    def base_url(self):
+        return 'http://127.0.0.1:%d' % self.server_address[1]
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def send_body(self, status, body):
+        self.send_response(status)
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('ETag', 'etag-1')
+        self.send_header('Last-Modified', 'Thu, 01 Jan 1970 01:00:00 GMT')
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.client_ports.add(self.client_address[1])
+            server.requests += 1
+            server.in_flight += 1
+            server.max_in_flight = max(server.max_in_flight, server.in_flight)
+        try:
+            if self.headers.get('If-None-Match') == 'etag-1':
+                self.send_body(304, '')
+            elif self.path == '/slow':
+                time.sleep(0.5)
+                self.send_body(200, MONITORING_YAML)
+            elif self.path == '/busy':
+                time.sleep(0.1)
+                self.send_body(200, MONITORING_YAML)
+            elif self.path == '/flaky':
+                with server.lock:
+                    fail = server.failures_left > 0
+                    server.failures_left -= 1
+                self.send_body(503 if fail else 200, MONITORING_YAML)
+            elif self.path == '/missing':
+                self.send_body(404, 'not found')
+            else:
+                self.send_body(200, MONITORING_YAML)
+        finally:
+            with server.lock:
+                server.in_flight -= 1
+
+
+def fetch_many(fetcher, urls):
+    """(url, result) for every url, fetched concurrently. result is what read_config_from_host
+    returned or the exception it raised"""
+    def fetch(url):
+        try:
+            return url, read_config_from_host(url, fetcher=fetcher)
+        except Exception as e:
+            return url, e
+
+    pool = ThreadPool(len(urls))
+    try:
+        return pool.map(fetch, urls, chunksize=1)
+    finally:
+        pool.close()
+        pool.join()
+
+
+class TestHttpFetcher(unittest2.TestCase):
+    def setUp(self):
+        self.server = StandInServer()
+        self.server_thread = threading.Thread(target=self.server.serve_forever, args=(0.05,))
+        self.server_thread.daemon = True
+        self.server_thread.start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def fetcher(self, **kwargs):
+        settings = dict(connect_timeout=1, read_timeout=1, retries=0, backoff_factor=0)
+        settings.update(kwargs)
+        fetcher = HttpFetcher(**settings)
+        self.addCleanup(fetcher.close)
+        return fetcher
+
+    def test_fetches_and_parses_yaml(self):
+        results = fetch_many(self.fetcher(), [self.server.base_url + '/monitoring'])
+        url, (yaml_config, header) = results[0]
+        self.assertEquals(self.server.base_url + '/monitoring', url)
+        self.assertEquals({'host': {'host_name': 'testhost'}}, yaml_config)
+        self.assertEquals('etag-1', header.etag)
+
+    def test_reuses_connections(self):
+        fetcher = self.fetcher(max_connections=1)
+        fetch_many(fetcher, [self.server.base_url + '/monitoring'] * 5)
+        self.assertEquals(5, self.server.requests)
+        self.assertEquals(1, len(self.server.client_ports))
+
+    def test_limits_concurrent_requests_per_host(self):
+        fetcher = self.fetcher(max_connections=8, max_connections_per_host=2)
+        results = fetch_many(fetcher, [self.server.base_url + '/busy'] * 6)
+        self.assertEquals(6, len([result for url, result in results if isinstance(result, tuple)]))
+        self.assertEquals(2, self.server.max_in_flight)
+
+    def test_read_timeout_raises_host_unreachable(self):
+        fetcher = self.fetcher(read_timeout=0.1)
+        url, result = fetch_many(fetcher, [self.server.base_url + '/slow'])[0]
+        self.assertIsInstance(result, HostUnreachableException)
+
+    def test_refused_connection_raises_host_unreachable(self):
+        port = self.server.server_address[1]
+        self.server.shutdown()
+        self.server.server_close()
+        url, result = fetch_many(self.fetcher(), ['http://127.0.0.1:%d/monitoring' % port])[0]
+        self.assertIsInstance(result, HostUnreachableException)
+
+    def test_retries_server_errors(self):
+        self.server.failures_left = 2
+        url, result = fetch_many(self.fetcher(retries=2), [self.server.base_url + '/flaky'])[0]
+        self.assertIsInstance(result, tuple)
+        self.assertEquals(3, self.server.requests)
+
+    def test_gives_up_after_retries(self):
+        self.server.failures_left = 5
+        url, result = fetch_many(self.fetcher(retries=1), [self.server.base_url + '/flaky'])[0]
+        self.assertIsInstance(result, MonitoringConfigGeneratorException)
+        self.assertEquals(2, self.server.requests)
+
+    def test_not_found_raises_exception(self):
+        url, result = fetch_many(self.fetcher(), [self.server.base_url + '/missing'])[0]
+        self.assertIsInstance(result, MonitoringConfigGeneratorException)
+        self.assertNotIsInstance(result, HostUnreachableException)
+
+    def test_unchanged_config_is_not_downloaded_again(self):
+        fetcher = self.fetcher()
+        url = self.server.base_url + '/monitoring'
+        yaml_config, header = fetch_many(fetcher, [url])[0][1]
+        self.assertRaises(NotModifiedException, read_config_from_host, url, fetcher, header)
@@ -0,0 +1,54 @@
+import unittest
+
+import yaml
+
+from monitoring_config_generator.yaml_tools import loader
+from monitoring_config_generator.yaml_tools.loader import safe_load
+
+
+DOCUMENT = '''
+defaults:
+  check_period: 24x7
+  max_check_attempts: 3
+  contacts: [admins, ops]
+variables:
+  NAME: host01
+  NUMBER: '05'
+services:
+  s1:
+    check_command: check_http!${NAME}
+    enabled: yes
+    ratio: 0.5
+    nothing: ~
+'''
+
+
+class TestSafeLoad(unittest.TestCase):
+    def test_same_result_as_the_pure_python_loader(self):
+        self.assertEquals(yaml.load(DOCUMENT, Loader=yaml.SafeLoader), safe_load(DOCUMENT))
+
+    def test_refuses_python_objects(self):
+        self.assertRaises(yaml.YAMLError, safe_load, '!!python/object/apply:os.getcwd []')
+
+    def test_reads_files(self):
+        with open('testdata/testconfig.yaml') as config_file:
+            self.assertIn('TARGET_DIR', safe_load(config_file))
+
+    def test_uses_the_c_loader_if_available(self):
+        if getattr(yaml, '__with_libyaml__', False):
+            self.assertIs(yaml.CSafeLoader, loader.default_loader())
+        else:
+            self.assertIs(yaml.SafeLoader, loader.default_loader())
+
+    def test_falls_back_to_the_pure_python_loader(self):
+        c_safe_loader = getattr(yaml, 'CSafeLoader', None)
+        if c_safe_loader is not None:
+            del yaml.CSafeLoader
+        try:
+            loader._safe_loader = None
+            self.assertIs(yaml.SafeLoader, loader.default_loader())
+            self.assertEquals({'a': [1, 2]}, loader.safe_load('a: [1, 2]'))
+        finally:
+            if c_safe_loader is not None:
+                yaml.CSafeLoader = c_safe_loader
+            loader._safe_loader = None
@@ -0,0 +1,194 @@
+import copy
+import os
+import shutil
+import tempfile
+import unittest
+
+import yaml
+from hypothesis import given, strategies
+from mock import patch
+
+from monitoring_config_generator.yaml_tools import merger
+from monitoring_config_generator.yaml_tools.merger import dict_merge, merged, merge_yaml_files, FragmentCache
+
+
+def dict_merge_with_deepcopy(a, b):
+    """the implementation dict_merge had before, as reference"""
+    for key in b:
+        if key in a:
+            if isinstance(a[key], dict) and isinstance(b[key], dict):
+                dict_merge_with_deepcopy(a[key], b[key])
+            elif isinstance(a[key], list) and isinstance(b[key], list):
+                a[key].extend(b[key])
+            else:
+                a[key] = copy.deepcopy(b[key])
+        else:
+            a[key] = copy.deepcopy(b[key])
+
+
+# few keys, so the generated documents overlap a lot
+keys = strategies.sampled_from(['host', 'services', 'defaults', 'contacts', 'a', 'b'])
+scalars = strategies.none() | strategies.booleans() | strategies.integers() | strategies.text(max_size=5)
+values = strategies.recursive(scalars,
+                              lambda children: (strategies.lists(children, max_size=3) |
+                                                strategies.dictionaries(keys, children, max_size=3)),
+                              max_leaves=10)
+documents = strategies.dictionaries(keys, values, max_size=4)
+
+
+class TestDictMerge(unittest.TestCase):
+    @given(documents, documents)
+    def test_same_result_as_merge_with_deepcopy(self, a, b):
+        expected = copy.deepcopy(a)
+        dict_merge_with_deepcopy(expected, copy.deepcopy(b))
+
+        dict_merge(a, b)
+
+        self.assertEquals(expected, a)
+
+    @given(documents, documents, documents)
+    def test_same_result_as_merge_with_deepcopy_for_several_merges(self, a, b, c):
+        expected = {}
+        for document in a, b, c:
+            dict_merge_with_deepcopy(expected, copy.deepcopy(document))
+
+        result = {}
+        for document in a, b, c:
+            dict_merge(result, document)
+
+        self.assertEquals(expected, result)
+
+    @given(documents, documents, documents)
+    def test_does_not_change_merged_documents(self, a, b, c):
+        originals = copy.deepcopy((a, b, c))
+
+        result = {}
+        for document in a, b, c:
+            dict_merge(result, document)
+
+        self.assertEquals(originals, (a, b, c))
+
+    @given(documents, documents)
+    def test_merged_does_not_change_its_arguments(self, a, b):
+        originals = copy.deepcopy((a, b))
+        merged(a, b)
+        self.assertEquals(originals, (a, b))
+
+    def test_merges_dicts_extends_lists_and_replaces_scalars(self):
+        a = {'host': {'address': 'a', 'contacts': ['c1']}, 'check_interval': 3}
+        dict_merge(a, {'host': {'contacts': ['c2'], 'port': 80}, 'check_interval': 5})
+        self.assertEquals({'host': {'address': 'a', 'contacts': ['c1', 'c2'], 'port': 80}, 'check_interval': 5}, a)
+
+    def test_shares_values_that_are_not_merged(self):
+        services = {'s1': {'check_command': 'c'}}
+        a = {'defaults': {'contacts': ['c1']}}
+        dict_merge(a, {'services': services})
+        self.assertIs(services, a['services'])
+
+
+class TestFragmentCache(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'fragment.yaml')
+        self.write('a: 1\n')
+        self.cache = FragmentCache()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write(self, content):
+        with open(self.path, 'w') as fragment:
+            fragment.write(content)
+
+    def test_parses_an_unchanged_file_once(self):
+        with patch('monitoring_config_generator.yaml_tools.merger.safe_load',
+                   side_effect=yaml.safe_load) as safe_load_mock:
+            first = self.cache.load(self.path)
+            second = self.cache.load(self.path)
+        self.assertEquals({'a': 1}, first)
+        self.assertIs(first, second)
+        self.assertEquals(1, safe_load_mock.call_count)
+
+    def test_parses_a_changed_file_again(self):
+        self.cache.load(self.path)
+        self.write('a: 12\n')
+        self.assertEquals({'a': 12}, self.cache.load(self.path))
+
+    def test_parses_a_replaced_file_again(self):
+        self.cache.load(self.path)
+        stat = os.stat(self.path)
+        replacement = os.path.join(self.directory, 'replacement.yaml')
+        with open(replacement, 'w') as fragment:
+            fragment.write('a: 2\n')
+        # same size and mtime, only the inode tells the files apart
+        os.utime(replacement, (stat.st_atime, stat.st_mtime))
+        os.rename(replacement, self.path)
+        self.assertEquals({'a': 2}, self.cache.load(self.path))
+
+    def test_hosts_sharing_a_fragment_by_link_parse_it_once(self):
+        fragment_paths = [self.path]
+        for number in range(3):
+            host_directory = os.path.join(self.directory, 'host%d' % number)
+            os.mkdir(host_directory)
+            fragment_paths.append(os.path.join(host_directory, 'defaults.yaml'))
+            if number % 2:
+                os.link(self.path, fragment_paths[-1])
+            else:
+                os.symlink(self.path, fragment_paths[-1])
+
+        with patch('monitoring_config_generator.yaml_tools.merger.safe_load',
+                   side_effect=yaml.safe_load) as safe_load_mock:
+            fragments = [self.cache.load(path) for path in fragment_paths]
+
+        self.assertEquals(1, safe_load_mock.call_count)
+        self.assertTrue(all(fragment is fragments[0] for fragment in fragments))
+
+
+class TestMergeYamlFiles(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        for i in range(10):
+            with open(os.path.join(self.directory, '%02d.yaml' % i), 'w') as fragment:
+                fragment.write('value: %d\nservices:\n  s%d: {nr: %d}\nlist: [%d]\n' % (i, i, i, i))
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def expected(self):
+        return {'value': 9,
+                'services': dict(('s%d' % i, {'nr': i}) for i in range(10)),
+                'list': range(10)}
+
+    def test_merges_fragments_in_sorted_order(self):
+        self.assertEquals(self.expected(), merge_yaml_files(self.directory))
+
+    @patch.dict('monitoring_config_generator.yaml_tools.merger.CONFIG', {'YAML_PARSE_WORKERS': 1})
+    def test_merges_fragments_in_sorted_order_without_parallel_parsing(self):
+        self.assertEquals(self.expected(), merge_yaml_files(self.directory))
+
+    def test_merging_does_not_change_cached_fragments(self):
+        merge_yaml_files(self.directory)
+        merge_yaml_files(self.directory)
+        self.assertEquals(self.expected(), merge_yaml_files(self.directory))
+
+    def test_forked_process_gets_its_own_parse_pool(self):
+        pool = merger._get_parse_pool()
+        self.assertIs(pool, merger._get_parse_pool())
+        with patch('monitoring_config_generator.yaml_tools.merger.os.getpid', return_value=-1):
+            forked_pool = merger._get_parse_pool()
+            self.assertIsNot(pool, forked_pool)
+        # unlike in a forked process, the threads of both pools are running here
+        for started_pool in pool, forked_pool:
+            started_pool.close()
+            started_pool.join()
+        merger._parse_pool = None
+
+    def test_parse_pool_is_closed_at_exit(self):
+        pool = merger._get_parse_pool()
+        merger._close_parse_pool()
+        self.assertIsNone(merger._parse_pool)
+        self.assertFalse(any(worker.is_alive() for worker in pool._pool))
+
+    def test_single_file(self):
+        self.assertEquals({'value': 3, 'services': {'s3': {'nr': 3}}, 'list': [3]},
+                          merge_yaml_files(os.path.join(self.directory, '03.yaml')))
@@ -12,8 +12,10 @@ os.environ['MONITORING_CONFIG_GENERATOR_CONFIG'] = "testdata/testconfig.yaml"
 from monitoring_config_generator.yaml_tools.readers import (read_config,
                                                             read_config_from_file,
                                                             read_config_from_host,
-                                                            Header)
-from monitoring_config_generator.exceptions import MonitoringConfigGeneratorException, HostUnreachableException
+                                                            Header,
+                                                            parse_http_date)
+from monitoring_config_generator.exceptions import MonitoringConfigGeneratorException, HostUnreachableException, \
+    NotModifiedException
 
 
 class TestHeader(unittest2.TestCase):
@@ -69,6 +71,33 @@ class TestHeader(unittest2.TestCase):
         your_header = Header(etag=None, mtime=1)
         self.assertFalse(my_header.is_newer_than(your_header))
 
+    def test_server_header_is_newer_than_a_pushed_one_with_a_later_mtime(self):
+        server_header = Header(etag='"a"', mtime=1)
+        pushed_header = Header(etag='"push-0123"', mtime=2)
+        self.assertTrue(pushed_header.is_pushed)
+        self.assertFalse(server_header.is_pushed)
+        self.assertTrue(server_header.is_newer_than(pushed_header))
+
+
+class TestConditionalHeaders(unittest2.TestCase):
+    def test_empty_header_gives_no_conditional_headers(self):
+        self.assertEquals({}, Header().conditional_headers())
+
+    def test_pushed_header_gives_no_conditional_headers(self):
+        self.assertEquals({}, Header(etag='"push-0123"', mtime=2).conditional_headers())
+
+    def test_etag_is_sent_as_if_none_match(self):
+        self.assertEquals({'If-None-Match': 'a'}, Header(etag='a').conditional_headers())
+
+    def test_mtime_is_sent_as_if_modified_since_in_gmt(self):
+        self.assertEquals({'If-Modified-Since': 'Thu, 01 Jan 1970 02:00:00 GMT'},
+                          Header(mtime=7200).conditional_headers())
+
+    def test_if_modified_since_is_the_last_modified_it_was_received_as(self):
+        last_modified = 'Tue, 13 Oct 2026 08:30:15 GMT'
+        self.assertEquals({'If-Modified-Since': last_modified},
+                          Header(mtime=parse_http_date(last_modified)).conditional_headers())
+
 
 class TestReadEtag(unittest2.TestCase):
     def test_reads_etag_from_file(self):
@@ -136,7 +165,8 @@ class TestConfigReaders(unittest2.TestCase):
         merged_yaml, header = read_config_from_host(ANY_PATH)
         self.assertEquals({'yaml': None}, merged_yaml)
         self.assertEquals('deadbeefbeebaadfoodbabe', header.etag)
-        self.assertEquals(0, header.mtime)
+        # Last-Modified is GMT, whatever the local time zone is
+        self.assertEquals(3600, header.mtime)
 
     @patch('requests.get')
     def test_read_config_from_host_without_mtime(self, get_mock):
@@ -189,4 +219,34 @@ class TestConfigReaders(unittest2.TestCase):
     def test_read_config_from_host_raises_exception_on_any_other_requests_error(self, get_mock):
         get_mock.side_effect = RequestException
         with self.assertRaises(MonitoringConfigGeneratorException):
-            read_config_from_host(ANY_PATH)
\ No newline at end of file
+            read_config_from_host(ANY_PATH)
+
+    @patch('requests.get')
+    def test_read_config_from_host_sends_conditional_headers(self, get_mock):
+        response_mock = Mock()
+        response_mock.status_code = 200
+        response_mock.content = 'yaml:'
+        response_mock.headers = {'etag': 'deadbeefbeebaadfoodbabe'}
+        get_mock.return_value = response_mock
+        read_config_from_host(ANY_PATH, header=Header(etag='deadbeefbeebaadfoodbabe'))
+        self.assertEquals('deadbeefbeebaadfoodbabe', get_mock.call_args[1]['headers']['If-None-Match'])
+        self.assertNotIn('If-Modified-Since', get_mock.call_args[1]['headers'])
+
+    @patch('requests.get')
+    def test_read_config_from_host_prefers_json_and_decodes_by_content_type(self, get_mock):
+        response_mock = Mock()
+        response_mock.status_code = 200
+        response_mock.content = '{"host": {"host_name": "foo"}}'
+        response_mock.headers = {'etag': 'deadbeefbeebaadfoodbabe', 'content-type': 'application/json; charset=utf-8'}
+        get_mock.return_value = response_mock
+        yaml_config, _ = read_config_from_host(ANY_PATH)
+        self.assertEquals({'host': {'host_name': 'foo'}}, yaml_config)
+        self.assertTrue(get_mock.call_args[1]['headers']['Accept'].startswith('application/json'))
+
+    @patch('requests.get')
+    def test_read_config_from_host_raises_not_modified_exception_on_304(self, get_mock):
+        response_mock = Mock()
+        response_mock.status_code = 304
+        get_mock.return_value = response_mock
+        with self.assertRaises(NotModifiedException):
+            read_config_from_host(ANY_PATH, header=Header(etag='deadbeefbeebaadfoodbabe'))
@@ -0,0 +1,237 @@
+import os
+import unittest
+
+import yaml
+from mock import patch
+
+os.environ['MONITORING_CONFIG_GENERATOR_CONFIG'] = "testdata/testconfig.yaml"
+from monitoring_config_generator.exceptions import MandatoryDirectiveMissingException
+from monitoring_config_generator.MonitoringConfigGenerator import YamlToIcinga
+from monitoring_config_generator.yaml_tools.config import YamlConfig
+from monitoring_config_generator.yaml_tools.readers import Header
+from monitoring_config_generator.yaml_tools.service_cache import ServiceCache, ServiceCaches
+
+
+HOST_YAML = '''
+defaults:
+    check_period: 24x7
+    max_check_attempts: 3
+    notification_interval: 120
+    notification_period: 24x7
+variables:
+    HOST: host.domain.tld
+    PORT: '8080'
+    URL: http://${HOST}:${PORT}/
+host:
+    host_name: ${HOST}
+services:
+    s1:
+        host_name: ${HOST}
+        service_description: s1
+        check_command: check_http!${URL}
+    s2:
+        host_name: ${HOST}
+        service_description: s2
+        check_command: check_disk
+        check_interval: 1
+    s3:
+        host_name: ${HOST}
+        service_description: s3
+        check_command: check_load
+'''
+
+
+class TestYamlConfigWithServiceCache(unittest.TestCase):
+    def setUp(self):
+        self.cache = ServiceCache()
+
+    def generate(self, change=None):
+        yaml_config = yaml.safe_load(HOST_YAML)
+        if change is not None:
+            change(yaml_config)
+        return YamlConfig(yaml_config, service_cache=self.cache)
+
+    @staticmethod
+    def generated_ids(config):
+        return [service['_service_id'] for service in config.generated_services]
+
+    def test_same_services_as_without_cache(self):
+        self.generate()
+        self.assertEquals(YamlConfig(yaml.safe_load(HOST_YAML)).services, self.generate().services)
+
+    def test_reuses_unchanged_services(self):
+        first = self.generate()
+        second = self.generate()
+        self.assertEquals([], second.generated_services)
+        for first_service, second_service in zip(first.services, second.services):
+            self.assertIs(first_service, second_service)
+
+    def test_generates_changed_service_again(self):
+        self.generate()
+
+        def change(config):
+            config['services']['s3']['check_command'] = 'check_users'
+        config = self.generate(change)
+
+        self.assertEquals(['s3'], self.generated_ids(config))
+        self.assertEquals('check_users', config.services[2]['check_command'])
+
+    def test_tells_apart_values_that_compare_equal(self):
+        self.generate()
+
+        def change(config):
+            config['services']['s2']['check_interval'] = True
+        config = self.generate(change)
+
+        self.assertEquals(['s2'], self.generated_ids(config))
+        self.assertIs(True, config.services[1]['check_interval'])
+
+    def test_generates_services_that_refer_to_a_changed_variable_again(self):
+        self.generate()
+
+        def change(config):
+            # URL refers to PORT, s1 refers to URL
+            config['variables']['PORT'] = '8081'
+        config = self.generate(change)
+
+        self.assertEquals(['s1'], self.generated_ids(config))
+        self.assertEquals('check_http!http://host.domain.tld:8081/', config.services[0]['check_command'])
+
+    def test_generates_all_services_again_if_the_defaults_changed(self):
+        self.generate()
+
+        def change(config):
+            config['defaults']['max_check_attempts'] = 5
+        config = self.generate(change)
+
+        self.assertEquals(['s1', 's2', 's3'], self.generated_ids(config))
+
+    def test_generates_all_services_again_if_a_default_changed_to_an_equal_value(self):
+        def defaults_to(value):
+            def change(config):
+                config['defaults']['notifications_enabled'] = value
+            return change
+        self.generate(defaults_to(1))
+
+        config = self.generate(defaults_to(True))
+
+        self.assertEquals(['s1', 's2', 's3'], self.generated_ids(config))
+        self.assertEquals([True] * 3, [service['notifications_enabled'] for service in config.services])
+
+    def test_forgets_removed_services(self):
+        self.generate()
+
+        def change(config):
+            del config['services']['s2']
+        self.generate(change)
+
+        self.assertEquals(['s1', 's3'], sorted(self.cache.services))
+
+    def test_keeps_the_previous_services_if_the_checks_fail(self):
+        first = self.generate()
+
+        def change(config):
+            del config['services']['s1']['check_command']
+        self.assertRaises(MandatoryDirectiveMissingException, self.generate, change)
+
+        self.assertEquals([service for service in first.services],
+                          [self.cache.services[service_id].definition for service_id in ['s1', 's2', 's3']])
+
+    def test_services_generated_without_checks_are_checked_before_they_are_used_with_checks(self):
+        def change(config):
+            del config['services']['s2']['check_command']
+        yaml_config = yaml.safe_load(HOST_YAML)
+        change(yaml_config)
+        YamlConfig(yaml_config, skip_checks=True, service_cache=self.cache)
+        self.assertEquals([], YamlConfig(yaml_config, skip_checks=True, service_cache=self.cache).generated_services)
+
+        self.assertRaises(MandatoryDirectiveMissingException, self.generate, change)
+
+    def test_checked_services_are_used_without_checks(self):
+        self.generate()
+        config = YamlConfig(yaml.safe_load(HOST_YAML), skip_checks=True, service_cache=self.cache)
+        self.assertEquals([], config.generated_services)
+
+    def test_checks_a_service_again_once_it_changed(self):
+        self.generate()
+
+        def change(config):
+            del config['services']['s2']['check_command']
+        self.assertRaises(MandatoryDirectiveMissingException, self.generate, change)
+        self.assertRaises(MandatoryDirectiveMissingException, self.generate, change)
+
+
+class TestYamlToIcingaWithServiceCache(unittest.TestCase):
+    def setUp(self):
+        self.cache = ServiceCache()
+
+    def render(self, yaml_config):
+        return "".join(YamlToIcinga(yaml_config, Header(etag='abc', mtime=1), self.cache).sections())
+
+    def test_renders_only_changed_services(self):
+        self.render(YamlConfig(yaml.safe_load(HOST_YAML), service_cache=self.cache))
+        changed = yaml.safe_load(HOST_YAML)
+        changed['services']['s2']['check_command'] = 'check_swap'
+        yaml_config = YamlConfig(changed, service_cache=self.cache)
+
+        with patch.object(YamlToIcinga, 'render_section', autospec=True,
+                          side_effect=YamlToIcinga.render_section.__func__) as render_section_mock:
+            output = self.render(yaml_config)
+
+        self.assertEquals(['host', 'service'], [call[0][1] for call in render_section_mock.call_args_list])
+        self.assertEquals("".join(YamlToIcinga(YamlConfig(changed), Header(etag='abc', mtime=1)).sections()), output)
+
+    def test_renders_again_if_the_indent_changed(self):
+        yaml_config = YamlConfig(yaml.safe_load(HOST_YAML), service_cache=self.cache)
+        self.render(yaml_config)
+        with patch.dict('monitoring_config_generator.MonitoringConfigGenerator.CONFIG', {'INDENT': '  '}):
+            output = self.render(yaml_config)
+        self.assertIn('\n  check_command', output)
+
+
+class TestServiceCaches(unittest.TestCase):
+    def setUp(self):
+        self.caches = ServiceCaches()
+
+    @patch.dict('monitoring_config_generator.yaml_tools.service_cache.CONFIG', {'SERVICE_CACHE_HOSTS': None})
+    def test_keeps_the_caches_of_the_most_recent_sources(self):
+        self.caches.enable(2)
+        for source in 'a', 'b', 'a', 'c':
+            with self.caches.cache_for(source) as cache:
+                cache.defaults = source
+        with self.caches.cache_for('a') as cache:
+            self.assertEquals('a', cache.defaults)
+        with self.caches.cache_for('b') as cache:
+            self.assertIsNone(cache.defaults)
+
+    @patch.dict('monitoring_config_generator.yaml_tools.service_cache.CONFIG', {'SERVICE_CACHE_HOSTS': None})
+    def test_hands_out_a_cache_once(self):
+        self.caches.enable(2)
+        with self.caches.cache_for('a') as first:
+            with self.caches.cache_for('a') as second:
+                self.assertIsNot(first, second)
+
+    def test_off_unless_enabled(self):
+        with self.caches.cache_for('a') as cache:
+            self.assertIsNone(cache)
+
+    @patch.dict('monitoring_config_generator.yaml_tools.service_cache.CONFIG', {'SERVICE_CACHE_HOSTS': 0})
+    def test_disabled_by_the_settings(self):
+        self.caches.enable(100)
+        with self.caches.cache_for('a') as cache:
+            self.assertIsNone(cache)
+
+    @patch.dict('monitoring_config_generator.yaml_tools.service_cache.CONFIG', {'SERVICE_CACHE_HOSTS': 1})
+    def test_number_of_hosts_from_the_settings(self):
+        self.caches.enable(100)
+        self.assertEquals(1, self.caches.max_hosts)
+
+    @patch.dict('monitoring_config_generator.yaml_tools.service_cache.CONFIG', {'SERVICE_CACHE_HOSTS': None})
+    def test_shrinking_drops_the_oldest_caches(self):
+        self.caches.enable(3)
+        for source in 'a', 'b', 'c':
+            with self.caches.cache_for(source) as cache:
+                cache.defaults = source
+        self.caches.enable(1)
+        with self.caches.cache_for('b') as cache:
+            self.assertIsNone(cache.defaults)
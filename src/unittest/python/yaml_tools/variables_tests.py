@@ -0,0 +1,95 @@
+import random
+import unittest
+
+import yaml
+
+from monitoring_config_generator.exceptions import CircularVariableDefinitionException
+from monitoring_config_generator.yaml_tools.variables import VariableResolver
+
+
+def apply_variables_fixed_point(variables, section):
+    """the substitution loop YamlConfig.apply_variables used before, as reference"""
+    while True:
+        variables_applied = False
+        for variable_name in variables.keys():
+            variable_syntax = "${%s}" % variable_name
+            variable_value = str(variables[variable_name])
+            for key in sorted(section.keys()):
+                value = section.get(key)
+                if isinstance(value, str) and variable_syntax in value:
+                    section[key] = value.replace(variable_syntax, variable_value)
+                    variables_applied = True
+        if not variables_applied:
+            break
+    return section
+
+
+class TestVariableResolver(unittest.TestCase):
+    def test_expands_variables(self):
+        resolver = VariableResolver({'HOST': 'testhost', 'DOMAIN': 'some.domain'})
+        self.assertEquals('testhost.some.domain', resolver.expand('${HOST}.${DOMAIN}'))
+
+    def test_expands_nested_variables(self):
+        resolver = VariableResolver({'FQDN': '${HOST_NAME}.${DOMAIN}',
+                                     'HOST_NAME': '${LOC}${TYP}${NR}',
+                                     'LOC': 'test', 'TYP': 'host', 'NR': '05', 'DOMAIN': 'other.domain'})
+        self.assertEquals('address testhost05.other.domain', resolver.expand('address ${FQDN}'))
+
+    def test_leaves_undefined_variables(self):
+        resolver = VariableResolver({'HOST': '${UNDEFINED}'})
+        self.assertEquals('${UNDEFINED}-${OTHER}', resolver.expand('${HOST}-${OTHER}'))
+
+    def test_substitutes_values_and_names_as_strings(self):
+        resolver = VariableResolver({'INTERVAL': 3, 5: 'five', 'NOTHING': None})
+        self.assertEquals('3 five None', resolver.expand('${INTERVAL} ${5} ${NOTHING}'))
+
+    def test_no_variables_section(self):
+        self.assertEquals('${A}', VariableResolver(None).expand('${A}'))
+
+    def test_resolves_each_variable_once(self):
+        resolver = VariableResolver({'A': '${B}${B}', 'B': 'b'})
+        resolver.expand('${A}')
+        resolver.variables['B'] = 'changed'
+        self.assertEquals('bb', resolver.expand('${A}'))
+
+    def test_circular_variables_raise_an_error(self):
+        resolver = VariableResolver({'A': 'x${B}', 'B': '${C}', 'C': '${A}'})
+        with self.assertRaises(CircularVariableDefinitionException) as context:
+            resolver.expand('${B}')
+        self.assertIn('B -> C -> A -> B', str(context.exception))
+
+    def test_unreferenced_circular_variables_are_fine(self):
+        resolver = VariableResolver({'A': '${A}', 'B': 'b'})
+        self.assertEquals('b', resolver.expand('${B}'))
+
+    def test_same_result_as_fixed_point_substitution(self):
+        generator = random.Random(4711)
+        for _ in range(200):
+            names = ['V%d' % i for i in range(8)]
+            variables = {}
+            for position, name in enumerate(names):
+                # only refer to later variables, so there are no cycles
+                candidates = names[position + 1:] + ['UNDEFINED']
+                parts = [generator.choice(['x', '.', '${%s}' % generator.choice(candidates)])
+                         for _ in range(generator.randint(0, 3))]
+                variables[name] = ''.join(parts) if parts else generator.randint(0, 9)
+            section = dict(('key%d' % i, '${%s}-${%s}' % (generator.choice(names), generator.choice(names)))
+                           for i in range(5))
+            section['number'] = 5
+
+            resolver = VariableResolver(variables)
+            expanded = dict((key, resolver.expand(value) if isinstance(value, str) else value)
+                            for key, value in section.items())
+
+            self.assertEquals(apply_variables_fixed_point(variables, dict(section)), expanded)
+
+    def test_readme_example(self):
+        variables = yaml.safe_load('''
+            TYP: host
+            LOC: test
+            HOSTNR: '05'
+            HOST_NAME: ${LOC}${TYP}${HOSTNR}
+            FQDN: ${HOST_NAME}.${DOMAIN_NAME}
+            DOMAIN_NAME: other.domain
+        ''')
+        self.assertEquals('testhost05.other.domain', VariableResolver(variables).expand('${FQDN}'))